@@ -0,0 +1,144 @@
+import re
+import datetime
+
+from xlsx_reader import column_index
+
+# 筛选条件：列 运算符 值，如 "日期>=2024-01-01"、"金额>1000"、"状态=已开票"、"备注~退货"
+PREDICATE_RE = re.compile(r'^\s*(.+?)\s*(>=|<=|!=|==|=|>|<|~)\s*(.*?)\s*$')
+OPERATORS = {
+    '=': lambda a, b: a == b,
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+}
+DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d', '%Y/%m/%d %H:%M:%S', '%Y/%m/%d', '%Y%m%d')
+
+
+def parse_column_list(text):
+    """把用户输入的列（如 "A,C" 或 "发票号码, 金额"）拆分为列表，为空时返回 None"""
+    if not text:
+        return None
+    columns = [part.strip() for part in text.replace('，', ',').split(',')]
+    return [column for column in columns if column] or None
+
+
+def parse_filter_list(text):
+    """把用户输入的筛选条件（用分号分隔）拆分为列表，为空时返回 None"""
+    if not text:
+        return None
+    filters = [part.strip() for part in text.replace('；', ';').split(';')]
+    return [item for item in filters if item] or None
+
+
+def header_names(header_rows):
+    """多个第一行中出现过的所有列名"""
+    return {str(value).strip() for header_row in header_rows for value in header_row or [] if value is not None}
+
+
+def resolve_columns(columns, header_row=None, other_names=None):
+    """把列名或列字母（如 "C"）转换为从0开始的列序号；优先按第一行的列名匹配
+
+    other_names 为其他文件第一行中的列名：这些名称（如 "SKU"、"ID"）不在本文件的第一行时不当作列字母，
+    以免本文件缺少这一列时悄悄取到很远处的空列。
+    """
+    header_row = [str(value).strip() if value is not None else '' for value in header_row or []]
+    indexes = []
+    for column in columns:
+        if isinstance(column, int):
+            indexes.append(column)
+        elif column in header_row:
+            indexes.append(header_row.index(column))
+        elif other_names and column in other_names:
+            raise ValueError(f"找不到列: {column}（其他文件的第一行中有这一列）")
+        elif column.isascii() and column.isalpha() and len(column) <= 3:
+            indexes.append(column_index(column))
+        else:
+            raise ValueError(f"找不到列: {column}")
+    return indexes
+
+
+def _parse_date(text):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+class Predicate:
+    """单个筛选条件，比较时按单元格的类型解释条件中的值"""
+
+    def __init__(self, column, operator, text):
+        self.column = column  # 从0开始的列序号
+        self.operator = operator
+        self.text = text
+        # 预先转换好各种类型的比较值，筛选每一行时不再重复解析
+        self.number = _parse_number(text)
+        self.date = _parse_date(text)
+        self.compare = OPERATORS.get(operator)
+
+    def __repr__(self):
+        return f"{self.column}{self.operator}{self.text}"
+
+    def matches(self, value):
+        if value is None:
+            # 空单元格只满足 "列=" 和 "列!=值"，不满足大小比较和包含
+            if self.operator in ('=', '=='):
+                return self.text == ''
+            if self.operator == '!=':
+                return self.text != ''
+            return False
+        if self.operator == '~':
+            return self.text in str(value)
+        if isinstance(value, bool):
+            other = self.text.lower() in ('1', 'true', '是')
+        elif isinstance(value, (int, float)) and self.number is not None:
+            other = self.number
+        elif isinstance(value, datetime.datetime) and self.date is not None:
+            other = self.date
+        elif isinstance(value, datetime.time) and self.date is not None:
+            other = self.date.time()
+        else:
+            value, other = str(value), self.text
+        return self.compare(value, other)
+
+
+class RowFilter:
+    """在读取工作表时筛选行：所有条件都满足的行才会被保留"""
+
+    def __init__(self, predicates):
+        self.predicates = list(predicates)
+        self.columns = sorted({predicate.column for predicate in self.predicates})
+
+    def __repr__(self):
+        return ';'.join(repr(predicate) for predicate in self.predicates)
+
+    @classmethod
+    def parse(cls, filters, header_row=None, other_names=None):
+        """解析 "列 运算符 值" 形式的筛选条件，列可以是列名或列字母；other_names 同 resolve_columns"""
+        predicates = []
+        for text in filters:
+            match = PREDICATE_RE.match(text)
+            if not match:
+                raise ValueError(f"无法识别的筛选条件: {text}")
+            column, operator, value = match.groups()
+            predicates.append(Predicate(resolve_columns([column], header_row, other_names)[0], operator, value))
+        return cls(predicates)
+
+    def matches(self, values):
+        """values 为 {列序号: 值}"""
+        for predicate in self.predicates:
+            if not predicate.matches(values.get(predicate.column)):
+                return False
+        return True
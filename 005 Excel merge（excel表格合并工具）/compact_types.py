@@ -0,0 +1,190 @@
+import sys
+import pickle
+import datetime
+
+try:
+    import pyarrow as pa
+except ImportError:  # 紧凑类型为可选功能
+    pa = None
+
+from parse_cache import union_array
+
+SAMPLE_ROWS = 10000  # 推断列类型时使用的样本行数
+CATEGORY_RATIO = 0.5  # 样本中不同值的个数不超过非空值的一半时按分类（字典编码）保存
+CATEGORY_MAX_VALUES = 1000  # 分类列在样本中最多的不同值个数
+WIDTH_COLUMN = '_width'  # 记录每行原始列数的列，解码时按原样还原行的长度
+
+MIXED = None  # 混合类型的列，统一按类型联合（dense union）保存
+
+if pa is not None:
+    INT_TYPES = [(pa.int8(), -2 ** 7, 2 ** 7 - 1), (pa.int16(), -2 ** 15, 2 ** 15 - 1),
+                 (pa.int32(), -2 ** 31, 2 ** 31 - 1), (pa.int64(), -2 ** 63, 2 ** 63 - 1)]
+    SIMPLE_TYPES = {
+        bool: pa.bool_(),
+        float: pa.float64(),
+        datetime.datetime: pa.timestamp('us'),
+        datetime.time: pa.time64('us'),
+    }
+    PYTHON_TYPES = {arrow_type: python_type for python_type, arrow_type in SIMPLE_TYPES.items()}
+    CATEGORY_TYPE = pa.dictionary(pa.int32(), pa.string())
+    # 无法用以上类型保存的值（如超出int64的整数）逐个pickle后保存
+    OBJECT_TYPE = pa.large_binary()
+
+
+def compact_types_available():
+    """是否安装了紧凑类型所需的pyarrow"""
+    return pa is not None
+
+
+def python_bytes(rows):
+    """估算一批行数据以Python对象保存时占用的内存（按约100行的样本推算）"""
+    if not rows:
+        return 0
+    step = max(1, len(rows) // 100)
+    sample = rows[::step]
+    size = sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row if value is not None)
+               for row in sample)
+    return int(size * len(rows) / len(sample))
+
+
+def _value_types(values):
+    types = set(map(type, values))
+    types.discard(type(None))
+    return types
+
+
+def _int_type(values, at_least=None):
+    """能容纳这些整数的最小整数类型；超出int64时返回 MIXED"""
+    numbers = [value for value in values if value is not None]
+    low, high = min(numbers), max(numbers)
+    for arrow_type, lowest, highest in INT_TYPES:
+        if at_least is not None and arrow_type.bit_width < at_least.bit_width:
+            continue
+        if lowest <= low and high <= highest:
+            return arrow_type
+    return MIXED
+
+
+def infer_type(values):
+    """按一列的样本值推断紧凑类型：整数取最小位宽，重复较多的文字用分类，其余文字用Arrow字符串"""
+    types = _value_types(values)
+    if not types:
+        return pa.null()
+    if len(types) > 1:
+        return MIXED
+    python_type = types.pop()
+    if python_type is int:
+        return _int_type(values)
+    if python_type is str:
+        texts = [value for value in values if value is not None]
+        distinct = len(set(texts))
+        if distinct <= CATEGORY_MAX_VALUES and distinct <= len(texts) * CATEGORY_RATIO:
+            return CATEGORY_TYPE
+        return pa.string()
+    return SIMPLE_TYPES.get(python_type, MIXED)
+
+
+def widen_type(current, values):
+    """新的一批值放不进当前类型时，返回能同时容纳新旧值的类型"""
+    if current is MIXED or current == OBJECT_TYPE:
+        return current
+    types = _value_types(values)
+    if not types:
+        return current
+    if pa.types.is_null(current):
+        return infer_type(values)
+    if pa.types.is_integer(current):
+        return _int_type(values, at_least=current) if types == {int} else MIXED
+    if pa.types.is_dictionary(current) or pa.types.is_string(current):
+        return current if types == {str} else MIXED
+    return current if types == {PYTHON_TYPES.get(current)} else MIXED
+
+
+class CompactTyper:
+    """把行数据转换为按列存储的紧凑类型（Arrow），并能无损地还原
+
+    根据最先出现的 sample_rows 行推断每列的类型：整数按取值范围选择最小位宽，
+    重复较多的文字（如地区、公司名称）按分类保存，其余文字保存为Arrow字符串，
+    数值和文字混在一起的列按类型联合保存。之后的数据放不进推断的类型时自动放宽该列的类型。
+    还原时每个值的Python类型和每行的列数都与原来相同，因此不影响任何输出格式的结果。
+    """
+
+    def __init__(self, sample_rows=SAMPLE_ROWS):
+        self.sample_rows = sample_rows
+        self.types = None  # 每列当前的类型
+        self.schema = None
+        self.rows = 0
+        self.python_bytes = 0  # 转换前的数据以Python对象保存时的估算大小
+        self.arrow_bytes = 0  # 转换后的大小
+
+    def _infer(self, rows):
+        sample = rows[:self.sample_rows]
+        width = max((len(row) for row in sample), default=0)
+        self.types = [infer_type([row[i] if i < len(row) else None for row in sample]) for i in range(width)]
+
+    def _column(self, i, values):
+        arrow_type = self.types[i]
+        if arrow_type is not MIXED:
+            arrow_type = self.types[i] = widen_type(arrow_type, values)
+        if arrow_type != OBJECT_TYPE:
+            try:
+                if arrow_type is MIXED:
+                    return union_array(values)
+                return pa.array(values, type=arrow_type)
+            except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError, KeyError):
+                self.types[i] = OBJECT_TYPE
+        return pa.array([None if value is None else pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+                         for value in values], type=OBJECT_TYPE)
+
+    def _encode(self, rows):
+        width = max((len(row) for row in rows), default=0)
+        if width > len(self.types):
+            # 出现了样本中没有的列
+            self.types.extend(pa.null() for _ in range(width - len(self.types)))
+        columns = [pa.array([len(row) for row in rows], type=pa.int16())]
+        for i in range(len(self.types)):
+            if i < width:
+                columns.append(self._column(i, [row[i] if i < len(row) else None for row in rows]))
+            elif self.types[i] is MIXED:
+                columns.append(union_array([None] * len(rows)))
+            else:
+                columns.append(pa.nulls(len(rows), type=self.types[i]))
+        batch = pa.record_batch(columns, names=[WIDTH_COLUMN] + [str(i) for i in range(len(self.types))])
+        self.schema = batch.schema
+        return batch
+
+    def encode(self, rows):
+        """把一批行转换为紧凑的 RecordBatch"""
+        if self.types is None:
+            self._infer(rows)
+        batch = self._encode(rows)
+        self.rows += len(rows)
+        self.python_bytes += python_bytes(rows)
+        self.arrow_bytes += batch.nbytes
+        return batch
+
+    @staticmethod
+    def decode(batch):
+        """把 RecordBatch（或 Table）还原为行数据"""
+        widths = batch.column(0).to_pylist()
+        columns = [CompactTyper.decode_column(column) for column in batch.columns[1:]]
+        if not columns:
+            return [[] for _ in widths]
+        return [list(row[:width]) for row, width in zip(zip(*columns), widths)]
+
+    @staticmethod
+    def decode_column(column):
+        """把一列紧凑类型的数据还原为Python值的列表"""
+        values = column.to_pylist()
+        if column.type == OBJECT_TYPE:
+            values = [None if value is None else pickle.loads(value) for value in values]
+        return values
+
+    def unify(self, batches):
+        """列类型放宽后，把之前按旧类型转换的批数据转换为当前类型，使所有批可以拼接"""
+        # 当前类型能容纳之前所有的值，重新转换时不会再放宽
+        return [batch if batch.schema == self.schema else self._encode(self.decode(batch)) for batch in batches]
+
+    def concat(self, batches):
+        """把多批数据拼接为一个表"""
+        return pa.Table.from_batches(self.unify(batches), schema=self.schema)
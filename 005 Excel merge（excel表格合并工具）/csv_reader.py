@@ -0,0 +1,353 @@
+import io
+import os
+import re
+import csv
+import codecs
+import datetime
+from itertools import chain
+
+CSV_EXTENSIONS = ('.csv', '.tsv')
+TAB_EXTENSIONS = ('.tsv',)
+READ_BYTES = 1024 * 1024  # 每次读取并解码的字节数
+SAMPLE_BYTES = 64 * 1024  # 识别编码、分隔符和估算行数时读取的文件开头
+BLOCK_BYTES = 16 * 1024 * 1024  # 大文件切分为这么大的数据块，由多个解析进程并行解析
+# 追加在数据块末尾的一行：解析出的最后一行是它时，说明数据块在引号外结束（不含分隔符、引号和换行）
+BLOCK_END_MARK = '\x1f数据块结束\x1f'
+DELIMITERS = (',', '\t', ';', '|')
+# 开头的样本按UTF-8识别、后面出现无法解码的内容时改用的编码（开头只有ASCII时两种编码的结果相同）
+FALLBACK_ENCODINGS = {'utf-8': 'gb18030'}
+
+# Excel打开CSV时会转换的数字和日期；以0开头的整数（编号）和超过15位的数字（身份证号等）保持文本
+NUMBER_START = frozenset('-.0123456789')
+INT_RE = re.compile(r'-?(?:0|[1-9]\d{0,14})$')
+FLOAT_RE = re.compile(r'-?(?:0|[1-9]\d{0,14})?\.\d+(?:[eE][-+]?\d+)?$')
+DATE_RE = re.compile(r'(\d{4})[-/](\d{1,2})[-/](\d{1,2})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?$')
+
+
+def is_csv_file(file_path):
+    """是否按CSV/TSV读取（按扩展名判断）"""
+    return file_path.lower().endswith(CSV_EXTENSIONS)
+
+
+def detect_encoding(sample):
+    """识别文件编码：带BOM的UTF-8、UTF-8，其余按GBK（GB18030）读取"""
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        # 样本末尾可能截断了一个多字节字符，按增量方式解码
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'gb18030'
+
+
+def detect_delimiter(first_line, file_path):
+    """识别分隔符：.tsv 为制表符，否则取第一行中出现最多的候选分隔符"""
+    if file_path.lower().endswith(TAB_EXTENSIONS):
+        return '\t'
+    counts = [(first_line.count(delimiter), delimiter) for delimiter in DELIMITERS]
+    count, delimiter = max(counts, key=lambda item: item[0])
+    return delimiter if count else ','
+
+
+def convert_value(text):
+    """按Excel打开CSV时的规则转换单元格：数字和日期转换为数值和日期，其余保持文本，空单元格为 None"""
+    if not text:
+        return None
+    if text[0] in NUMBER_START:
+        if INT_RE.match(text):
+            return int(text)
+        if FLOAT_RE.match(text):
+            return float(text)
+        match = DATE_RE.match(text)
+        if match:
+            try:
+                return datetime.datetime(*(int(part) for part in match.groups() if part is not None))
+            except ValueError:
+                pass
+    return text
+
+
+def convert_rows(records):
+    """把 csv.reader 读出的各行文本逐行转换为数据；每行去掉末尾的空单元格"""
+    for values in records:
+        row = [convert_value(value) for value in values]
+        while row and row[-1] is None:
+            row.pop()
+        yield row
+
+
+def parse_rows(lines, delimiter):
+    """解析CSV文本行，逐行产出转换后的数据"""
+    return convert_rows(csv.reader(lines, delimiter=delimiter))
+
+
+def select_rows(rows, columns=None, row_filter=None, first_row=True):
+    """按列选择和筛选各行，并处理空行：去掉末尾空行，保留中间的空行；第一行不参与筛选，筛选时不保留空行
+
+    first_row 为 False 时 rows 不是从文件开头开始的（数据块），其中的第一行也参与筛选。
+    返回末尾没有产出的空行数（生成器的返回值）。
+    """
+    needed = None
+    if columns is not None:
+        needed = set(columns)
+        if row_filter is not None:
+            needed.update(row_filter.columns)
+    selecting = columns is not None or row_filter is not None
+
+    empty_rows = 0  # 尚未产出的空行，后面有数据行时才补齐
+    for row in rows:
+        if selecting:
+            values = {col: value for col, value in enumerate(row)
+                      if value is not None and (needed is None or col in needed)}
+            if not values:
+                empty_rows += 1
+                continue
+            if row_filter is not None and not first_row and not row_filter.matches(values):
+                continue
+            first_row = False
+            if columns is not None:
+                row = [values.get(col) for col in columns]
+                while row and row[-1] is None:
+                    row.pop()
+            if row_filter is not None:
+                empty_rows = 0
+        elif not row:
+            empty_rows += 1
+            continue
+        for _ in range(empty_rows):
+            yield []
+        empty_rows = 0
+        yield row
+    return empty_rows
+
+
+class CsvRowReader:
+    """CSV/TSV的行读取器，接口与 XlsxRowReader 相同，整个文件作为一个以文件名命名的工作表
+
+    文件按块读取、增量解码后逐行解析；
+    自动识别UTF-8（含BOM）和GBK编码以及分隔符，数字和日期按Excel打开CSV时的规则转换。
+    大文件可以用 split_blocks 切分为数据块，各块在不同的解析进程中用 iter_batches(block=...) 解析，
+    再按顺序拼接（见 OrderedParsePool）。
+    """
+
+    def __init__(self, file_path, sheet=0, encoding=None, delimiter=None):
+        self.file_path = file_path
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        self.sheets = [(name, None)]  # [(工作表名称, XML路径)]，与 XlsxRowReader 一致
+        if sheet not in (0, name):
+            raise ValueError(f"找不到工作表: {sheet}")
+        self.sheet_name, self.sheet_path = name, None
+        with open(file_path, 'rb') as f:
+            self.sample = f.read(SAMPLE_BYTES)
+        self.encoding = encoding or detect_encoding(self.sample)
+        self.fallback_encoding = None if encoding else FALLBACK_ENCODINGS.get(self.encoding)
+        first_line = self.sample.split(b'\n', 1)[0].decode(self.encoding, errors='replace')
+        self.delimiter = delimiter or detect_delimiter(first_line, file_path)
+        self.block_trailing_rows = 0  # 解析数据块时，块末尾没有产出的空行数
+        self.block_complete = True  # 解析数据块时，块是否在引号外结束
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        pass
+
+    @property
+    def sheet_names(self):
+        return [name for name, _ in self.sheets]
+
+    def preload(self):
+        """CSV没有需要预先加载的共享字符串和样式"""
+
+    def _decode_error(self, error, offset):
+        return ValueError(f"文件第 {offset + error.start + 1} 字节附近的内容无法按 {self.encoding} 编码读取，"
+                          f"请将文件另存为UTF-8或GBK编码: {self.file_path}")
+
+    def _iter_lines(self, f, offset=0, stop=None):
+        """按块读取并严格解码，逐行产出文本；保留换行符，引号内跨行的单元格由 csv.reader 拼接
+
+        按样本识别为UTF-8、后面出现无法解码的内容时，如果前面读到的都是ASCII，从该块起改用 gb18030 解码；
+        否则报错，不会用替换字符代替无法解码的内容。指定 stop 时只读取到该字节位置（数据块）。
+        """
+        encoding = self.encoding
+        if offset and encoding == 'utf-8-sig':
+            # 只有文件开头有BOM
+            encoding = 'utf-8'
+        decoder = codecs.getincrementaldecoder(encoding)()
+        ascii_only = True  # 已解码的内容都是ASCII，改用其他编码解码的结果相同
+        carry = ''
+        while True:
+            data = f.read(READ_BYTES if stop is None else min(READ_BYTES, stop - offset))
+            try:
+                text = decoder.decode(data, final=not data)
+            except UnicodeDecodeError as e:
+                if not (ascii_only and self.fallback_encoding and data[:e.start].isascii()):
+                    raise self._decode_error(e, offset) from e
+                self.encoding, self.fallback_encoding = self.fallback_encoding, None
+                decoder = codecs.getincrementaldecoder(self.encoding)()
+                try:
+                    text = decoder.decode(data, final=not data)
+                except UnicodeDecodeError as e:
+                    raise self._decode_error(e, offset) from e
+            ascii_only = ascii_only and data.isascii()
+            offset += len(data)
+            text = carry + text
+            if not data:
+                if text:
+                    yield text
+                return
+            end = text.rfind('\n') + 1
+            yield from io.StringIO(text[:end], newline='')
+            carry = text[end:]
+
+    def _iter_parsed_rows(self):
+        """按文件顺序产出所有行（包括空行）"""
+        with open(self.file_path, 'rb') as f:
+            yield from parse_rows(self._iter_lines(f), self.delimiter)
+
+    def _iter_block_rows(self, start, end):
+        """产出数据块 [start, end) 中的所有行，并记录数据块是否在引号外结束"""
+        self.block_complete = False
+        at_file_end = end >= os.path.getsize(self.file_path)
+        with open(self.file_path, 'rb') as f:
+            f.seek(start)
+            lines = self._iter_lines(f, start, end)
+            if at_file_end:
+                # 最后一块之后没有其他数据块，不需要检查
+                self.block_complete = True
+                yield from parse_rows(lines, self.delimiter)
+                return
+            # 在引号内结束时，追加的标记行会并入最后一个单元格
+            records = csv.reader(chain(lines, [BLOCK_END_MARK + '\n']), delimiter=self.delimiter)
+            for row in convert_rows(records):
+                if row == [BLOCK_END_MARK]:
+                    self.block_complete = True
+                    return
+                yield row
+
+    def split_blocks(self, block_bytes=None):
+        """把文件切分为约 block_bytes 字节的数据块 [(起始字节, 结束字节)]，各块可以在不同的进程中解析
+
+        每块在换行处结束，并且该换行之前的引号数为偶数（转义的 "" 成对出现），即不在引号包围的单元格中；
+        GBK和UTF-8的多字节字符中不会出现换行和引号的字节，因此不需要解码就能切分。
+        没有引号包围的单元格中出现引号（如 5"）时切分位置可能不对，由解析数据块时的 block_complete 发现。
+        按样本识别为UTF-8时同时检查第一段非ASCII的内容，需要改用 gb18030 时修改 encoding，使各块按同一编码解码。
+        文件小于两块时返回整个文件一块。
+        """
+        block_bytes = block_bytes or BLOCK_BYTES
+        size = os.path.getsize(self.file_path)
+        if size < 2 * block_bytes:
+            return [(0, size)]
+        blocks = []
+        start = 0
+        offset = 0  # 当前读取的一段在文件中的位置
+        quotes = 0  # 当前位置之前的引号数
+        with open(self.file_path, 'rb') as f:
+            while True:
+                data = f.read(READ_BYTES)
+                if not data:
+                    break
+                if self.fallback_encoding is not None and not data.isascii():
+                    self._resolve_encoding(data)
+                counted = 0
+                search = start + block_bytes - offset
+                while search < len(data):
+                    newline = data.find(b'\n', max(search, 0))
+                    if newline < 0:
+                        break
+                    quotes += data.count(b'"', counted, newline)
+                    counted = newline
+                    if quotes % 2 == 0:
+                        start = offset + newline + 1
+                        blocks.append(start)
+                        search = start + block_bytes - offset
+                    else:
+                        search = newline + 1
+                quotes += data.count(b'"', counted)
+                offset += len(data)
+        if blocks and size - blocks[-1] < block_bytes // 2:
+            # 最后剩下的部分较小时并入前一块
+            blocks.pop()
+        bounds = [0] + blocks + [size]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def _resolve_encoding(self, data):
+        """data 为文件中第一段含非ASCII内容的数据：按UTF-8无法解码、且出错之前都是ASCII时改用 gb18030，
+        与按顺序读取时的结果相同"""
+        try:
+            codecs.getincrementaldecoder(self.encoding)().decode(data, final=False)
+        except UnicodeDecodeError as e:
+            if data[:e.start].isascii():
+                self.encoding = self.fallback_encoding
+        self.fallback_encoding = None
+
+    def iter_rows(self, columns=None, row_filter=None, block=None):
+        """逐行产出数据，行为与 XlsxRowReader.iter_rows 相同：去掉末尾空行，保留中间的空行；
+        指定 columns 或 row_filter 时按列选择和筛选，第一行不参与筛选，筛选时不保留空行
+
+        block 为 split_blocks 切分出的 (起始字节, 结束字节) 时只解析该数据块：第一行只在文件开头的块中不参与筛选；
+        块末尾的空行不产出，个数记录在 block_trailing_rows 中，后面的块还有数据时由调用方补齐。
+        """
+        if block is None:
+            yield from select_rows(self._iter_parsed_rows(), columns, row_filter)
+            return
+        start, end = block
+        trailing = yield from select_rows(self._iter_block_rows(start, end), columns, row_filter, first_row=start == 0)
+        # 筛选时不保留空行
+        self.block_trailing_rows = trailing if row_filter is None else 0
+
+    def iter_batches(self, batch_size=10000, columns=None, row_filter=None, block=None):
+        """按固定行数分批产出数据，每批为行列表"""
+        batch = []
+        for row in self.iter_rows(columns, row_filter, block):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def read_first_row(self):
+        """只解析文件开头，返回第一行；第一行为空时返回空列表"""
+        rows = self._iter_parsed_rows()
+        try:
+            return next(rows, [])
+        finally:
+            rows.close()
+
+    def read_dimension_ref(self, sheet_path=None):
+        """CSV没有记录数据区域"""
+        return None
+
+    def read_dimension(self, sheet_path=None):
+        """按文件开头的样本估算 (行数, 列数)；文件不超过样本大小时为准确值"""
+        size = os.path.getsize(self.file_path)
+        complete = size <= len(self.sample)
+        # 只用于估算行列数，无法解码的字节不影响结果
+        text = codecs.getincrementaldecoder(self.encoding)(errors='replace').decode(self.sample, final=complete)
+        if not complete:
+            # 去掉样本末尾不完整的一行
+            text = text[:text.rfind('\n') + 1]
+        if not text:
+            return None
+        end = len(text.encode(self.encoding, errors='replace'))
+        rows = list(parse_rows(io.StringIO(text, newline=''), self.delimiter))
+        while rows and not rows[-1]:
+            rows.pop()
+        if not rows:
+            return None
+        cols = max(len(row) for row in rows)
+        if complete:
+            return len(rows), cols
+        return max(len(rows), round(size * len(rows) / end)), cols
+
+    def shared_string_count(self):
+        """CSV没有共享字符串表"""
+        return 0
+
+    def sheet_bytes(self):
+        return os.path.getsize(self.file_path)
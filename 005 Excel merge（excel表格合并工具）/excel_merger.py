@@ -1,141 +1,210 @@
 import os
 import sys
-import pandas as pd
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                             QPushButton, QLabel, QFileDialog, QListWidget, QCheckBox, 
                             QLineEdit, QProgressBar, QMessageBox, QGroupBox, QAbstractItemView,
-                            QListWidgetItem, QSplashScreen, QRadioButton)  # 添加 QRadioButton
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSize
+                            QListWidgetItem, QSplashScreen, QRadioButton, QSpinBox, QDoubleSpinBox, QComboBox,
+                            QTableWidget, QTableWidgetItem, QHeaderView)  # 添加 QRadioButton
+from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSize, QTimer
 from PyQt5.QtGui import QIcon, QDragEnterEvent, QDropEvent, QPixmap, QFont
 
-# 添加内存监控功能
-import psutil
-import gc
+from merge_engine import (ExcelMergeEngine, MergeError, MergeCancelled,
+                          DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, DEFAULT_MEMORY_BUDGET_GB)
+from join_engine import ExcelJoinEngine, JOIN_TYPES
+from output_writers import OUTPUT_FORMATS, parquet_available
+from parse_cache import cache_available
+from column_filter import parse_column_list, parse_filter_list
+from merge_progress import format_duration
+from merge_preflight import read_workbook_info, estimate_merge
+from xlsx_reader import INPUT_EXTENSIONS, LEGACY_EXTENSIONS, LEGACY_FORMAT_MESSAGE, is_csv_file, is_legacy_excel
+from group_summary import SUMMARY_SHEET_NAME
+
+PREFLIGHT_UPDATE_MS = 200  # 元数据陆续读回时，合并预估的刷新间隔
 
 class ExcelMergerThread(QThread):
-    """处理Excel合并的线程类，避免UI卡顿"""
+    """处理Excel合并的线程类，避免UI卡顿；合并逻辑由 ExcelMergeEngine 完成"""
     progress_signal = pyqtSignal(int)
+    throughput_signal = pyqtSignal(int, float, float, float)  # 已处理行数、行/秒、MB/秒、预计剩余秒数
     finished_signal = pyqtSignal(str)
-    error_signal = pyqtSignal(str)
+    error_signal = pyqtSignal(str)  # 导致合并结束的错误
+    notice_signal = pyqtSignal(str)  # 不影响合并继续进行的错误和提醒，如某个文件被跳过
     memory_signal = pyqtSignal(float)
     warning_signal = pyqtSignal(str)  # 添加警告信号
+    throttle_signal = pyqtSignal(str)  # 内存预算限流信号
+    cache_signal = pyqtSignal(int, int)  # 解析缓存命中/未命中次数
+    dedup_signal = pyqtSignal(int)  # 已删除的重复行数
+    resume_signal = pyqtSignal(int, int)  # 发现未完成的合并：已完成单元数、总单元数
+    cancelled_signal = pyqtSignal()  # 合并已取消
+    typing_signal = pyqtSignal(float, float)  # 缓存数据转换为紧凑类型前后的大小（字节）
+    join_signal = pyqtSignal(int)  # 关联模式下找到匹配的左表行数
+    trace_signal = pyqtSignal(str, str)  # 各阶段耗时汇总、耗时记录文件路径
+    summary_signal = pyqtSignal(int, str)  # 分组汇总的分组数、保存位置
     
-    def __init__(self, file_list, keep_all_headers, keep_first_header):
+    def __init__(self, file_list, keep_all_headers, keep_first_header, batch_size=DEFAULT_BATCH_SIZE,
+                 workers=DEFAULT_WORKERS, memory_budget_gb=DEFAULT_MEMORY_BUDGET_GB, output_format='auto',
+                 use_cache=False, sheet_pattern=None, add_source_sheet=False, dedup=False, dedup_columns=None,
+                 checkpoint=False, columns=None, row_filters=None, align_columns=False, join_options=None,
+                 sort_columns=None, sort_descending=False, append_to=None, trace=False, profile=False,
+                 group_by=None, aggregations=None):
         super().__init__()
         self.file_list = file_list
         self.keep_all_headers = keep_all_headers
         self.keep_first_header = keep_first_header
+        self.batch_size = batch_size  # 每批读取的行数
+        self.workers = workers  # 并行解析进程数
+        self.memory_budget_gb = memory_budget_gb
+        self.output_format = output_format  # auto / xlsx / csv / parquet
+        self.use_cache = use_cache  # 是否使用解析缓存
+        self.sheet_pattern = sheet_pattern  # 要合并的工作表名称通配符，为空时只合并第一个工作表
+        self.add_source_sheet = add_source_sheet  # 是否添加来源工作表列
+        self.dedup = dedup  # 是否删除重复行
+        self.dedup_columns = dedup_columns  # 判断重复的列，为空时按整行判断
+        self.checkpoint = checkpoint  # 是否记录合并进度
+        self.columns = columns  # 只合并这些列，为空时合并所有列
+        self.row_filters = row_filters  # 筛选条件，为空时合并所有行
+        self.align_columns = align_columns  # 是否按列名对齐各文件的列
+        self.sort_columns = sort_columns  # 按这些列排序合并结果，为空时按文件顺序输出
+        self.sort_descending = sort_descending
+        self.append_to = append_to  # 追加合并的目标（之前的合并结果），为空时完整合并
+        self.trace = trace  # 是否记录各阶段耗时
+        self.profile = profile  # 是否用 cProfile 和 tracemalloc 分析合并过程
+        self.group_by = group_by  # 分组汇总的分组列，与 aggregations 都为空时不汇总
+        self.aggregations = aggregations  # 汇总方式，如 ["sum:金额", "count"]
+        # 关联模式的设置（left_keys / right_keys / join_type / first_match），为空时按顺序合并
+        self.join_options = join_options
         self.should_continue = None  # 添加标志位控制是否继续合并
+        self.cancel_requested = False  # 是否已请求取消合并
+        self.engine = None
+
+    def wait_for_reply(self, signal, *args):
+        """通知界面并等待界面设置 should_continue；合并已取消时不再等待，返回 False"""
+        self.should_continue = None
+        signal.emit(*args)
+        # 取消时界面线程可能正在等待本线程结束，不会再回复
+        while self.should_continue is None and not self.engine.cancelled:
+            self.msleep(100)
+        if self.engine.cancelled:
+            return False
+        return self.should_continue
+
+    def confirm_header_mismatch(self, file_names):
+        """第一行不一致时通知界面，并等待用户选择是否继续"""
+        return self.wait_for_reply(
+            self.warning_signal,
+            f"警告：以下{len(file_names)}个文件的第一行与第一个文件的第一行内容不一致：\n"
+            + "\n".join(file_names)
+        )
+
+    def confirm_resume(self, finished, total):
+        """发现上次中断的合并时询问是否继续"""
+        return self.wait_for_reply(self.resume_signal, finished, total)
+
+    def cancel(self):
+        """请求取消合并，合并在下一批数据处停止；合并引擎还没有创建时，创建后立即取消"""
+        self.cancel_requested = True
+        if self.engine is not None:
+            self.engine.cancel()
+
+    def create_join_engine(self):
+        """关联模式：用第二个文件按关键列补充第一个文件的列"""
+        return ExcelJoinEngine(
+            self.file_list[0],
+            self.file_list[1],
+            batch_size=self.batch_size,
+            memory_budget_gb=self.memory_budget_gb,
+            output_format=self.output_format,
+            on_progress=self.progress_signal.emit,
+            on_memory=self.memory_signal.emit,
+            on_throttle=self.throttle_signal.emit,
+            on_throughput=self.throughput_signal.emit,
+            **self.join_options
+        )
+
+    def create_merge_engine(self):
+        """按文件列表顺序合并所有文件"""
+        return ExcelMergeEngine(
+            self.file_list,
+            keep_all_headers=self.keep_all_headers,
+            keep_first_header=self.keep_first_header,
+            batch_size=self.batch_size,
+            workers=self.workers,
+            memory_budget_gb=self.memory_budget_gb,
+            output_format=self.output_format,
+            use_cache=self.use_cache,
+            sheet_pattern=self.sheet_pattern,
+            add_source_sheet=self.add_source_sheet,
+            dedup=self.dedup,
+            dedup_columns=self.dedup_columns,
+            checkpoint=self.checkpoint,
+            columns=self.columns,
+            row_filters=self.row_filters,
+            align_columns=self.align_columns,
+            sort_columns=self.sort_columns,
+            sort_descending=self.sort_descending,
+            append_to=self.append_to,
+            trace=self.trace,
+            profile=self.profile,
+            group_by=self.group_by,
+            aggregations=self.aggregations,
+            on_progress=self.progress_signal.emit,
+            on_throughput=self.throughput_signal.emit,
+            on_memory=self.memory_signal.emit,
+            on_error=self.notice_signal.emit,
+            on_warning=self.notice_signal.emit,
+            on_header_mismatch=self.confirm_header_mismatch,
+            on_throttle=self.throttle_signal.emit,
+            on_cache=self.cache_signal.emit,
+            on_dedup=self.dedup_signal.emit,
+            on_typing=self.typing_signal.emit,
+            on_resume=self.confirm_resume,
+        )
 
     def run(self):
+        if self.join_options is not None:
+            self.engine = engine = self.create_join_engine()
+        else:
+            self.engine = engine = self.create_merge_engine()
+        if self.cancel_requested:
+            engine.cancel()
         try:
-            if not self.file_list:
-                self.error_signal.emit("请先选择Excel文件")
-                return
-                
-            # 创建一个空的DataFrame用于存储合并结果
-            merged_df = pd.DataFrame()
-            total_files = len(self.file_list)
-            
-            # 如果选择只保留第一个文件的第一行，需要先检查所有文件的第一行是否一致
-            if not self.keep_all_headers and self.keep_first_header:
-                try:
-                    # 读取第一个文件的第一行
-                    first_file_df = pd.read_excel(self.file_list[0], engine='openpyxl', nrows=1, header=None)
-                    first_row = first_file_df.iloc[0].tolist()
-                    
-                    # 检查其他文件的第一行
-                    for i, file_path in enumerate(self.file_list[1:], 1):
-                        current_df = pd.read_excel(file_path, engine='openpyxl', nrows=1, header=None)
-                        current_row = current_df.iloc[0].tolist()
-                        
-                        if current_row != first_row:
-                            self.warning_signal.emit(f"警告：{os.path.basename(file_path)}中的第一行与第一个文件的第一行内容不一致")
-                            # 等待用户响应
-                            self.should_continue = None
-                            while self.should_continue is None:
-                                self.msleep(100)
-                            if not self.should_continue:
-                                return
-                except Exception as e:
-                    self.error_signal.emit(f"检查文件第一行时出错: {str(e)}")
-                    return
-            
-            # 继续原有的合并逻辑
-            for i, file_path in enumerate(self.file_list):
-                try:
-                    # 更新进度
-                    progress = int((i / total_files) * 100)
-                    self.progress_signal.emit(progress)
-                    
-                    # 监控内存使用情况
-                    memory_usage = psutil.Process(os.getpid()).memory_info().rss / 1024 / 1024 / 1024  # GB
-                    self.memory_signal.emit(memory_usage)
-                    
-                    # 使用chunks读取大文件以减少内存使用
-                    file_size = os.path.getsize(file_path) / (1024 * 1024)  # MB
-                    
-                    if file_size > 100:  # 如果文件大于100MB，使用分块读取
-                        chunks = pd.read_excel(file_path, engine='openpyxl', chunksize=10000, header=None)
-                        first_chunk = next(chunks)
-                        
-                        # 处理第一行
-                        if i > 0 and not self.keep_all_headers:  # 非第一个文件且不保留所有第一行
-                            first_chunk = first_chunk.iloc[1:]
-
-                        # 合并第一个chunk
-                        if not first_chunk.empty:
-                            merged_df = pd.concat([merged_df, first_chunk], ignore_index=True)
-                        
-                        # 处理剩余的chunks
-                        for chunk in chunks:
-                            merged_df = pd.concat([merged_df, chunk], ignore_index=True)
-                            gc.collect()
-                    else:
-                        # 对于小文件，直接读取
-                        df = pd.read_excel(file_path, engine='openpyxl', header=None)
-                        
-                        # 处理第一行
-                        if i > 0 and not self.keep_all_headers:
-                            df = df.iloc[1:]
-                        
-                        # 合并到结果DataFrame
-                        merged_df = pd.concat([merged_df, df], ignore_index=True)
-                    
-                    # 强制垃圾回收
-                    gc.collect()
-                    
-                except Exception as e:
-                    self.error_signal.emit(f"处理文件 {os.path.basename(file_path)} 时出错: {str(e)}")
-                    continue
-            
-            if merged_df.empty:
-                self.error_signal.emit("合并结果为空，请检查文件和设置")
-                return
-                
-            # 保存合并后的文件
-            output_dir = os.path.dirname(self.file_list[0])
-            output_path = os.path.join(output_dir, "合并结果.xlsx")
-            
-            # 检查文件是否已存在，如果存在则添加序号
-            counter = 1
-            while os.path.exists(output_path):
-                output_path = os.path.join(output_dir, f"合并结果_{counter}.xlsx")
-                counter += 1
-                
-            # 使用较低内存的方式保存大文件
-            with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-                merged_df.to_excel(writer, index=False, header=False, sheet_name='合并结果')
-                
-            self.progress_signal.emit(100)
+            try:
+                output_path = engine.run()
+            finally:
+                # 合并失败或取消时也显示已记录的耗时
+                self.emit_trace(engine)
+            if self.join_options is not None:
+                self.join_signal.emit(engine.matched_rows)
+            elif engine.summary_path:
+                self.summary_signal.emit(len(engine.summary.groups), engine.summary_path)
             self.finished_signal.emit(output_path)
-            
+        except MergeCancelled:
+            self.cancelled_signal.emit()
+        except MergeError as e:
+            self.error_signal.emit(str(e))
         except Exception as e:
             self.error_signal.emit(f"合并过程中发生错误: {str(e)}")
-        finally:
-            # 清理内存
-            gc.collect()
+
+    def emit_trace(self, engine):
+        """合并引擎保存了耗时记录时发送各阶段耗时汇总"""
+        trace_file = getattr(engine, 'trace_file', None)
+        if trace_file:
+            self.trace_signal.emit(engine.trace.format_summary(), trace_file)
+
+
+class PreflightThread(QThread):
+    """在后台读取文件的元数据（工作表、数据区域、共享字符串数、文件大小），不解析数据"""
+    info_signal = pyqtSignal(str, object)  # 文件路径、WorkbookInfo
+
+    def __init__(self, file_list):
+        super().__init__()
+        self.file_list = file_list
+
+    def run(self):
+        # 多个文件并发读取，按列表顺序逐个通知界面
+        with ThreadPoolExecutor(max_workers=max(1, min(8, len(self.file_list)))) as executor:
+            for info in executor.map(read_workbook_info, self.file_list):
+                self.info_signal.emit(info.path, info)
 
 
 class DragDropListWidget(QListWidget):
@@ -164,7 +233,8 @@ class DragDropListWidget(QListWidget):
             files = []
             for url in event.mimeData().urls():
                 file_path = url.toLocalFile()
-                if file_path.endswith(('.xlsx', '.xls')):
+                # .xls 也交给列表，添加时提示另存为xlsx
+                if file_path.lower().endswith(INPUT_EXTENSIONS + LEGACY_EXTENSIONS):
                     files.append(file_path)
             
             if files:
@@ -177,6 +247,8 @@ class ExcelMergerApp(QMainWindow):
     """Excel合并工具主窗口"""
     def __init__(self):
         super().__init__()
+        self.preflight_infos = {}  # 文件路径 -> WorkbookInfo（合并预估用的元数据）
+        self.preflight_thread = None
         self.initUI()
         self.merger_thread = None
         self.excel_icon = QIcon(os.path.join(os.path.dirname(os.path.abspath(__file__)), "icons", "excel.png"))
@@ -232,7 +304,33 @@ class ExcelMergerApp(QMainWindow):
         file_layout.addLayout(file_buttons_layout)
         file_group.setLayout(file_layout)
         
-        left_layout.addWidget(file_group)
+        # 合并预估：只读取各文件的元数据，添加文件后立即在后台更新
+        preflight_group = QGroupBox("合并预估")
+        preflight_layout = QVBoxLayout()
+        
+        self.preflight_table = QTableWidget(0, 6)
+        self.preflight_table.setHorizontalHeaderLabels(["文件", "工作表", "数据区域", "行数", "共享字符串", "大小"])
+        self.preflight_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.preflight_table.verticalHeader().setVisible(False)
+        self.preflight_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.preflight_table.setSelectionMode(QAbstractItemView.NoSelection)
+        self.preflight_table.setToolTip("根据各文件记录的数据区域和共享字符串表估算，不读取数据")
+        
+        self.preflight_label = QLabel("添加文件后显示预计行数、峰值内存和耗时")
+        self.preflight_label.setWordWrap(True)
+        
+        preflight_layout.addWidget(self.preflight_table)
+        preflight_layout.addWidget(self.preflight_label)
+        preflight_group.setLayout(preflight_layout)
+        
+        # 元数据陆续读回时合并刷新，避免文件较多时频繁重建表格
+        self.preflight_timer = QTimer(self)
+        self.preflight_timer.setSingleShot(True)
+        self.preflight_timer.setInterval(PREFLIGHT_UPDATE_MS)
+        self.preflight_timer.timeout.connect(self.update_preflight)
+        
+        left_layout.addWidget(file_group, 3)
+        left_layout.addWidget(preflight_group, 2)
         
         # 右侧配置区域
         right_layout = QVBoxLayout()
@@ -251,12 +349,225 @@ class ExcelMergerApp(QMainWindow):
         self.keep_all_first_rows = QRadioButton("保留所有文件的第一行")
         self.keep_all_first_rows.setToolTip("合并后的文件将包含所有Excel文件的第一行")
         
+        self.align_columns_check = QCheckBox("按列名对齐（合并所有文件的列）")
+        self.align_columns_check.setToolTip("按第一行的列名对齐各文件的列，列顺序不同也能正确合并；\n"
+                                            "合并结果包含所有文件出现过的列，文件中没有的列留空")
+        
         header_layout.addWidget(self.keep_first_file_row)
         header_layout.addWidget(self.keep_all_first_rows)
+        header_layout.addWidget(self.align_columns_check)
         header_group.setLayout(header_layout)
         
+        # 工作表选择
+        sheet_group = QGroupBox("工作表")
+        sheet_layout = QVBoxLayout()
+        
+        self.sheet_pattern_edit = QLineEdit()
+        self.sheet_pattern_edit.setPlaceholderText("留空只合并第一个工作表，* 合并所有工作表")
+        self.sheet_pattern_edit.setToolTip("按名称选择要合并的工作表，支持通配符，如：华*区")
+        
+        self.add_source_sheet_check = QCheckBox("添加来源工作表列")
+        self.add_source_sheet_check.setToolTip("在第一列记录每一行来自哪个工作表")
+        
+        sheet_layout.addWidget(self.sheet_pattern_edit)
+        sheet_layout.addWidget(self.add_source_sheet_check)
+        sheet_group.setLayout(sheet_layout)
+        
+        # 列选择和行筛选
+        filter_group = QGroupBox("列与筛选")
+        filter_layout = QVBoxLayout()
+        
+        self.columns_edit = QLineEdit()
+        self.columns_edit.setPlaceholderText("留空合并所有列，或填写列名/列字母，如：A,C,发票号码")
+        self.columns_edit.setToolTip("只合并这些列，并按填写的顺序输出；列名按每个文件自己的第一行查找")
+        
+        self.filters_edit = QLineEdit()
+        self.filters_edit.setPlaceholderText("筛选条件，如：开票日期>=2024-01-01; 金额>0")
+        self.filters_edit.setToolTip("只合并满足所有条件的行，多个条件用分号分隔\n"
+                                     "支持的运算符：= != > >= < <=，以及 ~（包含文字）")
+        
+        filter_layout.addWidget(self.columns_edit)
+        filter_layout.addWidget(self.filters_edit)
+        filter_group.setLayout(filter_layout)
+        
+        # 关联模式（VLOOKUP）
+        join_group = QGroupBox("表格关联（VLOOKUP）")
+        join_layout = QVBoxLayout()
+        
+        self.join_check = QCheckBox("关联模式：按关键列用第二个文件补充第一个文件")
+        self.join_check.setToolTip("文件列表中的第一个文件为左表，第二个文件为右表，\n"
+                                   "按关键列查找右表中匹配的行，把右表的其他列加到左表后面")
+        
+        self.join_keys_edit = QLineEdit()
+        self.join_keys_edit.setPlaceholderText("左表关键列，如：客户编码 或 B")
+        self.right_keys_edit = QLineEdit()
+        self.right_keys_edit.setPlaceholderText("右表关键列（留空表示与左表同名）")
+        
+        join_type_layout = QHBoxLayout()
+        self.join_type_combo = QComboBox()
+        for join_type, text in zip(JOIN_TYPES, ["左连接（保留左表所有行）", "内连接（只保留匹配的行）",
+                                                "右连接（保留右表所有行）", "全连接（保留两边所有行）"]):
+            self.join_type_combo.addItem(text, join_type)
+        self.first_match_check = QCheckBox("只取第一个匹配")
+        self.first_match_check.setToolTip("右表有多行匹配时只取第一行（与VLOOKUP相同），否则输出所有匹配的行")
+        self.first_match_check.setChecked(True)
+        join_type_layout.addWidget(self.join_type_combo)
+        join_type_layout.addWidget(self.first_match_check)
+        
+        join_widgets = [self.join_keys_edit, self.right_keys_edit, self.join_type_combo, self.first_match_check]
+        for widget in join_widgets:
+            widget.setEnabled(False)
+            self.join_check.toggled.connect(widget.setEnabled)
+        
+        join_layout.addWidget(self.join_check)
+        join_layout.addWidget(self.join_keys_edit)
+        join_layout.addWidget(self.right_keys_edit)
+        join_layout.addLayout(join_type_layout)
+        join_group.setLayout(join_layout)
+        
+        # 删除重复行
+        dedup_group = QGroupBox("重复行")
+        dedup_layout = QVBoxLayout()
+        
+        self.dedup_check = QCheckBox("删除重复行")
+        self.dedup_check.setToolTip("合并时删除重复的行，只保留第一次出现的行")
+        
+        self.dedup_columns_edit = QLineEdit()
+        self.dedup_columns_edit.setPlaceholderText("留空按整行判断，或填写列名/列字母，如：A,C")
+        self.dedup_columns_edit.setToolTip("只比较这些列的值来判断重复，多个列用逗号分隔")
+        self.dedup_columns_edit.setEnabled(False)
+        self.dedup_check.toggled.connect(self.dedup_columns_edit.setEnabled)
+        
+        dedup_layout.addWidget(self.dedup_check)
+        dedup_layout.addWidget(self.dedup_columns_edit)
+        dedup_group.setLayout(dedup_layout)
+        
+        # 排序
+        sort_group = QGroupBox("排序")
+        sort_layout = QHBoxLayout()
+        
+        self.sort_columns_edit = QLineEdit()
+        self.sort_columns_edit.setPlaceholderText("留空按文件顺序输出，或填写排序列，如：开票日期,客户")
+        self.sort_columns_edit.setToolTip("按这些列排序合并结果，多个列用逗号分隔；\n"
+                                          "数据超出内存时先分段排序写到临时文件，再归并输出")
+        self.sort_descending_check = QCheckBox("降序")
+        
+        sort_layout.addWidget(self.sort_columns_edit)
+        sort_layout.addWidget(self.sort_descending_check)
+        sort_group.setLayout(sort_layout)
+        
+        # 分组汇总
+        summary_group = QGroupBox("分组汇总")
+        summary_layout = QHBoxLayout()
+        
+        self.group_by_edit = QLineEdit()
+        self.group_by_edit.setPlaceholderText("分组列，如：销方名称,开票日期:月")
+        self.group_by_edit.setToolTip("合并的同时按这些列分组汇总，多个列用逗号分隔；日期列后加 :年、:月、:日 按日期分组。\n"
+                                      "输出xlsx时汇总写入合并结果的\"汇总\"工作表，输出CSV/Parquet时保存为 合并结果_汇总.csv 等")
+        self.aggregations_edit = QLineEdit()
+        self.aggregations_edit.setPlaceholderText("汇总方式，如：sum:金额,count,max:开票日期")
+        self.aggregations_edit.setToolTip("可用 sum（合计）、count（计数）、min（最小值）、max（最大值），\n"
+                                          "count 不填列时统计行数；只填分组列时统计每组的行数")
+        
+        summary_layout.addWidget(self.group_by_edit)
+        summary_layout.addWidget(self.aggregations_edit)
+        summary_group.setLayout(summary_layout)
+        
+        # 追加合并
+        append_group = QGroupBox("追加合并")
+        append_layout = QHBoxLayout()
+        
+        self.append_check = QCheckBox("追加到")
+        self.append_check.setToolTip("只合并之前的合并结果中没有的文件，新的行写入同目录下的新文件（如 合并结果_第2部分.xlsx），\n"
+                                     "已合并的文件不再读取；之前的合并结果旁边需要有合并时保存的清单（.manifest.json）")
+        self.append_path_edit = QLineEdit()
+        self.append_path_edit.setPlaceholderText("之前的合并结果，如：合并结果.xlsx")
+        self.append_browse_btn = QPushButton("选择...")
+        self.append_browse_btn.clicked.connect(self.choose_append_target)
+        self.append_path_edit.setEnabled(False)
+        self.append_browse_btn.setEnabled(False)
+        self.append_check.toggled.connect(self.append_path_edit.setEnabled)
+        self.append_check.toggled.connect(self.append_browse_btn.setEnabled)
+        
+        append_layout.addWidget(self.append_check)
+        append_layout.addWidget(self.append_path_edit)
+        append_layout.addWidget(self.append_browse_btn)
+        append_group.setLayout(append_layout)
+        
+        # 读取批大小
+        batch_layout = QHBoxLayout()
+        batch_label = QLabel("每批读取行数:")
+        self.batch_size_spin = QSpinBox()
+        self.batch_size_spin.setRange(1000, 1000000)
+        self.batch_size_spin.setSingleStep(5000)
+        self.batch_size_spin.setValue(DEFAULT_BATCH_SIZE)
+        self.batch_size_spin.setToolTip("每次从文件中读取并写入的行数，数值越大速度越快但占用内存越多")
+        batch_layout.addWidget(batch_label)
+        batch_layout.addWidget(self.batch_size_spin)
+        
+        # 并行解析进程数
+        workers_layout = QHBoxLayout()
+        workers_label = QLabel("并行解析进程数:")
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, os.cpu_count() or 1)
+        self.workers_spin.setValue(DEFAULT_WORKERS)
+        self.workers_spin.setToolTip("同时解析的文件数，实际进程数还会受内存预算限制")
+        workers_layout.addWidget(workers_label)
+        workers_layout.addWidget(self.workers_spin)
+        
+        # 输出格式
+        format_layout = QHBoxLayout()
+        format_label = QLabel("输出格式:")
+        self.output_format_combo = QComboBox()
+        for output_format, text in zip(OUTPUT_FORMATS, ["自动", "Excel (xlsx)", "CSV", "Parquet"]):
+            self.output_format_combo.addItem(text, output_format)
+        if not parquet_available():
+            # 未安装pyarrow时不提供Parquet输出
+            self.output_format_combo.removeItem(self.output_format_combo.findData('parquet'))
+        self.output_format_combo.setToolTip("自动：预计行数超过Excel上限(1048576行)时改为输出Parquet/CSV；\n"
+                                            "xlsx输出超过上限时会自动拆分到 合并结果_2、合并结果_3 等工作表")
+        format_layout.addWidget(format_label)
+        format_layout.addWidget(self.output_format_combo)
+        
+        # 解析缓存
+        self.use_cache_check = QCheckBox("使用解析缓存")
+        self.use_cache_check.setToolTip("保存已解析文件的内容，再次合并时只解析新增或修改过的文件")
+        self.use_cache_check.setChecked(False)  # 缓存会在用户目录下占用磁盘空间，需要时再勾选
+        self.use_cache_check.setEnabled(cache_available())
+        if not cache_available():
+            self.use_cache_check.setToolTip("需要安装pyarrow才能使用解析缓存")
+        
+        # 记录合并进度
+        self.checkpoint_check = QCheckBox("记录合并进度（中断后可继续）")
+        self.checkpoint_check.setToolTip("每合并完一个文件记录一次进度，合并被取消或中断后，\n"
+                                         "再次合并同样的文件时只需解析剩余的文件；\n"
+                                         "解析结果会额外写入一次磁盘，默认不记录")
+        self.checkpoint_check.setChecked(False)
+        
+        # 性能分析
+        self.trace_check = QCheckBox("记录各阶段耗时（导出trace）")
+        self.trace_check.setToolTip("按文件和批记录解压、XML解析、写入等各阶段的耗时，合并后显示汇总，\n"
+                                    "并保存为 输出文件路径.trace.json（可在 chrome://tracing 或 ui.perfetto.dev 中打开）")
+        self.profile_check = QCheckBox("性能分析（cProfile + tracemalloc，合并明显变慢）")
+        self.profile_check.setToolTip("分析主进程中各函数的耗时和内存分配，\n"
+                                      "结果保存为 输出文件路径.profile.prof 和 .profile.txt")
+        
         # 添加配置组件到配置布局
         config_layout.addWidget(header_group)
+        config_layout.addWidget(sheet_group)
+        config_layout.addWidget(filter_group)
+        config_layout.addWidget(dedup_group)
+        config_layout.addWidget(sort_group)
+        config_layout.addWidget(summary_group)
+        config_layout.addWidget(append_group)
+        config_layout.addWidget(join_group)
+        config_layout.addLayout(batch_layout)
+        config_layout.addLayout(workers_layout)
+        config_layout.addLayout(format_layout)
+        config_layout.addWidget(self.use_cache_check)
+        config_layout.addWidget(self.checkpoint_check)
+        config_layout.addWidget(self.trace_check)
+        config_layout.addWidget(self.profile_check)
         config_group.setLayout(config_layout)
         
         # 内存监控区域
@@ -265,6 +576,26 @@ class ExcelMergerApp(QMainWindow):
         
         self.memory_label = QLabel("当前内存使用: 0 GB")
         memory_layout.addWidget(self.memory_label)
+        
+        budget_layout = QHBoxLayout()
+        budget_label = QLabel("内存预算(GB):")
+        self.memory_budget_spin = QDoubleSpinBox()
+        self.memory_budget_spin.setRange(0.5, 256)
+        self.memory_budget_spin.setSingleStep(0.5)
+        self.memory_budget_spin.setValue(DEFAULT_MEMORY_BUDGET_GB)
+        self.memory_budget_spin.setToolTip("内存接近预算时会自动缩小批大小、暂停解析，合并变慢但不会内存溢出")
+        budget_layout.addWidget(budget_label)
+        budget_layout.addWidget(self.memory_budget_spin)
+        memory_layout.addLayout(budget_layout)
+        
+        self.throttle_label = QLabel("限流次数: 0")
+        self.throttle_label.setWordWrap(True)
+        memory_layout.addWidget(self.throttle_label)
+        
+        # 排序或输出Parquet时缓存的数据按紧凑类型保存，显示转换前后的大小
+        self.typing_label = QLabel("")
+        self.typing_label.setToolTip("数字按取值范围使用最小的整数类型，重复较多的文字按分类保存")
+        memory_layout.addWidget(self.typing_label)
         memory_group.setLayout(memory_layout)
         
         # 合并按钮和进度条
@@ -276,11 +607,23 @@ class ExcelMergerApp(QMainWindow):
         self.merge_btn.clicked.connect(self.start_merge)
         self.merge_btn.setStyleSheet("font-weight: bold; font-size: 14px;")
         
+        self.cancel_btn = QPushButton("取消合并")
+        self.cancel_btn.clicked.connect(self.cancel_merge)
+        self.cancel_btn.setEnabled(False)
+        
         self.progress_bar = QProgressBar()
         self.progress_bar.setValue(0)
         
+        self.throughput_label = QLabel("")
+        self.trace_label = QLabel("")
+        self.trace_label.setWordWrap(True)
+        self.trace_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        
         merge_layout.addWidget(self.merge_btn)
+        merge_layout.addWidget(self.cancel_btn)
         merge_layout.addWidget(self.progress_bar)
+        merge_layout.addWidget(self.throughput_label)
+        merge_layout.addWidget(self.trace_label)
         merge_group.setLayout(merge_layout)
         
         # 添加到右侧布局
@@ -296,6 +639,15 @@ class ExcelMergerApp(QMainWindow):
         main_widget.setLayout(main_layout)
         self.setCentralWidget(main_widget)
         
+        # 影响预估的设置变化时重新估算
+        self.file_list.model().rowsMoved.connect(self.preflight_timer.start)
+        self.sheet_pattern_edit.textChanged.connect(self.preflight_timer.start)
+        self.sort_columns_edit.textChanged.connect(self.preflight_timer.start)
+        self.batch_size_spin.valueChanged.connect(self.preflight_timer.start)
+        self.workers_spin.valueChanged.connect(self.preflight_timer.start)
+        self.output_format_combo.currentIndexChanged.connect(self.preflight_timer.start)
+        self.memory_budget_spin.valueChanged.connect(self.preflight_timer.start)
+        
         # 状态栏
         self.statusBar().showMessage("准备就绪")
         
@@ -306,17 +658,30 @@ class ExcelMergerApp(QMainWindow):
     def add_files(self):
         """添加Excel文件到列表"""
         files, _ = QFileDialog.getOpenFileNames(
-            self, "选择Excel文件", "", "Excel文件 (*.xlsx *.xls)"
+            self, "选择Excel文件", "", "表格文件 (*.xlsx *.csv *.tsv);;Excel文件 (*.xlsx);;CSV/TSV文件 (*.csv *.tsv)"
         )
         if files:
             self.add_files_to_list(files)
             
+    def choose_append_target(self):
+        """选择要追加的合并结果"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "选择之前的合并结果", "", "合并结果 (*.xlsx *.csv *.parquet)"
+        )
+        if file_path:
+            self.append_path_edit.setText(file_path)
+            
     def add_dropped_files(self, files):
         """处理拖放添加的文件"""
         self.add_files_to_list(files)
         
     def add_files_to_list(self, files):
-        """将文件添加到列表中并设置图标"""
+        """将文件添加到列表中并设置图标；旧版Excel的 .xls 文件无法读取，提示另存为xlsx"""
+        legacy = [file_path for file_path in files if is_legacy_excel(file_path)]
+        if legacy:
+            QMessageBox.warning(self, "警告", f"{LEGACY_FORMAT_MESSAGE}，以下文件未添加：\n"
+                                + "\n".join(os.path.basename(file_path) for file_path in legacy))
+            files = [file_path for file_path in files if not is_legacy_excel(file_path)]
         for file_path in files:
             item = QListWidgetItem(os.path.basename(file_path))
             item.setData(Qt.UserRole, file_path)  # 存储完整路径
@@ -329,15 +694,104 @@ class ExcelMergerApp(QMainWindow):
                 pass
                 
             self.file_list.addItem(item)
+        self.refresh_preflight()
             
     def remove_files(self):
         """从列表中移除选中的文件"""
         for item in self.file_list.selectedItems():
             self.file_list.takeItem(self.file_list.row(item))
+        self.refresh_preflight()
             
     def clear_files(self):
         """清空文件列表"""
         self.file_list.clear()
+        self.refresh_preflight()
+        
+    def _preflight_current(self, file_path):
+        """是否已有该文件的元数据，且读取之后文件没有修改过"""
+        info = self.preflight_infos.get(file_path)
+        if info is None:
+            return False
+        try:
+            return info.mtime == os.path.getmtime(file_path)
+        except OSError:
+            # 文件已不存在，保留读取时的错误信息
+            return True
+            
+    def refresh_preflight(self):
+        """在后台读取新添加（或已修改）文件的元数据，并更新合并预估"""
+        files = self.get_file_list()
+        pending = [path for path in dict.fromkeys(files) if not self._preflight_current(path)]
+        if pending and (self.preflight_thread is None or not self.preflight_thread.isRunning()):
+            # 读取期间新添加的文件在本次读取结束后再读取
+            self.preflight_thread = PreflightThread(pending)
+            self.preflight_thread.info_signal.connect(self.handle_preflight_info)
+            self.preflight_thread.finished.connect(self.refresh_preflight)
+            self.preflight_thread.start()
+        # 不再在列表中的文件不保留元数据
+        self.preflight_infos = {path: info for path, info in self.preflight_infos.items() if path in files}
+        self.preflight_timer.start()
+        
+    def handle_preflight_info(self, file_path, info):
+        """收到一个文件的元数据"""
+        if file_path in self.get_file_list():
+            self.preflight_infos[file_path] = info
+            self.preflight_timer.start()
+            
+    def update_preflight(self):
+        """按当前的文件列表和设置刷新合并预估"""
+        files = self.get_file_list()
+        sheet_pattern = self.sheet_pattern_edit.text().strip() or None
+        self.preflight_table.setRowCount(len(files))
+        for row, file_path in enumerate(files):
+            info = self.preflight_infos.get(file_path)
+            if info is None:
+                values = [os.path.basename(file_path), "读取中…", "", "", "", ""]
+            elif info.error is not None:
+                values = [os.path.basename(file_path), "无法读取", info.error, "", "", ""]
+            else:
+                sheets = info.selected_sheets(sheet_pattern)
+                values = [
+                    os.path.basename(file_path),
+                    ", ".join(sheet.name for sheet in sheets) or "无匹配的工作表",
+                    "CSV，按开头估算" if is_csv_file(file_path)
+                    else ", ".join(sheet.dimension_ref or "未记录" for sheet in sheets),
+                    f"{sum(sheet.rows for sheet in sheets):,}",
+                    "未记录" if info.shared_strings is None else f"{info.shared_strings:,}",
+                    f"{info.file_bytes / 1024 / 1024:.1f} MB" if info.file_bytes >= 1024 * 1024
+                    else f"{info.file_bytes / 1024:.0f} KB",
+                ]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                item.setToolTip(value)
+                self.preflight_table.setItem(row, col, item)
+        
+        if not files:
+            self.preflight_label.setText("添加文件后显示预计行数、峰值内存和耗时")
+            self.preflight_label.setStyleSheet("")
+            return
+        infos = [self.preflight_infos[path] for path in files if path in self.preflight_infos]
+        estimate = estimate_merge(infos, sheet_pattern, self.workers_spin.value(), self.batch_size_spin.value(),
+                                  self.output_format_combo.currentData(),
+                                  sort=bool(parse_column_list(self.sort_columns_edit.text())))
+        lines = []
+        if estimate.sheets:
+            lines.append(f"{estimate.files} 个文件、{estimate.sheets} 个工作表，约 {estimate.rows:,} 行"
+                         f"（{estimate.cells:,} 个单元格），共享字符串 {estimate.shared_strings:,} 个，"
+                         f"文件共 {estimate.compressed_bytes / 1024 / 1024:.1f} MB")
+            lines.append(f"输出 {estimate.output_format}，预计峰值内存 {estimate.peak_memory_bytes / 1024 / 1024:.0f} MB，"
+                         f"预计耗时 {format_duration(estimate.seconds)}")
+        if estimate.unknown_dimensions:
+            lines.append(f"{estimate.unknown_dimensions} 个工作表没有记录数据区域，按文件大小估算")
+        if estimate.errors:
+            lines.append(f"{len(estimate.errors)} 个文件无法读取")
+        if len(infos) < len(files):
+            lines.append(f"正在读取 {len(files) - len(infos)} 个文件的信息…")
+        over_budget = estimate.peak_memory_bytes > self.memory_budget_spin.value() * 1024 * 1024 * 1024
+        if over_budget:
+            lines.append("预计内存超过内存预算，合并时会自动限流，速度会变慢")
+        self.preflight_label.setText("\n".join(lines))
+        self.preflight_label.setStyleSheet("color: orange;" if over_budget else "")
         
     def get_file_list(self):
         """获取当前文件列表中的所有文件路径"""
@@ -354,13 +808,52 @@ class ExcelMergerApp(QMainWindow):
         self.memory_label.setText(f"当前内存使用: {memory_gb:.2f} GB")
         
         # 如果内存使用过高，显示警告
-        if memory_gb > 3.0:  # 超过3GB显示警告
+        budget_gb = self.memory_budget_spin.value()
+        if memory_gb > budget_gb:  # 超过内存预算显示警告
             self.memory_label.setStyleSheet("color: red; font-weight: bold;")
-        elif memory_gb > 1.5:  # 超过1.5GB显示提醒
+        elif memory_gb > budget_gb / 2:  # 超过预算的一半显示提醒
             self.memory_label.setStyleSheet("color: orange;")
         else:
             self.memory_label.setStyleSheet("")
         
+    def handle_throttle(self, message):
+        """显示内存预算限流事件"""
+        self.throttle_count += 1
+        self.throttle_label.setText(f"限流次数: {self.throttle_count}\n{message}")
+        self.throttle_label.setStyleSheet("color: orange;")
+        self.statusBar().showMessage(message)
+        
+    def update_trace_stats(self, summary, trace_file):
+        """显示各阶段耗时汇总和耗时记录文件的位置"""
+        self.trace_label.setText(f"各阶段耗时: {summary or '无'}\n耗时记录: {trace_file}")
+        
+    def update_typing_stats(self, python_bytes, compact_bytes):
+        """显示缓存数据转换为紧凑类型前后占用的内存"""
+        saved = 1 - compact_bytes / python_bytes if python_bytes else 0
+        self.typing_label.setText(f"紧凑类型: {python_bytes / 1024 / 1024:.1f} MB → "
+                                  f"{compact_bytes / 1024 / 1024:.1f} MB（节省 {saved:.0%}）")
+        
+    def update_cache_stats(self, hits, misses):
+        """在状态栏显示解析缓存命中情况"""
+        self.cache_stats = f"缓存命中 {hits}，未命中 {misses}"
+        self.statusBar().showMessage(f"正在合并...（{self.cache_stats}）")
+        
+    def update_join_stats(self, matched_rows):
+        """记录关联模式下找到匹配的行数"""
+        self.join_stats = f"匹配 {matched_rows} 行"
+        
+    def update_summary_stats(self, groups, summary_path):
+        """记录分组汇总的分组数和保存位置"""
+        if summary_path.lower().endswith('.xlsx'):
+            # 输出xlsx时汇总写在合并结果的工作表中
+            self.summary_stats = f"分组汇总 {groups} 组，见\"{SUMMARY_SHEET_NAME}\"工作表"
+        else:
+            self.summary_stats = f"分组汇总 {groups} 组，见 {os.path.basename(summary_path)}"
+        
+    def update_dedup_stats(self, duplicates):
+        """记录已删除的重复行数"""
+        self.dedup_stats = f"删除重复行 {duplicates}"
+        
     def start_merge(self):
         """开始合并操作"""
         files = self.get_file_list()
@@ -368,26 +861,99 @@ class ExcelMergerApp(QMainWindow):
             QMessageBox.warning(self, "警告", "请先添加Excel文件")
             return
             
+        join_options = None
+        if self.join_check.isChecked():
+            if len(files) != 2:
+                QMessageBox.warning(self, "警告", "关联模式需要且只能添加两个文件：第一个为左表，第二个为右表")
+                return
+            left_keys = parse_column_list(self.join_keys_edit.text())
+            if not left_keys:
+                QMessageBox.warning(self, "警告", "请填写关联的关键列")
+                return
+            join_options = {
+                'left_keys': left_keys,
+                'right_keys': parse_column_list(self.right_keys_edit.text()),
+                'join_type': self.join_type_combo.currentData(),
+                'first_match': self.first_match_check.isChecked(),
+            }
+            
         # 获取配置选项
         keep_all_headers = self.keep_all_first_rows.isChecked()
         keep_first_header = not keep_all_headers
+        batch_size = self.batch_size_spin.value()
+        workers = self.workers_spin.value()
+        output_format = self.output_format_combo.currentData()
+        memory_budget_gb = self.memory_budget_spin.value()
+        use_cache = self.use_cache_check.isChecked()
+        sheet_pattern = self.sheet_pattern_edit.text().strip() or None
+        add_source_sheet = self.add_source_sheet_check.isChecked()
+        dedup = self.dedup_check.isChecked()
+        dedup_columns = parse_column_list(self.dedup_columns_edit.text())
+        columns = parse_column_list(self.columns_edit.text())
+        row_filters = parse_filter_list(self.filters_edit.text())
+        align_columns = self.align_columns_check.isChecked()
+        sort_columns = parse_column_list(self.sort_columns_edit.text())
+        sort_descending = self.sort_descending_check.isChecked()
+        group_by = parse_column_list(self.group_by_edit.text())
+        aggregations = parse_column_list(self.aggregations_edit.text())
+        checkpoint = self.checkpoint_check.isChecked()
+        append_to = None
+        if self.append_check.isChecked() and join_options is None:
+            append_to = self.append_path_edit.text().strip()
+            if not append_to:
+                QMessageBox.warning(self, "警告", "请选择要追加的合并结果")
+                return
         
         # 禁用界面元素
         self.set_ui_enabled(False)
         self.progress_bar.setValue(0)
+        self.throughput_label.setText("")
         self.statusBar().showMessage("正在合并...")
+        self.throttle_count = 0
+        self.cache_stats = ""
+        self.dedup_stats = ""
+        self.join_stats = ""
+        self.summary_stats = ""
+        self.notices = []
+        self.throttle_label.setText("限流次数: 0")
+        self.throttle_label.setStyleSheet("")
+        self.typing_label.setText("")
+        self.trace_label.setText("")
         
         # 创建并启动合并线程
-        self.merger_thread = ExcelMergerThread(files, keep_all_headers, keep_first_header)
+        self.merger_thread = ExcelMergerThread(files, keep_all_headers, keep_first_header, batch_size, workers,
+                                               memory_budget_gb, output_format, use_cache,
+                                               sheet_pattern, add_source_sheet,
+                                               dedup=dedup, dedup_columns=dedup_columns, checkpoint=checkpoint,
+                                               columns=columns, row_filters=row_filters, align_columns=align_columns,
+                                               join_options=join_options,
+                                               sort_columns=sort_columns, sort_descending=sort_descending,
+                                               append_to=append_to, trace=self.trace_check.isChecked(),
+                                               profile=self.profile_check.isChecked(),
+                                               group_by=group_by, aggregations=aggregations)
         self.merger_thread.progress_signal.connect(self.update_progress)
+        self.merger_thread.throughput_signal.connect(self.update_throughput)
         self.merger_thread.finished_signal.connect(self.merge_completed)
         self.merger_thread.error_signal.connect(self.merge_error)
+        self.merger_thread.notice_signal.connect(self.handle_notice)
         self.merger_thread.memory_signal.connect(self.update_memory_usage)
         self.merger_thread.warning_signal.connect(self.handle_warning)  # 连接警告信号
+        self.merger_thread.throttle_signal.connect(self.handle_throttle)
+        self.merger_thread.cache_signal.connect(self.update_cache_stats)
+        self.merger_thread.dedup_signal.connect(self.update_dedup_stats)
+        self.merger_thread.resume_signal.connect(self.handle_resume)
+        self.merger_thread.cancelled_signal.connect(self.merge_cancelled)
+        self.merger_thread.join_signal.connect(self.update_join_stats)
+        self.merger_thread.typing_signal.connect(self.update_typing_stats)
+        self.merger_thread.trace_signal.connect(self.update_trace_stats)
+        self.merger_thread.summary_signal.connect(self.update_summary_stats)
         self.merger_thread.start()
 
     def handle_warning(self, warning_msg):
         """处理警告消息"""
+        if self.merger_thread is None or self.merger_thread.cancel_requested:
+            # 合并已取消，不再询问
+            return
         reply = QMessageBox.warning(
             self,
             "警告",
@@ -396,26 +962,70 @@ class ExcelMergerApp(QMainWindow):
             QMessageBox.No
         )
         
-        if hasattr(self, 'merger_thread') and self.merger_thread:
-            self.merger_thread.should_continue = reply == QMessageBox.Yes
+        self.merger_thread.should_continue = reply == QMessageBox.Yes
             
         if reply == QMessageBox.No:
             self.set_ui_enabled(True)
             self.statusBar().showMessage("合并已取消")
         
+    def handle_notice(self, message):
+        """记录不影响合并继续进行的错误和提醒，在状态栏显示，合并完成时一并列出"""
+        self.notices.append(message)
+        self.statusBar().showMessage(message)
+        
+    def handle_resume(self, finished, total):
+        """发现上次中断的合并，询问是否继续"""
+        if self.merger_thread is None or self.merger_thread.cancel_requested:
+            return
+        reply = QMessageBox.question(
+            self,
+            "继续合并",
+            f"发现上次未完成的合并（已完成 {finished}/{total} 个文件）。\n\n"
+            f"是否继续上次的合并？选择\"否\"将重新开始合并。",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.Yes
+        )
+        self.merger_thread.should_continue = reply == QMessageBox.Yes
+        
+    def cancel_merge(self):
+        """取消正在进行的合并"""
+        if self.merger_thread and self.merger_thread.isRunning():
+            self.cancel_btn.setEnabled(False)
+            self.statusBar().showMessage("正在取消合并...")
+            self.merger_thread.cancel()
+            
+    def merge_cancelled(self):
+        """合并取消后恢复界面"""
+        self.set_ui_enabled(True)
+        self.statusBar().showMessage("合并已取消")
+        
     def update_progress(self, value):
         """更新进度条"""
         self.progress_bar.setValue(value)
         
+    def update_throughput(self, rows, rows_per_sec, mb_per_sec, eta):
+        """显示已处理行数、速度和预计剩余时间"""
+        self.throughput_label.setText(
+            f"已处理 {rows:,} 行  |  {rows_per_sec:,.0f} 行/秒  |  {mb_per_sec:.1f} MB/秒  |  剩余约 {format_duration(eta)}"
+        )
+        
     def merge_completed(self, output_path):
         """合并完成后的处理"""
         self.set_ui_enabled(True)
-        self.statusBar().showMessage(f"合并完成: {output_path}")
+        stats = "，".join(text for text in (self.cache_stats, self.dedup_stats, self.join_stats, self.summary_stats)
+                          if text)
+        if stats:
+            self.statusBar().showMessage(f"合并完成: {output_path}（{stats}）")
+        else:
+            self.statusBar().showMessage(f"合并完成: {output_path}")
         
+        notices = "".join(f"\n{message}" for message in self.notices)
+        if notices:
+            notices = f"\n\n合并过程中的提醒：{notices}"
         reply = QMessageBox.information(
             self, 
             "合并完成", 
-            f"Excel文件已成功合并，保存至:\n{output_path}\n\n是否打开文件?", 
+            f"Excel文件已成功合并，保存至:\n{output_path}{notices}\n\n是否打开文件?", 
             QMessageBox.Yes | QMessageBox.No
         )
         
@@ -435,7 +1045,33 @@ class ExcelMergerApp(QMainWindow):
         self.clear_btn.setEnabled(enabled)
         self.keep_all_first_rows.setEnabled(enabled)
         self.keep_first_file_row.setEnabled(enabled)
+        self.align_columns_check.setEnabled(enabled)
+        self.batch_size_spin.setEnabled(enabled)
+        self.workers_spin.setEnabled(enabled)
+        self.output_format_combo.setEnabled(enabled)
+        self.memory_budget_spin.setEnabled(enabled)
+        self.use_cache_check.setEnabled(enabled and cache_available())
+        self.sheet_pattern_edit.setEnabled(enabled)
+        self.add_source_sheet_check.setEnabled(enabled)
+        self.columns_edit.setEnabled(enabled)
+        self.filters_edit.setEnabled(enabled)
+        self.dedup_check.setEnabled(enabled)
+        self.sort_columns_edit.setEnabled(enabled)
+        self.sort_descending_check.setEnabled(enabled)
+        self.group_by_edit.setEnabled(enabled)
+        self.aggregations_edit.setEnabled(enabled)
+        self.join_check.setEnabled(enabled)
+        for widget in (self.join_keys_edit, self.right_keys_edit, self.join_type_combo, self.first_match_check):
+            widget.setEnabled(enabled and self.join_check.isChecked())
+        self.dedup_columns_edit.setEnabled(enabled and self.dedup_check.isChecked())
+        self.checkpoint_check.setEnabled(enabled)
+        self.append_check.setEnabled(enabled)
+        self.trace_check.setEnabled(enabled)
+        self.profile_check.setEnabled(enabled)
+        self.append_path_edit.setEnabled(enabled and self.append_check.isChecked())
+        self.append_browse_btn.setEnabled(enabled and self.append_check.isChecked())
         self.merge_btn.setEnabled(enabled)
+        self.cancel_btn.setEnabled(not enabled)
         self.file_list.setEnabled(enabled)
         
     def closeEvent(self, event):
@@ -444,17 +1080,22 @@ class ExcelMergerApp(QMainWindow):
             reply = QMessageBox.question(
                 self, 
                 "确认退出", 
-                "合并操作正在进行中，确定要退出吗?", 
+                "合并操作正在进行中，确定要取消合并并退出吗?", 
                 QMessageBox.Yes | QMessageBox.No
             )
             
             if reply == QMessageBox.Yes:
-                self.merger_thread.terminate()
+                # 等待合并在下一批数据处停止，并删除不完整的输出文件
+                self.merger_thread.cancel()
+                self.merger_thread.wait()
                 event.accept()
             else:
                 event.ignore()
         else:
             event.accept()
+        if event.isAccepted() and self.preflight_thread is not None:
+            # 只读取元数据，很快就会结束
+            self.preflight_thread.wait()
 
 
 # 创建图标生成函数
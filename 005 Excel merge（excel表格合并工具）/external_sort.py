@@ -0,0 +1,200 @@
+import os
+import heapq
+import pickle
+import shutil
+import datetime
+import tempfile
+
+from compact_types import CompactTyper
+
+DEFAULT_SORT_MEMORY_ROWS = 1000000  # 内存中最多缓存的行数，超过后排序并写出一个有序段
+DEFAULT_MERGE_FAN_IN = 64  # 归并时同时打开的有序段数，超过后先分组归并
+RUN_CHUNK_ROWS = 5000  # 有序段文件中每块的行数，归并时每个有序段只在内存中保留一块
+
+# 与Excel的排序规则一致：数字 < 日期 < 时间 < 文字 < 逻辑值，空单元格无论升序降序都排在最后；
+# 文本格式的数字按数字排序（同Excel排序时的"将任何类似数字的内容排序为数字"）
+_NUMBER, _DATE, _TIME, _TEXT, _BOOL, _EMPTY = range(6)
+
+
+def sort_value(value, descending=False):
+    """单元格的排序键：不同类型的值按类型分组比较，不会因为类型不同而报错"""
+    if value is None or value == '':
+        # 降序时整体反转，空单元格的类型序号取最小才能排在最后
+        return (-1,) if descending else (_EMPTY,)
+    if isinstance(value, bool):
+        return (_BOOL, value)
+    if isinstance(value, (int, float)):
+        return (_NUMBER, value)
+    if isinstance(value, datetime.datetime):
+        return (_DATE, value)
+    if isinstance(value, datetime.date):
+        return (_DATE, datetime.datetime.combine(value, datetime.time()))
+    if isinstance(value, datetime.time):
+        return (_TIME, value)
+    text = str(value)
+    if text[:1].isdigit() or text[:1] in ('-', '.'):
+        # 文本格式的数字（如导出文件中的序号、金额）按数字排序，否则 "10" 会排在 "9" 前面
+        try:
+            return (_NUMBER, float(text))
+        except ValueError:
+            pass
+    return (_TEXT, text)
+
+
+def _write_chunks(path, chunks):
+    with open(path, 'wb') as f:
+        for chunk in chunks:
+            pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _read_run(path):
+    """按块读回有序段中的行；紧凑类型的块还原为行"""
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                chunk = pickle.load(f)
+            except EOFError:
+                break
+            yield from (chunk if isinstance(chunk, list) else CompactTyper.decode(chunk))
+
+
+class ExternalSorter:
+    """按指定列排序任意多行的外部排序
+
+    行先缓存在内存中，超过 memory_rows 行或调用 spill() 时排序后写到临时文件（有序段），
+    最后对所有有序段做多路归并，逐批产出排序结果；内存中只保留每个有序段的一块数据。
+    有序段过多时先分组归并为较大的有序段。排序是稳定的，关键列相同的行保持原来的顺序。
+
+    指定 typer（CompactTyper）时，缓存的行按紧凑类型保存；排序时只还原排序列来计算排序键，
+    再按排序结果直接从紧凑数据中取行，有序段文件也按紧凑类型保存。
+    """
+
+    def __init__(self, key_columns, descending=False, memory_rows=DEFAULT_SORT_MEMORY_ROWS,
+                 spill_dir=None, max_fan_in=DEFAULT_MERGE_FAN_IN, typer=None):
+        self.key_columns = list(key_columns)  # 从0开始的列序号
+        self.descending = descending
+        self.memory_rows = memory_rows
+        self.spill_dir = spill_dir
+        self.max_fan_in = max(2, max_fan_in)
+        self.typer = typer
+        self.buffer = []  # 未指定 typer 时为行，否则为紧凑类型的批数据
+        self.buffered_rows = 0
+        self.runs = []  # 有序段文件路径，按写出顺序排列
+        self.work_dir = None
+        self.run_count = 0  # 已写出的有序段数（含分组归并产生的段），用于命名文件
+        self.rows = 0
+
+    @property
+    def on_disk(self):
+        return bool(self.runs)
+
+    def values_key(self, values):
+        """排序列的值（按排序列的顺序）对应的排序键"""
+        descending = self.descending
+        return tuple(sort_value(value, descending) for value in values)
+
+    def sort_key(self, row):
+        return self.values_key([row[col] if col < len(row) else None for col in self.key_columns])
+
+    def _key_columns(self, table):
+        """还原紧凑数据中的各排序列（第0列是每行的列数，数据从第1列开始）"""
+        return [CompactTyper.decode_column(table.column(col + 1)) if col + 1 < table.num_columns
+                else [None] * table.num_rows
+                for col in self.key_columns]
+
+    def add(self, rows):
+        """加入一批行"""
+        if not rows:
+            return
+        if self.typer is None:
+            self.buffer.extend(rows)
+        else:
+            self.buffer.append(self.typer.encode(rows))
+        self.rows += len(rows)
+        self.buffered_rows += len(rows)
+        if self.buffered_rows >= self.memory_rows:
+            self.spill()
+
+    def _new_run_path(self):
+        if self.work_dir is None:
+            self.work_dir = tempfile.mkdtemp(prefix='excel_sort_', dir=self.spill_dir)
+        self.run_count += 1
+        return os.path.join(self.work_dir, f'run_{self.run_count}.pkl')
+
+    def _sorted_chunks(self, chunk_rows):
+        """把内存中缓存的行排序，按 chunk_rows 行一块产出（行列表或紧凑类型的表）"""
+        buffer, self.buffer = self.buffer, []
+        self.buffered_rows = 0
+        if self.typer is None:
+            buffer.sort(key=self.sort_key, reverse=self.descending)
+            for start in range(0, len(buffer), chunk_rows):
+                yield buffer[start:start + chunk_rows]
+            return
+        table = self.typer.concat(buffer)
+        del buffer
+        # 只还原排序列计算排序键，得到行的顺序后再从紧凑数据中取行
+        keys = list(map(self.values_key, zip(*self._key_columns(table))))
+        order = sorted(range(len(keys)), key=keys.__getitem__, reverse=self.descending)
+        del keys
+        for start in range(0, len(order), chunk_rows):
+            yield table.take(order[start:start + chunk_rows])
+
+    def spill(self):
+        """把内存中的行排序后写出为一个有序段"""
+        if not self.buffered_rows:
+            return
+        path = self._new_run_path()
+        _write_chunks(path, self._sorted_chunks(RUN_CHUNK_ROWS))
+        self.runs.append(path)
+
+    def _merge(self, paths):
+        # heapq.merge 在关键列相同时先取前面的有序段，各段按写出顺序排列，因此归并结果仍是稳定的
+        return heapq.merge(*(_read_run(path) for path in paths), key=self.sort_key, reverse=self.descending)
+
+    def _reduce_runs(self):
+        """有序段超过 max_fan_in 个时，把最早的几段归并为一段，直到可以一次归并完"""
+        while len(self.runs) > self.max_fan_in:
+            group, rest = self.runs[:self.max_fan_in], self.runs[self.max_fan_in:]
+            path = self._new_run_path()
+            _write_chunks(path, self._chunk_rows(self._merge(group)))
+            for old_path in group:
+                os.remove(old_path)
+            # 归并出的段包含最早的行，放在最前面以保持稳定
+            self.runs = [path] + rest
+
+    @staticmethod
+    def _chunk_rows(rows, chunk_rows=RUN_CHUNK_ROWS):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def iter_batches(self, batch_size):
+        """按排序结果逐批产出行"""
+        if not self.runs:
+            # 全部数据都在内存中时直接排序
+            for chunk in self._sorted_chunks(batch_size):
+                yield chunk if self.typer is None else self.typer.decode(chunk)
+            return
+
+        self.spill()
+        self._reduce_runs()
+        yield from self._chunk_rows(self._merge(self.runs), batch_size)
+
+    def close(self):
+        """删除临时文件"""
+        self.buffer = []
+        self.runs = []
+        if self.work_dir is not None:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            self.work_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
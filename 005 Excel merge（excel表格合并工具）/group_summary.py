@@ -0,0 +1,212 @@
+import os
+import datetime
+from operator import itemgetter
+
+from column_filter import resolve_columns
+from csv_reader import convert_value
+from external_sort import sort_value
+
+SUMMARY_SHEET_NAME = '汇总'  # 输出xlsx时汇总写入合并结果中的这个工作表
+SUMMARY_FILE_SUFFIX = '_汇总'  # 输出CSV/Parquet时汇总保存为 合并结果_汇总.csv 等
+DEFAULT_MAX_GROUPS = 100000  # 分组数超过后停止汇总，避免按明细列（如发票号码）分组时占满内存
+# 汇总方式及其显示名称
+AGGREGATE_FUNCTIONS = {'sum': '合计', 'count': '计数', 'min': '最小值', 'max': '最大值'}
+FUNCTION_ALIASES = {'合计': 'sum', '求和': 'sum', '计数': 'count', '最小': 'min', '最小值': 'min',
+                    '最大': 'max', '最大值': 'max'}
+# 分组列可以按日期的年、月、日分组，如 "开票日期:月"
+KEY_PERIODS = {'year': '%Y', 'month': '%Y-%m', 'day': '%Y-%m-%d'}
+PERIOD_LABELS = {'year': '年', 'month': '月', 'day': '日'}
+PERIOD_ALIASES = {label: period for period, label in PERIOD_LABELS.items()}
+COUNT_HEADER = '行数'  # 不指定列的计数在汇总第一行中的列名
+PERIOD_CACHE_SIZE = 100000  # 缓存的 日期 -> 年/月/日 键，同一日期只格式化一次
+# 这些类型的两个值可以直接比较大小，与 sort_value 的顺序相同
+DIRECT_COMPARE_TYPES = (int, float, datetime.datetime)
+
+
+def summary_file_path(output_path):
+    """输出CSV/Parquet时汇总文件的路径，如 合并结果_汇总.csv"""
+    stem, ext = os.path.splitext(output_path)
+    return stem + SUMMARY_FILE_SUFFIX + ext
+
+
+def summary_owner(file_path):
+    """file_path 为汇总文件时返回它所属的合并结果的路径，否则返回 None"""
+    stem, ext = os.path.splitext(file_path)
+    if stem.endswith(SUMMARY_FILE_SUFFIX):
+        return stem[:-len(SUMMARY_FILE_SUFFIX)] + ext
+    return None
+
+
+def _split_spec(text):
+    """把 "名称:参数" 拆分为两部分，没有参数时第二部分为 None"""
+    name, _, argument = text.replace('：', ':').partition(':')
+    return name.strip(), argument.strip() or None
+
+
+def parse_group_keys(keys):
+    """解析分组列，如 ["公司", "开票日期:月"]，返回 [(列, 日期周期或None)]"""
+    parsed = []
+    for text in keys or []:
+        column, period = _split_spec(text)
+        if period is not None:
+            period = PERIOD_ALIASES.get(period, period.lower())
+            if period not in KEY_PERIODS:
+                raise ValueError(f"无法识别的日期分组方式: {text}（可用 年/月/日 或 year/month/day）")
+        parsed.append((column, period))
+    return parsed
+
+
+def parse_aggregations(aggregations):
+    """解析汇总方式，如 ["sum:金额", "count", "max:开票日期"]，返回 [(汇总方式, 列或None)]
+
+    count 不指定列时统计行数，指定列时统计该列非空单元格数；sum、min、max 必须指定列。
+    """
+    parsed = []
+    for text in aggregations or []:
+        function, column = _split_spec(text)
+        function = FUNCTION_ALIASES.get(function, function.lower())
+        if function not in AGGREGATE_FUNCTIONS:
+            raise ValueError(f"无法识别的汇总方式: {text}（可用 sum/count/min/max）")
+        if column is None and function != 'count':
+            raise ValueError(f"汇总方式 {text} 需要指定列，如 {function}:金额")
+        parsed.append((function, column))
+    return parsed
+
+
+def _number(value):
+    """求和时的数值：数字和文本格式的数字，其他值（文字、日期、逻辑值）不参与求和"""
+    if value.__class__ is int or value.__class__ is float:
+        return value
+    if isinstance(value, str) and (value[:1].isdigit() or value[:1] in ('-', '.')):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _period_key(value, date_format):
+    """按年、月、日分组时的键；不是日期的值原样作为键"""
+    if isinstance(value, str):
+        value = convert_value(value.strip())
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.strftime(date_format)
+    return value
+
+
+class GroupSummary:
+    """合并时逐批累计的分组汇总
+
+    每个分组只保存各汇总项的当前值（合计、计数、最小值、最大值），内存占用只与分组数有关，
+    合并结束后直接输出汇总表，不需要再读一遍合并结果。
+    """
+
+    def __init__(self, group_by, aggregations, header_row=None, max_groups=DEFAULT_MAX_GROUPS):
+        keys = parse_group_keys(group_by)
+        aggregates = parse_aggregations(aggregations) or [('count', None)]
+        header = [str(value).strip() if value is not None else '' for value in header_row or []]
+        key_indexes = resolve_columns([column for column, _ in keys], header)
+        aggregate_indexes = [resolve_columns([column], header)[0] if column is not None else None
+                             for _, column in aggregates]
+        self.keys = [(index, KEY_PERIODS[period] if period else None) for index, (_, period) in zip(key_indexes, keys)]
+        self.aggregates = [(function, index) for (function, _), index in zip(aggregates, aggregate_indexes)]
+        self.max_groups = max_groups
+        self.overflowed = False  # 分组数超过上限，已停止汇总
+        self.groups = {}  # 分组键 -> 各汇总项的当前值
+        self.rows = 0
+        self._periods = {}
+        # 不按日期分组时用 itemgetter 一次取出所有分组列
+        self._getter = itemgetter(*key_indexes) if key_indexes and not any(period for _, period in keys) else None
+        self._width = max(key_indexes, default=-1) + 1
+        # 汇总表的第一行：分组列的列名，然后是各汇总项，如 开票日期（月）、金额（合计）
+        self.header = []
+        for (column, period), index in zip(keys, key_indexes):
+            name = header[index] if index < len(header) and header[index] else column
+            self.header.append(f"{name}（{PERIOD_LABELS[period]}）" if period else name)
+        for (function, column), index in zip(aggregates, aggregate_indexes):
+            if column is None:
+                self.header.append(COUNT_HEADER)
+                continue
+            name = header[index] if index < len(header) and header[index] else column
+            self.header.append(f"{name}（{AGGREGATE_FUNCTIONS[function]}）")
+
+    def _new_state(self):
+        return [0 if function in ('sum', 'count') else None for function, _ in self.aggregates]
+
+    def _key(self, row):
+        if self._getter is not None and len(row) >= self._width:
+            key = self._getter(row)
+            key = key if len(self.keys) > 1 else (key,)
+            # 空文字与空单元格作为同一组
+            return key if '' not in key else tuple(None if value == '' else value for value in key)
+        width = len(row)
+        key = []
+        for index, date_format in self.keys:
+            value = row[index] if index < width else None
+            if value == '':
+                value = None
+            if value is not None and date_format is not None:
+                period = self._periods.get(value)
+                if period is None:
+                    if len(self._periods) >= PERIOD_CACHE_SIZE:
+                        self._periods.clear()
+                    period = self._periods[value] = _period_key(value, date_format)
+                value = period
+            key.append(value)
+        return tuple(key)
+
+    def add(self, rows):
+        """累计一批数据行（不含表头）；分组数超过上限时停止汇总并设置 overflowed"""
+        if self.overflowed:
+            return
+        groups = self.groups
+        aggregates = self.aggregates
+        for row in rows:
+            key = self._key(row)
+            state = groups.get(key)
+            if state is None:
+                if len(groups) >= self.max_groups:
+                    self.overflowed = True
+                    self.groups = {}
+                    return
+                state = groups[key] = self._new_state()
+            width = len(row)
+            for j, (function, index) in enumerate(aggregates):
+                if index is None:
+                    state[j] += 1
+                    continue
+                value = row[index] if index < width else None
+                if value is None or value == '':
+                    continue
+                if function == 'count':
+                    state[j] += 1
+                elif function == 'sum':
+                    number = _number(value)
+                    if number is not None:
+                        state[j] += number
+                else:
+                    current = state[j]
+                    if current is None:
+                        state[j] = value
+                    elif value.__class__ is current.__class__ and value.__class__ in DIRECT_COMPARE_TYPES:
+                        if value < current if function == 'min' else value > current:
+                            state[j] = value
+                    else:
+                        # 类型不同时按类型分组比较（数字 < 日期 < 文字），不会因为无法比较而出错
+                        order, current_order = sort_value(value), sort_value(current)
+                        if order < current_order if function == 'min' else order > current_order:
+                            state[j] = value
+        self.rows += len(rows)
+
+    def result_rows(self):
+        """汇总表的所有行（含第一行），按分组列排序"""
+        rows = [list(self.header)]
+        for key in sorted(self.groups, key=lambda key: tuple(sort_value(value) for value in key)):
+            row = list(key)
+            for (function, _), value in zip(self.aggregates, self.groups[key]):
+                if value.__class__ is float:
+                    # 逐行累加小数有二进制误差（如 0.1 + 0.2 得到 0.30000000000000004），与Excel一样保留15位有效数字
+                    value = float(f"{value:.15g}")
+                row.append(value)
+            rows.append(row)
+        return rows
@@ -0,0 +1,584 @@
+import os
+import gc
+import time
+import heapq
+import pickle
+import shutil
+import tempfile
+import threading
+from operator import itemgetter
+
+from merge_engine import (MergeError, MergeCancelled, DEFAULT_BATCH_SIZE, DEFAULT_MEMORY_BUDGET_GB,
+                          current_memory_gb, source_label, output_format_from_path)
+from memory_budget import MemoryBudgetController
+from merge_progress import ProgressTracker
+from column_filter import resolve_columns
+from xlsx_reader import open_reader, read_first_row, split_source, estimate_source_sizes
+from output_writers import choose_output_format, make_output_path, create_writer
+
+JOIN_TYPES = ('left', 'inner', 'right', 'full')
+BUILD_SIDES = ('auto', 'left', 'right')  # 用哪个表建哈希表：auto 为估算行数较少且能放进内存的一边
+DEFAULT_JOIN_MEMORY_ROWS = 1000000  # 构建侧在内存中最多保存的行数，超过后改为分区落盘
+DEFAULT_JOIN_PARTITIONS = 32  # 分区落盘时的分区数
+
+
+def normalize_key_value(value):
+    """关键列的值统一格式：去掉文字首尾空格，整数值的浮点数和文本格式的整数按整数比较
+
+    以0开头的编码（如 "007"）仍按文字比较。
+    """
+    if isinstance(value, str):
+        value = value.strip()
+        if value.isascii() and value.isdigit() and (value == '0' or value[0] != '0'):
+            return int(value)
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _dump_records(f, records):
+    if records:
+        pickle.dump(records, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _dump_chunks(f, records, chunk_rows=10000):
+    """分块写入记录，读回时每次只在内存中保留一块"""
+    for start in range(0, len(records), chunk_rows):
+        _dump_records(f, records[start:start + chunk_rows])
+
+
+def _load_records(path):
+    """按写入顺序读回分区文件中的记录"""
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                records = pickle.load(f)
+            except EOFError:
+                break
+            yield from records
+
+
+class HashJoin:
+    """构建侧（右表）建哈希表、探测侧（左表）流式查找的哈希连接
+
+    右表先读入内存中的哈希表；行数超过 memory_rows 或调用 spill() 后改为分区落盘：
+    右表和左表按关键列的哈希分到同样的分区文件中，最后逐个分区在内存中连接。
+    左表的每行带有序号，各分区的结果按序号归并，因此输出仍保持左表原来的顺序；
+    右连接/全连接中没有匹配的右表行按右表中的顺序追加在最后；右表行落盘时也带有序号，
+    分区模式下按序号归并，与内存模式的结果相同。
+    """
+
+    def __init__(self, left_keys, right_keys, left_width, right_width, join_type='left', first_match=True,
+                 memory_rows=DEFAULT_JOIN_MEMORY_ROWS, partitions=DEFAULT_JOIN_PARTITIONS, spill_dir=None):
+        if join_type not in JOIN_TYPES:
+            raise ValueError(f"不支持的关联方式: {join_type}")
+        self.left_keys = left_keys
+        self.right_keys = right_keys
+        self.left_width = left_width
+        self.join_type = join_type
+        self.first_match = first_match  # 只取第一个匹配的右表行（同VLOOKUP），否则输出所有匹配
+        self.memory_rows = memory_rows
+        self.partitions = partitions
+        self.spill_dir = spill_dir
+        # 输出右表中除关键列以外的列
+        self.right_values = [col for col in range(right_width) if col not in set(right_keys)]
+        self.table = {}  # 关键列的值 -> 右表行列表
+        self.build_list = []  # 内存模式下按读入顺序排列的右表行，用于按右表顺序输出未匹配的行
+        self.matched = set()  # 右连接/全连接时记录匹配过的关键列的值
+        self.build_rows = 0
+        self.matched_rows = 0  # 找到匹配的左表行数
+        self.next_seq = 0  # 下一个探测行的序号
+        self.too_large = False  # 构建侧放不进内存又不能落盘（只有 LeftBuildHashJoin 会设置）
+        self.work_dir = None
+        self._build_files = None
+        self._probe_files = None
+
+    @property
+    def partitioned(self):
+        return self._build_files is not None
+
+    def _key(self, row, columns):
+        return tuple(normalize_key_value(row[col]) if col < len(row) else None for col in columns)
+
+    def _partition(self, key):
+        return hash(key) % self.partitions
+
+    def _output(self, left_row, right_row):
+        """拼接一行结果：左表各列 + 右表除关键列以外的列"""
+        if right_row is None:
+            return left_row
+        if len(left_row) < self.left_width:
+            left_row = left_row + [None] * (self.left_width - len(left_row))
+        else:
+            left_row = left_row[:self.left_width]
+        return left_row + [right_row[col] if col < len(right_row) else None for col in self.right_values]
+
+    def _left_only(self, left_row):
+        """没有匹配的左表行：只输出左表的列，超出 left_width 的部分与有匹配的行一样截掉"""
+        return left_row[:self.left_width] if len(left_row) > self.left_width else left_row
+
+    def _right_only(self, right_row):
+        """没有匹配的右表行：左表的关键列填写右表关键列的值"""
+        left_row = [None] * self.left_width
+        for left_col, right_col in zip(self.left_keys, self.right_keys):
+            if right_col < len(right_row):
+                left_row[left_col] = right_row[right_col]
+        return self._output(left_row, right_row)
+
+    def add_build_rows(self, rows):
+        """加入一批右表行"""
+        if self.partitioned:
+            self._spill_build(rows)
+            return
+        table = self.table
+        for row in rows:
+            table.setdefault(self._key(row, self.right_keys), []).append(row)
+        self.build_list.extend(rows)
+        self.build_rows += len(rows)
+        if self.build_rows > self.memory_rows:
+            self.spill()
+
+    def spill(self):
+        """把内存中的哈希表分区写到磁盘，之后的右表行和左表行都按分区落盘"""
+        if self.partitioned or self.next_seq:
+            # 已经开始探测后不能再切换，保持内存中的哈希表
+            return
+        self.work_dir = tempfile.mkdtemp(prefix='excel_join_', dir=self.spill_dir)
+        self._build_files = [open(os.path.join(self.work_dir, f'build_{p}.pkl'), 'wb')
+                             for p in range(self.partitions)]
+        rows, self.build_list, self.table = self.build_list, [], {}
+        self.build_rows = 0
+        self._spill_build(rows)
+
+    def _spill_build(self, rows):
+        buffers = [[] for _ in range(self.partitions)]
+        for seq, row in enumerate(rows, self.build_rows):
+            key = self._key(row, self.right_keys)
+            buffers[self._partition(key)].append((seq, key, row))
+        for f, records in zip(self._build_files, buffers):
+            _dump_records(f, records)
+        self.build_rows += len(rows)
+
+    def _match(self, key, table, matched):
+        """查找匹配的右表行；关键列全部为空的行不参与匹配"""
+        if all(value is None or value == '' for value in key):
+            return None
+        rows = table.get(key)
+        if rows and matched is not None:
+            matched.add(key)
+        return rows
+
+    def _join_rows(self, left_row, key, table, matched):
+        rows = self._match(key, table, matched)
+        if rows:
+            self.matched_rows += 1
+            if self.first_match:
+                rows = rows[:1]
+            return [self._output(left_row, right_row) for right_row in rows]
+        if self.join_type in ('left', 'full'):
+            return [self._left_only(left_row)]
+        return []
+
+    def probe(self, rows):
+        """用一批左表行探测哈希表；内存模式返回结果行，分区模式先落盘、返回空列表"""
+        track = self.matched if self.join_type in ('right', 'full') else None
+        if not self.partitioned:
+            result = []
+            for row in rows:
+                result.extend(self._join_rows(row, self._key(row, self.left_keys), self.table, track))
+            self.next_seq += len(rows)
+            return result
+
+        if self._probe_files is None:
+            for f in self._build_files:
+                f.close()
+            self._probe_files = [open(os.path.join(self.work_dir, f'probe_{p}.pkl'), 'wb')
+                                 for p in range(self.partitions)]
+        buffers = [[] for _ in range(self.partitions)]
+        for row in rows:
+            key = self._key(row, self.left_keys)
+            buffers[self._partition(key)].append((self.next_seq, key, row))
+            self.next_seq += 1
+        for f, records in zip(self._probe_files, buffers):
+            _dump_records(f, records)
+        return []
+
+    def _unmatched_right(self, rows, matched):
+        """按右表的顺序产出没有匹配的右表行的结果行，rows 为 (序号, 右表行)"""
+        for seq, row in rows:
+            if self._key(row, self.right_keys) not in matched:
+                yield seq, self._right_only(row)
+
+    def finish(self):
+        """产出剩余的结果行：分区模式下逐个分区连接并按左表顺序归并；右连接/全连接追加未匹配的右表行"""
+        include_right = self.join_type in ('right', 'full')
+        if not self.partitioned:
+            if include_right:
+                yield from (row for _, row in self._unmatched_right(enumerate(self.build_list), self.matched))
+            return
+
+        for f in self._build_files + (self._probe_files or []):
+            f.close()
+        run_paths = []
+        tail_paths = []
+        for p in range(self.partitions):
+            # 每次只在内存中保留一个分区的右表
+            table = {}
+            build_list = []  # (序号, 右表行)，按右表的顺序排列
+            for seq, key, row in _load_records(os.path.join(self.work_dir, f'build_{p}.pkl')):
+                table.setdefault(key, []).append(row)
+                if include_right:
+                    build_list.append((seq, row))
+            matched = set() if include_right else None
+            probe_path = os.path.join(self.work_dir, f'probe_{p}.pkl')
+            if os.path.exists(probe_path):
+                run_path = os.path.join(self.work_dir, f'run_{p}.pkl')
+                with open(run_path, 'wb') as run:
+                    records = []
+                    for seq, key, row in _load_records(probe_path):
+                        records.extend((seq, out) for out in self._join_rows(row, key, table, matched))
+                        if len(records) >= 10000:
+                            _dump_records(run, records)
+                            records = []
+                    _dump_records(run, records)
+                os.remove(probe_path)
+                run_paths.append(run_path)
+            if include_right:
+                tail_path = os.path.join(self.work_dir, f'right_only_{p}.pkl')
+                with open(tail_path, 'wb') as tail:
+                    _dump_records(tail, list(self._unmatched_right(build_list, matched)))
+                tail_paths.append(tail_path)
+            del table, build_list
+
+        # 各分区的结果都按左表序号排列，归并后恢复左表原来的顺序
+        for _, row in heapq.merge(*(_load_records(path) for path in run_paths), key=itemgetter(0)):
+            yield row
+        # 未匹配的右表行按右表行的序号归并，恢复右表原来的顺序
+        for _, row in heapq.merge(*(_load_records(path) for path in tail_paths), key=itemgetter(0)):
+            yield row
+
+    def close(self):
+        for f in (self._build_files or []) + (self._probe_files or []):
+            f.close()
+        if self.work_dir is not None:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            self.work_dir = None
+        self.table = {}
+        self.build_list = []
+
+
+class LeftBuildHashJoin(HashJoin):
+    """左表较小时使用的哈希连接：左表建哈希表，右表流式探测，输出与 HashJoin 完全相同
+
+    探测时得到的结果带有左表行的序号，超过 memory_rows 行时按序号排序后写到临时文件（有序段），
+    最后把各有序段和没有匹配的左表行按序号归并，恢复左表原来的顺序；没有匹配的右表行按右表的顺序追加在最后。
+    左表超过 memory_rows 行或在读入左表时内存接近预算，设置 too_large，由调用方改用右表建哈希表重新关联。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.left_rows = []  # 按读入顺序排列的左表行，下标即序号
+        self.matched_left = set()  # 找到匹配的左表行的序号
+        self.results = []  # (左表行序号, 结果行)
+        self.tail = []  # 没有匹配的右表行的结果行
+        self.too_large = False  # 左表在内存中放不下
+        self._run_paths = []
+        self._tail_path = None
+        self._tail_file = None
+
+    @property
+    def partitioned(self):
+        return False
+
+    def add_build_rows(self, rows):
+        """加入一批左表行"""
+        table = self.table
+        seq = len(self.left_rows)
+        for row in rows:
+            table.setdefault(self._key(row, self.left_keys), []).append(seq)
+            seq += 1
+        self.left_rows.extend(rows)
+        if len(self.left_rows) > self.memory_rows:
+            self.too_large = True
+
+    def spill(self):
+        """内存接近预算时：读入左表阶段标记为放不下，探测阶段把已有的结果写到临时文件"""
+        if not self.next_seq:
+            self.too_large = True
+            return
+        if self.work_dir is None:
+            self.work_dir = tempfile.mkdtemp(prefix='excel_join_', dir=self.spill_dir)
+        if self.results:
+            # 稳定排序，同一左表行的多个结果保持右表的顺序
+            self.results.sort(key=itemgetter(0))
+            path = os.path.join(self.work_dir, f'run_{len(self._run_paths)}.pkl')
+            with open(path, 'wb') as f:
+                _dump_chunks(f, self.results)
+            self._run_paths.append(path)
+            self.results = []
+        if self.tail:
+            if self._tail_file is None:
+                self._tail_path = os.path.join(self.work_dir, 'right_only.pkl')
+                self._tail_file = open(self._tail_path, 'wb')
+            _dump_chunks(self._tail_file, self.tail)
+            self.tail = []
+
+    def probe(self, rows):
+        """用一批右表行探测左表的哈希表；结果按左表的顺序在 finish() 中产出，这里返回空列表"""
+        include_right = self.join_type in ('right', 'full')
+        left_rows = self.left_rows
+        matched_left = self.matched_left
+        for row in rows:
+            seqs = self._match(self._key(row, self.right_keys), self.table, None)
+            if seqs:
+                for seq in seqs:
+                    if self.first_match and seq in matched_left:
+                        continue
+                    matched_left.add(seq)
+                    self.results.append((seq, self._output(left_rows[seq], row)))
+            elif include_right:
+                self.tail.append(self._right_only(row))
+        self.next_seq += len(rows)
+        self.matched_rows = len(matched_left)
+        if len(self.results) + len(self.tail) > self.memory_rows:
+            self.spill()
+        return []
+
+    def finish(self):
+        """按左表的顺序产出结果行和没有匹配的左表行，再按右表的顺序产出没有匹配的右表行"""
+        self.results.sort(key=itemgetter(0))
+        # 有序段按写出顺序排列，序号相同时 heapq.merge 先取前面的段，同一左表行的结果保持右表的顺序
+        runs = [_load_records(path) for path in self._run_paths] + [self.results]
+        if self.join_type in ('left', 'full'):
+            runs.append((seq, self._left_only(row)) for seq, row in enumerate(self.left_rows)
+                        if seq not in self.matched_left)
+        for _, row in heapq.merge(*runs, key=itemgetter(0)):
+            yield row
+        if self._tail_file is not None:
+            self._tail_file.close()
+            self._tail_file = None
+            yield from _load_records(self._tail_path)
+        yield from self.tail
+
+    def close(self):
+        if self._tail_file is not None:
+            self._tail_file.close()
+            self._tail_file = None
+        self.left_rows = []
+        self.results = []
+        self.tail = []
+        super().close()
+
+
+class ExcelJoinEngine:
+    """按关键列关联两个工作簿（类似VLOOKUP）：左表逐批读取并查找右表中匹配的行
+
+    join_type：left（保留左表所有行）/ inner（只保留匹配的行）/ right（保留右表所有行）/ full（保留两边所有行）
+    build_side：用哪个表建哈希表，auto 时按估算的行数选较小的一边（左表须放得进内存），输出的行顺序不受影响。
+    左右两个来源都可以是文件路径或 (文件路径, 工作表)，第一行为列名。回调函数同 ExcelMergeEngine。
+    """
+
+    def __init__(self, left_source, right_source, left_keys, right_keys=None, join_type='left', first_match=True,
+                 batch_size=DEFAULT_BATCH_SIZE, memory_budget_gb=DEFAULT_MEMORY_BUDGET_GB,
+                 memory_rows=DEFAULT_JOIN_MEMORY_ROWS, build_side='auto', output_format='auto', output_path=None,
+                 on_progress=None, on_memory=None, on_throttle=None, on_throughput=None):
+        self.left_source = left_source
+        self.right_source = right_source
+        self.left_keys = left_keys  # 左表关键列（列名或列字母）
+        self.right_keys = right_keys or left_keys  # 右表关键列，默认与左表同名
+        self.join_type = join_type
+        self.first_match = first_match
+        self.batch_size = batch_size
+        self.memory_budget_gb = memory_budget_gb
+        self.memory_rows = memory_rows
+        self.build_side = build_side
+        self.output_format = output_format
+        self.output_path = output_path
+        self.on_progress = on_progress
+        self.on_memory = on_memory
+        self.on_throttle = on_throttle
+        self.on_throughput = on_throughput
+        self.memory_budget = None
+        self.total_rows = 0
+        self.matched_rows = 0
+        self.spilled = False  # 右表是否因为内存不足而分区落盘
+        self.built_side = None  # 实际用来建哈希表的一边：left / right
+        self.stage_times = {}  # 各阶段耗时（秒）：build / probe / finalize
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        """请求取消关联（可从其他线程调用），在下一批数据处停止"""
+        self._cancel_event.set()
+
+    def _check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise MergeCancelled()
+
+    def _add_stage_time(self, stage, started):
+        self.stage_times[stage] = self.stage_times.get(stage, 0.0) + time.perf_counter() - started
+
+    def resolve_output(self, estimated_rows):
+        output_format = self.output_format
+        if self.output_path:
+            if output_format == 'auto':
+                output_format = output_format_from_path(self.output_path)
+            return output_format, self.output_path
+        output_format = choose_output_format(output_format, estimated_rows)
+        left_path = split_source(self.left_source)[0]
+        return output_format, make_output_path(os.path.dirname(os.path.abspath(left_path)), output_format,
+                                               base_name="关联结果")
+
+    def run(self):
+        """执行关联，返回输出文件路径"""
+        if self.join_type not in JOIN_TYPES:
+            raise MergeError(f"不支持的关联方式: {self.join_type}")
+        if self.build_side not in BUILD_SIDES:
+            raise MergeError(f"不支持的建表方式: {self.build_side}")
+        if not self.left_keys:
+            raise MergeError("请指定关联的关键列")
+        self.stage_times = {}
+        try:
+            try:
+                left_header = read_first_row(*split_source(self.left_source))
+                right_header = read_first_row(*split_source(self.right_source))
+            except Exception as e:
+                raise MergeError(f"读取文件第一行时出错: {str(e)}")
+            try:
+                left_keys = resolve_columns(self.left_keys, left_header)
+            except ValueError as e:
+                raise MergeError(f"{source_label(self.left_source)}: {str(e)}")
+            try:
+                right_keys = resolve_columns(self.right_keys, right_header)
+            except ValueError as e:
+                raise MergeError(f"{source_label(self.right_source)}: {str(e)}")
+            if len(left_keys) != len(right_keys):
+                raise MergeError("左表和右表的关键列数量不一致")
+
+            sizes = estimate_source_sizes([self.right_source, self.left_source])
+            output_format, output_path = self.resolve_output(sizes[1][0])
+            self.join(output_format, output_path, left_header, right_header, left_keys, right_keys, sizes)
+            return output_path
+        finally:
+            gc.collect()
+
+    def _iter_batches(self, source):
+        with open_reader(*split_source(source)) as reader:
+            yield from reader.iter_batches(self.batch_size)
+
+    def use_left_build(self, sizes):
+        """是否用左表建哈希表：左表估算的行数（无法估算时按字节数）比右表少，且不超过内存中的行数上限"""
+        if self.build_side != 'auto':
+            return self.build_side == 'left'
+        (right_rows, right_bytes), (left_rows, left_bytes) = sizes
+        if left_rows > self.memory_rows:
+            return False
+        if left_rows and right_rows:
+            return left_rows < right_rows
+        return left_bytes < right_bytes
+
+    def _iter_data_batches(self, source):
+        """逐批读取数据行，跳过第一行（列名）"""
+        first_batch = True
+        for batch in self._iter_batches(source):
+            self._check_cancelled()
+            if first_batch:
+                batch = batch[1:]
+                first_batch = False
+            yield batch
+
+    def join(self, output_format, output_path, left_header, right_header, left_keys, right_keys, sizes):
+        self.memory_budget = MemoryBudgetController(self.memory_budget_gb, self.batch_size, self.on_throttle)
+        writer = create_writer(output_format, output_path, True)
+        self.total_rows = 0
+        # 关键列可以用列字母指定到列名行以外，左表的宽度须包含关键列，右表独有的行才能填写关键列的值；
+        # 列名行补齐到同样的宽度，右表的列名与数据列对齐
+        left_width = max(len(left_header), max(left_keys) + 1)
+        left_header = list(left_header) + [None] * (left_width - len(left_header))
+        args = (left_keys, right_keys, left_width, len(right_header), self.join_type, self.first_match,
+                self.memory_rows)
+        try:
+            finished = False
+            if self.use_left_build(sizes):
+                self.built_side = 'left'
+                finished = self._hash_join(LeftBuildHashJoin(*args), writer, left_header, right_header, sizes)
+                # 左表比估算的多、放不进内存时，改为用右表建哈希表重新关联（此时还没有写出任何行）
+            if not finished:
+                self.built_side = 'right'
+                self._hash_join(HashJoin(*args), writer, left_header, right_header, sizes)
+            writer.close()
+        except BaseException:
+            # 关联失败、取消或被中断时删除不完整的输出文件
+            writer.discard()
+            raise
+
+    def _hash_join(self, hash_join, writer, left_header, right_header, sizes):
+        """用 hash_join 执行一次关联：读入构建侧、流式读取探测侧，结果写入 writer
+
+        构建侧为左表（LeftBuildHashJoin）且左表放不进内存时，在写出任何行之前返回 False。
+        """
+        build_left = isinstance(hash_join, LeftBuildHashJoin)
+        # sizes 按 [右表, 左表] 排列
+        build_source, build_index = (self.left_source, 1) if build_left else (self.right_source, 0)
+        probe_source, probe_index = (self.right_source, 0) if build_left else (self.left_source, 1)
+        progress = ProgressTracker(sizes, self.on_progress, self.on_throughput)
+
+        def write(rows):
+            writer.write_rows(rows)
+            self.total_rows += len(rows)
+
+        def after_batch(rows):
+            notify = progress.advance(len(rows))
+            # 内存接近预算时把构建侧分区落盘（或把已有结果写到临时文件）、刷出输出缓冲
+            if self.memory_budget.check():
+                hash_join.spill()
+                writer.flush()
+                gc.collect()
+            if notify and self.on_memory is not None:
+                self.on_memory(current_memory_gb())
+
+        try:
+            # 构建：读入较小的一边（第一行为列名）
+            started = time.perf_counter()
+            progress.start_source(build_index)
+            batches = self._iter_data_batches(build_source)
+            for batch in batches:
+                hash_join.add_build_rows(batch)
+                after_batch(batch)
+                if hash_join.too_large:
+                    batches.close()
+                    return False
+            progress.finish_source()
+            self.spilled = hash_join.partitioned
+            self._add_stage_time('build', started)
+
+            # 探测：逐批读取另一边并查找匹配的行
+            started = time.perf_counter()
+            progress.start_source(probe_index)
+            write([list(left_header) + [right_header[col] for col in hash_join.right_values]])
+            for batch in self._iter_data_batches(probe_source):
+                write(hash_join.probe(batch))
+                after_batch(batch)
+            progress.finish_source()
+            self._add_stage_time('probe', started)
+
+            # 分区模式下逐个分区连接，左表建哈希表时按左表的顺序归并结果；追加未匹配的右表行
+            started = time.perf_counter()
+            rows = []
+            for row in hash_join.finish():
+                rows.append(row)
+                if len(rows) >= self.batch_size:
+                    self._check_cancelled()
+                    write(rows)
+                    rows = []
+            write(rows)
+            self.matched_rows = hash_join.matched_rows
+            self._add_stage_time('finalize', started)
+            progress.finish()
+            return True
+        finally:
+            hash_join.close()
@@ -0,0 +1,85 @@
+import os
+
+import psutil
+
+SOFT_LIMIT_RATIO = 0.8   # 超过预算的80%开始限流：缩小批大小、刷出缓冲数据
+HARD_LIMIT_RATIO = 0.95  # 超过预算的95%暂停派发新的解析任务
+RESUME_RATIO = 0.7       # 回落到预算的70%以下时恢复正常
+MIN_BATCH_SIZE = 500     # 限流时批大小的下限
+
+NORMAL = 'normal'
+THROTTLED = 'throttled'
+PAUSED = 'paused'
+
+
+class MemoryBudgetController:
+    """把内存监控变成反压：内存接近预算时主动让合并变慢，而不是内存溢出
+
+    统计主进程和所有解析子进程的RSS总和：
+    - 超过软上限：批大小减半（不低于 MIN_BATCH_SIZE），并要求调用方把缓冲数据刷到磁盘
+    - 超过硬上限：暂停派发新的解析任务，直到内存回落
+    - 回落到恢复线以下：逐步恢复批大小，重新开始派发
+    """
+
+    def __init__(self, budget_gb, batch_size, on_event=None):
+        self.budget_bytes = budget_gb * 1024 * 1024 * 1024
+        self.max_batch_size = batch_size
+        self.batch_size = batch_size
+        self.on_event = on_event  # on_event(message)：限流状态变化时通知
+        self.state = NORMAL
+        self.process = psutil.Process(os.getpid())
+        self.budget_hits = 0       # 超过软上限的次数
+        self.throttle_events = 0   # 缩小批大小 / 暂停派发的次数
+        self.peak_bytes = 0
+
+    @property
+    def paused(self):
+        return self.state == PAUSED
+
+    def current_bytes(self):
+        """主进程及其子进程的RSS总和"""
+        total = self.process.memory_info().rss
+        for child in self.process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    def _notify(self, message):
+        if self.on_event is not None:
+            self.on_event(message)
+
+    def check(self):
+        """检查内存并调整限流状态，返回 True 表示调用方应刷出缓冲数据"""
+        used = self.current_bytes()
+        self.peak_bytes = max(self.peak_bytes, used)
+        used_gb = used / 1024 / 1024 / 1024
+        budget_gb = self.budget_bytes / 1024 / 1024 / 1024
+
+        if used >= self.budget_bytes * SOFT_LIMIT_RATIO:
+            self.budget_hits += 1
+            new_batch_size = max(MIN_BATCH_SIZE, self.batch_size // 2)
+            if new_batch_size != self.batch_size:
+                self.batch_size = new_batch_size
+                self.throttle_events += 1
+                self._notify(f"内存 {used_gb:.2f}/{budget_gb:.2f} GB 接近预算，批大小降为 {self.batch_size} 行")
+            if used >= self.budget_bytes * HARD_LIMIT_RATIO:
+                if self.state != PAUSED:
+                    self.throttle_events += 1
+                    self._notify(f"内存 {used_gb:.2f}/{budget_gb:.2f} GB 达到预算上限，暂停新的解析任务")
+                self.state = PAUSED
+            elif self.state == NORMAL:
+                self.state = THROTTLED
+            return True
+
+        if used < self.budget_bytes * RESUME_RATIO and self.state != NORMAL:
+            # 逐步恢复批大小，避免马上再次触发限流
+            self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+            if self.batch_size == self.max_batch_size:
+                self.state = NORMAL
+                self._notify(f"内存回落到 {used_gb:.2f} GB，恢复正常合并速度")
+            elif self.state == PAUSED:
+                self.state = THROTTLED
+                self._notify(f"内存回落到 {used_gb:.2f} GB，恢复解析任务")
+        return False
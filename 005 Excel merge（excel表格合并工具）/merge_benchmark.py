@@ -0,0 +1,321 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import zipfile
+import logging
+import platform
+import argparse
+import datetime
+import tempfile
+import threading
+from xml.sax.saxutils import escape
+
+import psutil
+
+from merge_engine import ExcelMergeEngine, DEFAULT_BATCH_SIZE, DEFAULT_WORKERS
+from output_writers import XLSX_WRITERS
+from merge_manifest import manifest_path
+from xlsx_writer import DEFAULT_WRITE_WORKERS
+
+# 基准场景：文件数、每个文件的行数、列数
+SCENARIOS = {
+    'many_small': {'files': 200, 'rows': 2000, 'cols': 12},
+    'few_huge': {'files': 3, 'rows': 400000, 'cols': 20},
+    'wide': {'files': 10, 'rows': 5000, 'cols': 300},
+}
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/sharedStrings.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+    '</Types>'
+)
+ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>'
+)
+WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" '
+    'Target="sharedStrings.xml"/></Relationships>'
+)
+SHEET_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<dimension ref="A1:{last_cell}"/><sheetData>'
+)
+
+
+def column_letter(index):
+    """从0开始的列序号转换为列字母"""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def generate_workbook(path, rows, cols, string_ratio=0.5, shared_string_ratio=0.8,
+                      distinct_strings=1000, seed=0):
+    """生成合成的xlsx测试文件
+
+    - rows / cols：数据行数和列数（另有一行表头）
+    - string_ratio：文本列占全部列的比例，其余为数值列
+    - shared_string_ratio：文本单元格中取自共享字符串表（重复值）的比例，其余为唯一的内联字符串
+    - distinct_strings：共享字符串表的大小
+    """
+    rng = random.Random(seed)
+    letters = [column_letter(i) for i in range(cols)]
+    string_cols = set(rng.sample(range(cols), round(cols * string_ratio)))
+    pool = [f"值{i:05d}" for i in range(distinct_strings)]
+    header_offset = distinct_strings  # 表头单元格放在共享字符串表末尾
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', CONTENT_TYPES)
+        archive.writestr('_rels/.rels', ROOT_RELS)
+        archive.writestr('xl/workbook.xml', WORKBOOK)
+        archive.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS)
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as f:
+            f.write(SHEET_HEADER.format(last_cell=f"{letters[-1]}{rows + 1}").encode('utf-8'))
+            header = ''.join(f'<c r="{letter}1" t="s"><v>{header_offset + i}</v></c>'
+                             for i, letter in enumerate(letters))
+            f.write(f'<row r="1">{header}</row>'.encode('utf-8'))
+
+            for r in range(2, rows + 2):
+                cells = []
+                for c, letter in enumerate(letters):
+                    if c in string_cols:
+                        if rng.random() < shared_string_ratio:
+                            cells.append(f'<c r="{letter}{r}" t="s"><v>{rng.randrange(distinct_strings)}</v></c>')
+                        else:
+                            cells.append(f'<c r="{letter}{r}" t="inlineStr"><is><t>唯一{r}_{c}_{rng.random():.6f}</t></is></c>')
+                    else:
+                        cells.append(f'<c r="{letter}{r}"><v>{rng.random() * 10000:.2f}</v></c>')
+                f.write(f'<row r="{r}">{"".join(cells)}</row>'.encode('utf-8'))
+            f.write(b'</sheetData></worksheet>')
+
+        strings = pool + [f"列{i + 1}" for i in range(cols)]
+        sst = ''.join(f'<si><t>{escape(value)}</t></si>' for value in strings)
+        archive.writestr(
+            'xl/sharedStrings.xml',
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            f'count="{len(strings)}" uniqueCount="{len(strings)}">{sst}</sst>'
+        )
+
+
+def prepare_scenario(name, data_dir, scale=1.0, string_ratio=0.5, shared_string_ratio=0.8):
+    """生成（或复用已生成的）场景测试文件，返回文件列表"""
+    spec = SCENARIOS[name]
+    files = max(1, round(spec['files'] * scale)) if name == 'many_small' else spec['files']
+    rows = spec['rows'] if name == 'many_small' else max(1, round(spec['rows'] * scale))
+    scenario_dir = os.path.join(
+        data_dir, f"{name}_f{files}_r{rows}_c{spec['cols']}_s{string_ratio}_sh{shared_string_ratio}")
+    os.makedirs(scenario_dir, exist_ok=True)
+
+    file_list = []
+    for i in range(files):
+        path = os.path.join(scenario_dir, f"input_{i:04d}.xlsx")
+        if not os.path.exists(path):
+            generate_workbook(path + '.tmp', rows, spec['cols'], string_ratio, shared_string_ratio, seed=i)
+            os.replace(path + '.tmp', path)
+        file_list.append(path)
+    return file_list
+
+
+class PeakMemorySampler:
+    """后台线程定期采样内存，记录主进程及其子进程（解析进程）的峰值RSS"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.process = psutil.Process(os.getpid())
+        self.peak_main = 0
+        self.peak_total = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                main_rss = self.process.memory_info().rss
+                total_rss = main_rss
+                for child in self.process.children(recursive=True):
+                    try:
+                        total_rss += child.memory_info().rss
+                    except psutil.Error:
+                        pass
+            except psutil.Error:
+                continue
+            self.peak_main = max(self.peak_main, main_rss)
+            self.peak_total = max(self.peak_total, total_rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_scenario(name, file_list, output_dir, workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE,
+                 output_format='xlsx', xlsx_writer='parallel', write_workers=DEFAULT_WRITE_WORKERS):
+    """运行一次合并并返回测量结果"""
+    input_bytes = sum(os.path.getsize(path) for path in file_list)
+    output_path = os.path.join(output_dir, f"{name}_output.{output_format}")
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+    engine = ExcelMergeEngine(file_list, batch_size=batch_size, workers=workers,
+                              output_format=output_format, output_path=output_path,
+                              xlsx_writer=xlsx_writer, write_workers=write_workers,
+                              on_header_mismatch=lambda names: True)
+    with PeakMemorySampler() as sampler:
+        started = time.perf_counter()
+        engine.run()
+        elapsed = time.perf_counter() - started
+
+    result = {
+        'scenario': name,
+        'files': len(file_list),
+        'rows': engine.total_rows,
+        'input_mb': round(input_bytes / 1024 / 1024, 3),
+        'output_mb': round(os.path.getsize(output_path) / 1024 / 1024, 3),
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(engine.total_rows / elapsed, 1),
+        'mb_per_second': round(input_bytes / 1024 / 1024 / elapsed, 3),
+        'peak_rss_mb': round(sampler.peak_main / 1024 / 1024, 1),
+        'peak_rss_with_workers_mb': round(sampler.peak_total / 1024 / 1024, 1),
+        'stage_seconds': {stage: round(seconds, 3) for stage, seconds in engine.stage_times.items()},
+    }
+    # 合并结果旁边还有合并清单
+    for path in (output_path, manifest_path(output_path)):
+        if os.path.exists(path):
+            os.remove(path)
+    return result
+
+
+def compare_results(baseline, current):
+    """对比两次基准结果，返回每个场景的耗时与峰值内存变化"""
+    baseline_runs = {run['scenario']: run for run in baseline['runs']}
+    lines = []
+    for run in current['runs']:
+        old = baseline_runs.get(run['scenario'])
+        if old is None:
+            continue
+        # 写入耗时包括写入阶段和最后保存文件的阶段
+        old_write = old['stage_seconds'].get('write', 0) + old['stage_seconds'].get('finalize', 0)
+        write = run['stage_seconds'].get('write', 0) + run['stage_seconds'].get('finalize', 0)
+        lines.append(
+            f"{run['scenario']}: 行/秒 {old['rows_per_second']} -> {run['rows_per_second']} "
+            f"({run['rows_per_second'] / old['rows_per_second']:.2f}x)，"
+            f"写入 {old_write:.2f}秒 -> {write:.2f}秒，"
+            f"峰值内存 {old['peak_rss_mb']}MB -> {run['peak_rss_mb']}MB"
+        )
+    return lines
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m merge_benchmark", description="Excel合并性能基准测试")
+    parser.add_argument("-s", "--scenario", action="append", choices=list(SCENARIOS),
+                        help="要运行的场景，可重复指定，默认运行全部场景")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="数据规模系数（many_small缩放文件数，其余场景缩放行数），默认1.0")
+    parser.add_argument("--string-ratio", type=float, default=0.5, help="文本列比例，默认0.5")
+    parser.add_argument("--shared-string-ratio", type=float, default=0.8,
+                        help="文本单元格中使用共享字符串的比例，默认0.8")
+    parser.add_argument("-j", "--workers", type=int, default=DEFAULT_WORKERS, help="并行解析进程数")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="每批读取的行数")
+    parser.add_argument("-f", "--format", choices=['xlsx', 'csv', 'parquet'], default='xlsx', help="输出格式")
+    parser.add_argument("--xlsx-writer", choices=XLSX_WRITERS, default='parallel',
+                        help="xlsx输出的写入方式：parallel（多进程并行序列化）或 openpyxl，默认parallel")
+    parser.add_argument("--write-workers", type=int, default=DEFAULT_WRITE_WORKERS, help="并行写入xlsx的进程数")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "excel_merge_bench"),
+                        help="生成的测试文件存放目录（已存在的文件会被复用）")
+    parser.add_argument("-o", "--output", help="结果JSON的保存路径，默认 bench_results/<时间>.json")
+    parser.add_argument("--compare", help="与之前保存的结果JSON对比")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    scenarios = args.scenario or list(SCENARIOS)
+
+    report = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': {
+            'scale': args.scale,
+            'string_ratio': args.string_ratio,
+            'shared_string_ratio': args.shared_string_ratio,
+            'workers': args.workers,
+            'batch_size': args.batch_size,
+            'format': args.format,
+            'xlsx_writer': args.xlsx_writer,
+            'write_workers': args.write_workers,
+        },
+        'runs': [],
+    }
+
+    output_dir = tempfile.mkdtemp(prefix='excel_merge_bench_out_')
+    for name in scenarios:
+        logging.info(f"准备场景数据: {name}")
+        file_list = prepare_scenario(name, args.data_dir, args.scale, args.string_ratio, args.shared_string_ratio)
+        logging.info(f"运行场景: {name}（{len(file_list)} 个文件）")
+        result = run_scenario(name, file_list, output_dir, args.workers, args.batch_size, args.format,
+                              args.xlsx_writer, args.write_workers)
+        logging.info(
+            f"{name}: {result['rows']} 行，{result['seconds']} 秒，{result['rows_per_second']} 行/秒，"
+            f"{result['mb_per_second']} MB/秒，峰值内存 {result['peak_rss_mb']} MB，"
+            f"各阶段耗时 {result['stage_seconds']}"
+        )
+        report['runs'].append(result)
+    shutil.rmtree(output_dir, ignore_errors=True)
+
+    output_path = args.output or os.path.join(
+        "bench_results", f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logging.info(f"结果已保存: {output_path}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        for line in compare_results(baseline, report):
+            logging.info(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import os
+import json
+import pickle
+import shutil
+import hashlib
+
+CHECKPOINT_VERSION = 1  # 检查点格式变化时加一，旧检查点自动失效
+DEFAULT_CHECKPOINT_DIR = os.path.join(os.path.expanduser('~'), '.excel_merger_checkpoints')
+MANIFEST_NAME = 'manifest.json'
+
+
+def file_fingerprint(file_path):
+    """文件的大小和修改时间，用于判断已完成的文件在中断后是否被修改过"""
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def source_key(source):
+    """来源的标识：[文件绝对路径, 工作表名称]，整个文件作为来源时工作表为 None"""
+    if isinstance(source, tuple):
+        return [os.path.abspath(source[0]), source[1]]
+    return [os.path.abspath(source), None]
+
+
+class MergeCheckpoint:
+    """合并进度检查点
+
+    每个合并单元（文件或工作表）处理完成后，把它的解析结果保存到检查点目录，
+    并在清单文件（manifest.json）中记录为已完成。合并中断后再次合并同样的文件和设置时，
+    已完成的单元直接读取保存的结果，只需解析剩余的文件；输出文件会重新生成。
+    """
+
+    def __init__(self, sources, options, checkpoint_dir=DEFAULT_CHECKPOINT_DIR):
+        self.sources = list(sources)
+        self.options = options  # 影响合并结果的选项，不同选项的合并互不干扰
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(json.dumps([CHECKPOINT_VERSION, [source_key(s) for s in self.sources], options],
+                                 ensure_ascii=False, sort_keys=True).encode('utf-8'))
+        self.path = os.path.join(checkpoint_dir, digest.hexdigest())
+        self.manifest_path = os.path.join(self.path, MANIFEST_NAME)
+        self.output_format = None
+        self.output_path = None
+        self.finished = {}  # 合并单元序号 -> 完成时的文件指纹
+
+    def load(self):
+        """读取上次中断时的清单，返回仍然有效的已完成单元数"""
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        self.output_format = manifest.get('output_format')
+        self.output_path = manifest.get('output_path')
+        self.finished = {}
+        for index, fingerprint in manifest.get('finished', {}).items():
+            index = int(index)
+            if index >= len(self.sources) or not os.path.exists(self.segment_path(index)):
+                continue
+            try:
+                # 中断后被修改过的文件需要重新解析
+                if file_fingerprint(source_key(self.sources[index])[0]) != fingerprint:
+                    continue
+            except OSError:
+                continue
+            self.finished[index] = fingerprint
+        return len(self.finished)
+
+    def start(self, output_format, output_path):
+        """开始（或重新开始）记录进度"""
+        os.makedirs(self.path, exist_ok=True)
+        self.output_format = output_format
+        self.output_path = output_path
+        self.save()
+
+    def save(self):
+        manifest = {
+            'version': CHECKPOINT_VERSION,
+            'sources': [source_key(source) for source in self.sources],
+            'options': self.options,
+            'output_format': self.output_format,
+            'output_path': self.output_path,
+            'finished': {str(index): fingerprint for index, fingerprint in sorted(self.finished.items())},
+        }
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def is_finished(self, index):
+        return index in self.finished
+
+    def segment_path(self, index):
+        return os.path.join(self.path, f'{index}.batches')
+
+    def record(self, index, batches):
+        """保存合并单元的批数据，同时原样产出；全部产出后才记录为已完成"""
+        fingerprint = file_fingerprint(source_key(self.sources[index])[0])
+        segment_path = self.segment_path(index)
+        tmp_path = segment_path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                for batch in batches:
+                    pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    yield batch
+            os.replace(tmp_path, segment_path)
+            self.finished[index] = fingerprint
+            self.save()
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def replay(self, index):
+        """按顺序读回已完成单元的批数据"""
+        with open(self.segment_path(index), 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    break
+
+    def remove(self):
+        """合并完成或放弃继续时删除检查点"""
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.finished = {}
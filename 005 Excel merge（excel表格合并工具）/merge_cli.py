@@ -0,0 +1,337 @@
+import os
+import sys
+import glob
+import logging
+import argparse
+
+from merge_engine import (ExcelMergeEngine, MergeError, MergeCancelled,
+                          DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, DEFAULT_MEMORY_BUDGET_GB)
+from output_writers import OUTPUT_FORMATS, OUTPUT_EXTENSIONS
+from parse_cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE_MB
+from merge_checkpoint import DEFAULT_CHECKPOINT_DIR
+from join_engine import ExcelJoinEngine, JOIN_TYPES, BUILD_SIDES
+from merge_progress import format_duration
+from row_dedup import DEFAULT_DEDUP_MEMORY_KEYS
+from external_sort import DEFAULT_SORT_MEMORY_ROWS
+from column_filter import parse_column_list
+from xlsx_writer import DEFAULT_WRITE_WORKERS
+from group_summary import SUMMARY_SHEET_NAME
+from merge_watch import FolderWatcher, DEFAULT_POLL_SECONDS, DEFAULT_DEBOUNCE_SECONDS, DEFAULT_PART_ROWS
+
+WATCH_OUTPUT_NAME = "合并结果"  # 监视模式未指定输出路径时，合并结果保存在监视的文件夹中
+
+
+def expand_inputs(patterns):
+    """展开文件列表中的通配符（Windows命令行不会自动展开），保持给定顺序"""
+    files = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern))
+            if not matches:
+                logging.warning(f"没有匹配的文件: {pattern}")
+            files.extend(matches)
+        else:
+            files.append(pattern)
+    return files
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m merge_cli",
+        description="按给定顺序合并多个Excel文件（无界面版本）",
+    )
+    parser.add_argument("files", nargs="*", help="要合并的文件，支持通配符，如 data/*.xlsx")
+    parser.add_argument("--header", choices=["first", "all"], default="first",
+                        help="first：只保留第一个文件的第一行（默认）；all：保留所有文件的第一行")
+    parser.add_argument("--align-columns", action="store_true",
+                        help="按第一行的列名对齐各文件的列，合并所有文件的列，缺少的列留空")
+    parser.add_argument("-o", "--output", help="输出文件路径，默认保存在第一个文件所在目录")
+    parser.add_argument("--append", metavar="MERGED_FILE",
+                        help="追加合并：只合并该合并结果的清单中没有的文件，新的行写入同目录下的新部分（如 合并结果_第2部分.xlsx）")
+    parser.add_argument("--watch", metavar="FOLDER",
+                        help="监视文件夹：放入的文件稳定后自动追加合并到同一个合并结果（默认 文件夹/合并结果.xlsx），按 Ctrl+C 停止；"
+                             "最后一个部分达到 --part-rows 行后新建 合并结果_第2部分 等，不能与删除重复行、排序、分组汇总同时使用")
+    parser.add_argument("--watch-pattern", metavar="PATTERN", help="监视时只合并文件名匹配此通配符的文件，如 \"*发票*.xlsx\"")
+    parser.add_argument("--debounce", type=float, default=DEFAULT_DEBOUNCE_SECONDS,
+                        help=f"监视时文件夹中的文件连续多少秒没有变化后再合并（默认 {DEFAULT_DEBOUNCE_SECONDS:g}）")
+    parser.add_argument("--part-rows", type=int,
+                        help="追加合并时最后一个部分少于这么多行且没有被修改过，就把新的行接在该部分末尾（不重新读取该部分的文件），"
+                             f"不新建部分；默认每次追加都新建部分，监视文件夹时默认 {DEFAULT_PART_ROWS}")
+    parser.add_argument("--poll", type=float, default=DEFAULT_POLL_SECONDS,
+                        help=f"监视时扫描文件夹的间隔秒数（默认 {DEFAULT_POLL_SECONDS:g}）")
+    parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS, default="auto",
+                        help="输出格式，默认根据输出路径扩展名或预计行数自动选择")
+    parser.add_argument("-j", "--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"并行解析进程数（默认 {DEFAULT_WORKERS}）")
+    parser.add_argument("--write-workers", type=int, default=DEFAULT_WRITE_WORKERS,
+                        help=f"并行写入xlsx的进程数，1 表示不启动写入进程（默认 {DEFAULT_WRITE_WORKERS}）")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"每批读取的行数（默认 {DEFAULT_BATCH_SIZE}）")
+    parser.add_argument("--memory-budget", type=float, default=DEFAULT_MEMORY_BUDGET_GB,
+                        help=f"内存预算，单位GB（默认 {DEFAULT_MEMORY_BUDGET_GB}）")
+    parser.add_argument("--sheets", metavar="PATTERN",
+                        help="要合并的工作表名称通配符，* 表示所有工作表；默认只合并第一个工作表")
+    parser.add_argument("--source-sheet-column", action="store_true",
+                        help="在第一列添加来源工作表名称")
+    parser.add_argument("--columns", metavar="COLUMNS",
+                        help="只合并这些列，填写列名或列字母并用逗号分隔，如 A,C,发票号码；按给定顺序输出")
+    parser.add_argument("--where", action="append", metavar="CONDITION",
+                        help="筛选条件，如 \"开票日期>=2024-01-01\"；可多次指定，全部满足的行才合并。"
+                             "运算符：= != > >= < <= ~（包含）")
+    parser.add_argument("--dedup", action="store_true", help="删除重复行，只保留第一次出现的行")
+    parser.add_argument("--dedup-columns", metavar="COLUMNS",
+                        help="按这些列判断重复，填写列名或列字母并用逗号分隔，如 A,C；默认按整行判断")
+    parser.add_argument("--dedup-memory-keys", type=int, default=DEFAULT_DEDUP_MEMORY_KEYS,
+                        help=f"内存中最多保存的行哈希数，超过后转存到磁盘（默认 {DEFAULT_DEDUP_MEMORY_KEYS}）")
+    parser.add_argument("--sort", metavar="COLUMNS",
+                        help="按这些列排序合并结果，填写列名或列字母并用逗号分隔，如 开票日期,客户")
+    parser.add_argument("--descending", action="store_true", help="排序时按降序（默认升序）")
+    parser.add_argument("--sort-memory-rows", type=int, default=DEFAULT_SORT_MEMORY_ROWS,
+                        help=f"排序时内存中最多缓存的行数，超过后写到临时文件（默认 {DEFAULT_SORT_MEMORY_ROWS}）")
+    parser.add_argument("--group-by", metavar="COLUMNS",
+                        help="合并的同时按这些列分组汇总，如 公司,开票日期:月（日期列可加 :年/:月/:日）；"
+                             "输出xlsx时写入\"汇总\"工作表，否则保存为 输出文件名_汇总.csv 等")
+    parser.add_argument("--agg", metavar="AGGREGATIONS",
+                        help="汇总方式，如 sum:金额,count,max:开票日期；可用 sum/count/min/max，默认统计行数")
+    parser.add_argument("--no-compact-types", action="store_true",
+                        help="排序或输出Parquet时不把缓存的数据转换为紧凑类型（默认转换，需要pyarrow）")
+    parser.add_argument("--cache", action="store_true",
+                        help="使用解析缓存：未修改过的文件直接读取上次的解析结果（需要pyarrow）")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help=f"缓存目录（默认 {DEFAULT_CACHE_DIR}）")
+    parser.add_argument("--cache-size", type=float, default=DEFAULT_CACHE_SIZE_MB,
+                        help=f"缓存大小上限，单位MB（默认 {DEFAULT_CACHE_SIZE_MB}）")
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="记录合并进度；中断后用同样的参数再次运行时只合并剩余的文件")
+    parser.add_argument("--checkpoint-dir", default=DEFAULT_CHECKPOINT_DIR,
+                        help=f"检查点目录（默认 {DEFAULT_CHECKPOINT_DIR}）")
+    parser.add_argument("--restart", action="store_true", help="忽略上次中断的进度，重新开始合并")
+    parser.add_argument("--join-keys", metavar="COLUMNS",
+                        help="关联模式（类似VLOOKUP）：按这些关键列用第二个文件补充第一个文件的列")
+    parser.add_argument("--right-keys", metavar="COLUMNS", help="右表（第二个文件）的关键列，默认与左表同名")
+    parser.add_argument("--join-type", choices=JOIN_TYPES, default="left",
+                        help="left：保留左表所有行（默认）；inner：只保留匹配的行；right：保留右表所有行；full：保留两边所有行")
+    parser.add_argument("--all-matches", action="store_true",
+                        help="右表有多行匹配时输出所有匹配的行（默认与VLOOKUP一样只取第一行）")
+    parser.add_argument("--join-build", choices=BUILD_SIDES, default="auto",
+                        help="用哪个表建哈希表：auto 按估算的行数选较小的一边（默认）；left / right 指定左表或右表")
+    parser.add_argument("--trace", action="store_true",
+                        help="记录各阶段每批的耗时，保存为Chrome trace格式（默认 输出文件路径.trace.json），并输出各阶段耗时汇总")
+    parser.add_argument("--trace-path", help="耗时记录的保存路径")
+    parser.add_argument("--profile", action="store_true",
+                        help="用 cProfile 和 tracemalloc 分析合并过程（明显变慢），结果保存为 输出文件路径.profile.prof/.txt")
+    parser.add_argument("-y", "--yes", action="store_true",
+                        help="第一行不一致时不中止，直接继续合并")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+
+    files = expand_inputs(args.files)
+    if not files and not args.watch:
+        logging.error("没有找到要合并的文件")
+        return 2
+
+    def on_header_mismatch(file_names):
+        for name in file_names:
+            logging.warning(f"第一行与第一个文件不一致: {name}")
+        if not args.yes:
+            logging.error("第一行不一致，已中止合并（使用 --yes 可继续合并）")
+        return args.yes
+
+    def on_resume(finished, total):
+        if args.restart:
+            logging.info("忽略上次中断的进度，重新开始合并")
+            return False
+        logging.info(f"继续上次中断的合并：已完成 {finished}/{total} 个文件")
+        return True
+
+    throughput = [""]
+
+    def on_progress(percent):
+        logging.info(f"进度: {percent}%{throughput[0]}")
+
+    def on_throughput(rows, rows_per_sec, mb_per_sec, eta):
+        throughput[0] = (f"（{rows:,} 行，{rows_per_sec:,.0f} 行/秒，{mb_per_sec:.1f} MB/秒，"
+                         f"剩余约 {format_duration(eta)}）")
+
+    if args.join_keys:
+        return run_join(args, files, on_progress, on_throughput)
+
+    callbacks = dict(on_progress=on_progress, on_throughput=on_throughput,
+                     on_header_mismatch=on_header_mismatch, on_resume=on_resume)
+    if args.watch:
+        return run_watch(args, engine_options(args, **callbacks))
+
+    engine = ExcelMergeEngine(files, output_path=args.output, append_to=args.append, max_part_rows=args.part_rows,
+                              **engine_options(args, **callbacks))
+
+    logging.info(f"开始合并 {len(files)} 个文件")
+    try:
+        output_path = engine.run()
+    except MergeCancelled:
+        return 1
+    except KeyboardInterrupt:
+        # 输出文件不完整，已完成的文件保留在检查点中
+        logging.error("合并被中断")
+        return 1
+    except MergeError as e:
+        logging.error(str(e))
+        return 1
+    finally:
+        log_diagnostics(engine)
+    logging.info(f"合并完成: {output_path}（共 {engine.total_rows} 行）")
+    if args.append:
+        logging.info(f"追加合并: 新合并 {len(engine.sources)} 个来源，跳过已合并的 {engine.merged_sources} 个来源，"
+                     f"合并结果共 {len(engine.manifest.parts)} 个部分")
+    if engine.dedup:
+        logging.info(f"删除重复行 {engine.duplicate_rows} 行")
+    log_summary(engine)
+    for label, typer in (("排序", engine.sort_typer), ("Parquet写入", engine.typer)):
+        if typer is not None and typer.rows:
+            logging.info(f"紧凑类型（{label}）: {typer.python_bytes / 1024 / 1024:.1f} MB → "
+                         f"{typer.arrow_bytes / 1024 / 1024:.1f} MB")
+    if engine.cache is not None:
+        logging.info(f"解析缓存: 命中 {engine.cache.hits} 个文件，未命中 {engine.cache.misses} 个文件")
+    budget = engine.memory_budget
+    if budget is not None and budget.budget_hits:
+        logging.warning(f"内存预算触发 {budget.budget_hits} 次，限流 {budget.throttle_events} 次，"
+                        f"峰值内存 {budget.peak_bytes / 1024 / 1024 / 1024:.2f} GB")
+    return 0
+
+
+def engine_options(args, **callbacks):
+    """由命令行参数得到 ExcelMergeEngine 的选项（不含输入文件、输出路径和追加合并）"""
+    return dict(
+        keep_all_headers=args.header == "all",
+        keep_first_header=args.header == "first",
+        batch_size=args.batch_size,
+        workers=args.workers,
+        memory_budget_gb=args.memory_budget,
+        output_format=args.format,
+        write_workers=args.write_workers,
+        on_error=logging.error,
+        on_warning=logging.warning,
+        sheet_pattern=args.sheets,
+        add_source_sheet=args.source_sheet_column,
+        columns=parse_column_list(args.columns),
+        row_filters=args.where,
+        align_columns=args.align_columns,
+        dedup=args.dedup or bool(args.dedup_columns),
+        dedup_columns=parse_column_list(args.dedup_columns),
+        dedup_memory_keys=args.dedup_memory_keys,
+        sort_columns=parse_column_list(args.sort),
+        sort_descending=args.descending,
+        sort_memory_rows=args.sort_memory_rows,
+        group_by=parse_column_list(args.group_by),
+        aggregations=parse_column_list(args.agg),
+        compact_types=not args.no_compact_types,
+        use_cache=args.cache,
+        cache_dir=args.cache_dir,
+        cache_size_mb=args.cache_size,
+        checkpoint=args.checkpoint,
+        checkpoint_dir=args.checkpoint_dir,
+        trace=args.trace or bool(args.trace_path),
+        trace_path=args.trace_path,
+        profile=args.profile,
+        on_throttle=logging.warning,
+        **callbacks,
+    )
+
+
+def log_summary(engine):
+    """输出分组汇总的分组数和保存位置"""
+    if engine.summary_path:
+        where = f"工作表 {SUMMARY_SHEET_NAME}" if engine.summary_path == engine.result_path else engine.summary_path
+        logging.info(f"分组汇总: {len(engine.summary.groups)} 组，保存在 {where}")
+
+
+def log_diagnostics(engine):
+    """输出各阶段耗时汇总和耗时记录、性能分析文件的位置"""
+    if engine.trace_file:
+        logging.info(f"各阶段耗时: {engine.trace.format_summary()}")
+        logging.info(f"耗时记录: {engine.trace_file}（可在 chrome://tracing 或 https://ui.perfetto.dev 中打开）")
+    if engine.profile_files:
+        logging.info(f"性能分析: {', '.join(engine.profile_files)}")
+
+
+def run_watch(args, options):
+    """监视模式：文件夹中的文件放入并稳定后追加合并到同一个合并结果，按 Ctrl+C 停止"""
+    if not os.path.isdir(args.watch):
+        logging.error(f"要监视的文件夹不存在: {args.watch}")
+        return 2
+    output_path = args.output
+    if not output_path:
+        output_format = args.format if args.format != "auto" else "xlsx"
+        output_path = os.path.join(args.watch, WATCH_OUTPUT_NAME + OUTPUT_EXTENSIONS[output_format])
+
+    def on_merge_start(files):
+        logging.info(f"开始合并 {len(files)} 个新文件: {', '.join(os.path.basename(f) for f in files)}")
+
+    def on_merged(engine):
+        log_diagnostics(engine)
+        logging.info(f"合并完成: {engine.result_path}（共 {engine.total_rows} 行）")
+        log_summary(engine)
+
+    try:
+        watcher = FolderWatcher(args.watch, output_path, options, pattern=args.watch_pattern,
+                                poll_seconds=args.poll, debounce_seconds=args.debounce,
+                                part_rows=args.part_rows or DEFAULT_PART_ROWS,
+                                on_merge_start=on_merge_start, on_merged=on_merged, on_error=logging.error,
+                                on_warning=logging.warning)
+    except MergeError as e:
+        logging.error(str(e))
+        return 2
+    logging.info(f"开始监视文件夹: {watcher.folder}，合并结果: {watcher.output_path}"
+                 f"（文件 {args.debounce:g} 秒内没有变化后合并，按 Ctrl+C 停止）")
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        logging.info("停止监视")
+    except MergeError as e:
+        logging.error(str(e))
+        return 1
+    return 0
+
+
+def run_join(args, files, on_progress, on_throughput):
+    """关联模式：第一个文件为左表，第二个文件为右表"""
+    if len(files) != 2:
+        logging.error("关联模式需要且只能指定两个文件：左表和右表")
+        return 2
+    engine = ExcelJoinEngine(
+        files[0],
+        files[1],
+        parse_column_list(args.join_keys),
+        parse_column_list(args.right_keys),
+        join_type=args.join_type,
+        first_match=not args.all_matches,
+        build_side=args.join_build,
+        batch_size=args.batch_size,
+        memory_budget_gb=args.memory_budget,
+        output_format=args.format,
+        output_path=args.output,
+        on_progress=on_progress,
+        on_throughput=on_throughput,
+        on_throttle=logging.warning,
+    )
+    logging.info(f"开始关联: {files[0]} ← {files[1]}")
+    try:
+        output_path = engine.run()
+    except MergeCancelled:
+        return 1
+    except KeyboardInterrupt:
+        logging.error("关联被中断")
+        return 1
+    except MergeError as e:
+        logging.error(str(e))
+        return 1
+    logging.info(f"关联完成: {output_path}（共 {engine.total_rows} 行，匹配 {engine.matched_rows} 行"
+                 f"，{'左表' if engine.built_side == 'left' else '右表'}建哈希表"
+                 f"{'，右表已分区落盘' if engine.spilled else ''}）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,798 @@
+import os
+import gc
+import sys
+import time
+import fnmatch
+import threading
+
+import psutil
+
+from parse_pool import OrderedParsePool
+from memory_budget import MemoryBudgetController
+from merge_checkpoint import MergeCheckpoint, DEFAULT_CHECKPOINT_DIR
+from merge_manifest import MergeManifest, part_base_name, whole_result_options, rewrite_path
+from merge_trace import MergeTrace, RunProfiler, TRACE_SUFFIX, PROFILE_SUFFIX, SOURCE_SPAN
+from merge_progress import ProgressTracker
+from parse_cache import ParseCache, DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE_MB
+from row_dedup import RowDeduplicator, DEFAULT_DEDUP_MEMORY_KEYS
+from external_sort import ExternalSorter, DEFAULT_SORT_MEMORY_ROWS
+from compact_types import CompactTyper, compact_types_available
+from column_filter import RowFilter, header_names, resolve_columns
+from schema_union import SchemaUnion
+from group_summary import GroupSummary, SUMMARY_SHEET_NAME, DEFAULT_MAX_GROUPS, summary_file_path
+from xlsx_reader import probe_headers, estimate_source_sizes, list_sheets, is_csv_file, read_first_row, split_source
+from output_writers import (OUTPUT_EXTENSIONS, OutputWriteError, choose_output_format,
+                            make_output_path, create_writer)
+from xlsx_writer import DEFAULT_WRITE_WORKERS
+
+DEFAULT_BATCH_SIZE = 10000  # 默认每批读取的行数
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)  # 默认并行解析进程数
+DEFAULT_MEMORY_BUDGET_GB = 3.0  # 合并可使用的内存预算（含解析子进程）
+SOURCE_SHEET_HEADER = "来源工作表"  # 来源工作表列在第一行中的列名
+
+
+class MergeError(Exception):
+    """导致合并无法继续的错误，消息可直接展示给用户"""
+
+
+class MergeCancelled(Exception):
+    """用户取消了合并"""
+
+
+def current_memory_gb():
+    """当前进程的内存使用（GB）"""
+    return psutil.Process(os.getpid()).memory_info().rss / 1024 / 1024 / 1024
+
+
+def source_label(source):
+    """数据来源的显示名称：文件名，或 文件名[工作表]"""
+    if isinstance(source, tuple):
+        return f"{os.path.basename(source[0])}[{source[1]}]"
+    return os.path.basename(source)
+
+
+def match_sheets(sheet_names, sheet_pattern):
+    """按工作表名称通配符选出要合并的工作表；通配符为空时只取第一个工作表"""
+    if not sheet_pattern:
+        return sheet_names[:1]
+    # Excel的工作表名称不区分大小写
+    pattern = sheet_pattern.lower()
+    return [name for name in sheet_names if fnmatch.fnmatchcase(name.lower(), pattern)]
+
+
+def output_format_from_path(output_path):
+    """根据输出文件扩展名判断输出格式"""
+    ext = os.path.splitext(output_path)[1].lower()
+    for output_format, format_ext in OUTPUT_EXTENSIONS.items():
+        if ext == format_ext:
+            return output_format
+    raise MergeError(f"无法根据扩展名判断输出格式: {output_path}")
+
+
+class ExcelMergeEngine:
+    """不依赖界面的Excel合并引擎
+
+    通过回调函数报告进度：
+    - on_progress(percent)：合并进度（0-100），按估算的行数和字节数计算
+    - on_throughput(rows, rows_per_sec, mb_per_sec, eta_seconds)：已处理行数、速度和预计剩余秒数（未知时为-1）
+    - on_memory(memory_gb)：当前内存使用
+    - on_error(message)：单个文件处理失败（该文件被跳过，合并继续）
+    - on_warning(message)：不影响合并结果的提醒，如追加合并时跳过了被修改过的文件、分组数过多而停止汇总、
+      合并清单、汇总文件或耗时记录保存失败
+    - on_header_mismatch(file_names)：第一行与第一个文件不一致的文件列表，返回 True 继续合并
+    - on_throttle(message)：内存接近预算而限流（缩小批大小、暂停解析）或恢复时的说明
+    - on_cache(hits, misses)：使用解析缓存时，每处理完一个文件报告累计的命中/未命中次数
+    - on_dedup(duplicates)：删除重复行时，每处理完一个文件报告累计删除的行数
+    - on_resume(finished, total)：发现上次中断的合并进度，返回 True 只合并剩余的文件
+    - on_typing(python_bytes, compact_bytes)：缓存的数据转换为紧凑类型前后占用的内存（字节）；
+      排序时为排序器缓存的数据，否则为Parquet写入器缓冲的数据
+
+    指定 sort_columns 时合并结果按这些列排序后再写入输出文件：超出内存的数据先排序写到临时文件，
+    最后多路归并输出，内存占用不随行数增长。
+
+    合并过程中可以从其他线程调用 cancel()，合并会在下一批数据处停止并删除不完整的输出文件；
+    启用 checkpoint 时已完成的文件记录在检查点中，下次合并同样的文件和设置时可以继续。
+
+    合并完成后在输出文件旁边保存合并清单（MergeManifest），记录合并了哪些来源。
+    指定 append_to（之前的合并结果）时为追加合并：只合并清单中没有的来源，新的行写入一个新的部分文件，
+    已合并的来源不再读取。指定 max_part_rows 时，最后一个部分少于这么多行且没有被修改过，就按清单中记录的行数和
+    结尾状态复制该部分、把新的行接在它的末尾（替换该部分），不重新解析它的来源，也不必每次追加都新建一个部分。
+
+    指定 group_by 或 aggregations 时在合并的同时逐批累计分组汇总（合计、计数、最小值、最大值），
+    输出xlsx时写入合并结果中的"汇总"工作表，输出CSV/Parquet时保存为 合并结果_汇总.csv 等，不需要再读一遍合并结果。
+
+    启用 trace 时按来源和批记录各阶段（解压、XML解析、写临时文件、读取、对齐与去重、写入、排序等）的耗时，
+    合并结束后导出为Chrome trace格式的JSON文件；启用 profile 时用 cProfile 和 tracemalloc 分析整个合并过程。
+    """
+
+    def __init__(self, file_list, keep_all_headers=False, keep_first_header=True,
+                 batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS,
+                 memory_budget_gb=DEFAULT_MEMORY_BUDGET_GB, output_format='auto', output_path=None,
+                 xlsx_writer='parallel', write_workers=DEFAULT_WRITE_WORKERS, on_progress=None, on_memory=None, on_error=None,
+                 on_warning=None, on_header_mismatch=None,
+                 use_cache=False, cache_dir=DEFAULT_CACHE_DIR, cache_size_mb=DEFAULT_CACHE_SIZE_MB,
+                 sheet_pattern=None, add_source_sheet=False, columns=None, row_filters=None, align_columns=False,
+                 dedup=False, dedup_columns=None, dedup_memory_keys=DEFAULT_DEDUP_MEMORY_KEYS,
+                 checkpoint=False, checkpoint_dir=DEFAULT_CHECKPOINT_DIR,
+                 sort_columns=None, sort_descending=False, sort_memory_rows=DEFAULT_SORT_MEMORY_ROWS,
+                 compact_types=True, on_typing=None, append_to=None, trace=False, trace_path=None, profile=False,
+                 group_by=None, aggregations=None, summary_max_groups=DEFAULT_MAX_GROUPS, max_part_rows=None,
+                 on_throttle=None, on_cache=None, on_dedup=None, on_resume=None, on_throughput=None):
+        self.file_list = list(file_list)
+        self.keep_all_headers = keep_all_headers
+        self.keep_first_header = keep_first_header
+        self.batch_size = batch_size  # 每批读取的行数
+        self.workers = workers  # 并行解析进程数
+        self.memory_budget_gb = memory_budget_gb
+        self.output_format = output_format  # auto / xlsx / csv / parquet
+        self.output_path = output_path  # 为空时保存在第一个文件所在目录
+        self.xlsx_writer = xlsx_writer  # xlsx输出的写入方式：parallel（多进程并行序列化）/ openpyxl
+        self.write_workers = write_workers  # 并行写入xlsx的进程数，1 表示在当前进程中写入
+        self.on_progress = on_progress
+        self.on_throughput = on_throughput
+        self.on_memory = on_memory
+        self.on_error = on_error
+        self.on_warning = on_warning
+        self.on_header_mismatch = on_header_mismatch
+        self.use_cache = use_cache  # 是否使用已解析文件的磁盘缓存（需要pyarrow）
+        self.cache_dir = cache_dir
+        self.cache_size_mb = cache_size_mb
+        # 为空时只合并每个文件的第一个工作表；"*" 合并所有工作表；其他为工作表名称通配符
+        self.sheet_pattern = sheet_pattern
+        self.add_source_sheet = add_source_sheet  # 是否在第一列添加来源工作表名称
+        self.columns = columns  # 只合并这些列（列名或列字母），按给定顺序输出；为空时合并所有列
+        self.row_filters = row_filters  # 筛选条件，如 ["日期>=2024-01-01", "金额>0"]，全部满足的行才合并
+        # 按第一行的列名对齐各文件的列（取所有列的并集，缺少的列填空），而不是按列的位置合并
+        self.align_columns = align_columns
+        self.schema = None
+        self.sources = []  # 实际参与合并的来源：文件路径或 (文件路径, 工作表名称)
+        self.source_headers = None  # 每个来源的第一行（按需读取）
+        self.read_options = None  # 每个来源在读取时应用的列选择和筛选条件
+        self.source_sizes = []  # 每个来源估算的 (行数, 字节数)，用于选择输出格式和计算进度
+        self.dedup = dedup  # 是否删除重复行
+        self.dedup_columns = dedup_columns  # 按这些列（列名或列字母）判断重复，为空时按整行判断
+        self.dedup_memory_keys = dedup_memory_keys  # 内存中最多保存的行哈希数，超过后转存到磁盘
+        self.sort_columns = sort_columns  # 按这些列（列名或列字母）排序合并结果，为空时按文件顺序输出
+        self.sort_descending = sort_descending
+        self.sort_memory_rows = sort_memory_rows  # 排序时内存中最多缓存的行数，超过后写到临时文件
+        # 排序和输出Parquet时，内存中缓存的行按列推断紧凑类型保存（需要pyarrow）
+        self.compact_types = compact_types
+        self.on_typing = on_typing
+        self.typer = None  # Parquet写入器缓冲数据的紧凑类型
+        self.sort_typer = None  # 排序器缓存数据的紧凑类型，与写入器分开统计，每行只计入一次
+        self.on_throttle = on_throttle
+        self.on_cache = on_cache
+        self.on_dedup = on_dedup
+        self.duplicate_rows = 0
+        self.use_checkpoint = checkpoint  # 是否记录合并进度，中断后可以继续
+        self.checkpoint_dir = checkpoint_dir
+        self.on_resume = on_resume
+        self.checkpoint = None
+        self.resumed_sources = 0  # 本次从检查点继续时跳过解析的合并单元数
+        self.append_to = append_to  # 追加合并的目标（之前的合并结果），为空时完整合并
+        self.manifest = None
+        self.merged_sources = 0  # 追加合并时清单中已合并、本次跳过的来源数
+        self.max_part_rows = max_part_rows  # 追加合并时最后一个部分少于这么多行则在它末尾继续写入，为空时总是新建部分
+        self.extending = False  # 本次追加合并是否在最后一个部分末尾继续写入
+        self.part_tail = None  # 输出文件的结尾状态，记录在合并清单中供之后继续写入
+        self.failed_sources = set()  # 处理出错而被跳过的来源序号，不记录到合并清单中
+        self.mismatched_sources = []  # 第一行与第一个文件（追加合并时与之前的合并结果）不一致的来源
+        # 处理出错前已有行写入的来源序号：这些行留在输出中，清单中记录为部分合并，之后不再追加
+        self.partial_sources = set()
+        self.group_by = group_by  # 分组汇总的分组列（列名或列字母，可加 :年/:月/:日 按日期分组）
+        self.aggregations = aggregations  # 汇总方式，如 ["sum:金额", "count"]；只指定分组列时统计行数
+        self.summary_max_groups = summary_max_groups  # 分组数超过后停止汇总
+        self.summary = None  # 本次合并的分组汇总（GroupSummary）
+        self.summary_path = None  # 汇总保存的位置：输出xlsx时为合并结果本身，否则为单独的汇总文件
+        self._cancel_event = threading.Event()
+        self._parse_pool = None
+        self.memory_budget = None
+        self.cache = None
+        self.total_rows = 0
+        self.stage_times = {}  # 各阶段耗时（秒）：header_check / read / transform / write / sort / finalize
+        self.use_trace = trace  # 是否记录各阶段每批的耗时
+        self.trace_path = trace_path  # 耗时记录的保存路径，为空时保存为 输出文件路径 + .trace.json
+        self.profile = profile  # 是否用 cProfile 和 tracemalloc 分析合并过程
+        self.trace = None
+        self.trace_file = None  # 实际保存的耗时记录文件
+        self.profile_files = None  # 实际保存的性能分析文件 (.prof, .txt)
+        self.result_path = None  # 本次合并的输出文件路径（确定后才有）
+
+    def _add_stage_time(self, stage, started, **args):
+        ended = time.perf_counter()
+        self.stage_times[stage] = self.stage_times.get(stage, 0.0) + ended - started
+        if self.trace is not None:
+            self.trace.add(stage, started, ended, **args)
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        """请求取消合并（可从其他线程调用），合并在下一批数据处停止"""
+        self._cancel_event.set()
+        parse_pool = self._parse_pool
+        if parse_pool is not None:
+            parse_pool.cancel()
+
+    def _check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise MergeCancelled()
+
+    def _emit(self, callback, *args):
+        if callback is not None:
+            return callback(*args)
+        return None
+
+    def resolve_sources(self):
+        """按文件列表顺序展开需要合并的工作表，每个工作表作为独立的合并单元"""
+        if not self.sheet_pattern and not self.add_source_sheet:
+            return list(self.file_list)
+
+        sources = []
+        for file_path in self.file_list:
+            try:
+                sheet_names = list_sheets(file_path)
+            except Exception as e:
+                self._emit(self.on_error, f"处理文件 {os.path.basename(file_path)} 时出错: {str(e)}")
+                continue
+            # CSV只有一个工作表，不按工作表名称筛选
+            matched = sheet_names if is_csv_file(file_path) else match_sheets(sheet_names, self.sheet_pattern)
+            if not matched:
+                self._emit(self.on_error, f"文件 {os.path.basename(file_path)} 中没有名称匹配 {self.sheet_pattern} 的工作表")
+            sources.extend((file_path, name) for name in matched)
+        return sources
+
+    def read_headers(self):
+        """读取每个来源的第一行"""
+        if self.source_headers is None:
+            try:
+                # 只读取每个工作表的第一行，多个文件并发读取
+                self.source_headers = probe_headers(self.sources)
+            except Exception as e:
+                raise MergeError(f"读取文件第一行时出错: {str(e)}")
+        return self.source_headers
+
+    def resolve_read_options(self):
+        """按每个来源自己的第一行把列名解析为列序号，得到读取时应用的列选择和筛选条件
+
+        某个来源缺少其他来源（或之前的合并结果）中有的列名时报错，不把列名当作列字母。
+        """
+        if not self.columns and not self.row_filters:
+            return None
+        headers = self.read_headers()
+        if self.manifest is not None and self.manifest.header is not None:
+            headers = headers + [self.manifest.header]
+        names = header_names(headers)
+        read_options = []
+        for source, header in zip(self.sources, self.read_headers()):
+            options = {}
+            try:
+                if self.columns:
+                    options['columns'] = resolve_columns(self.columns, header, names)
+                if self.row_filters:
+                    options['row_filter'] = RowFilter.parse(self.row_filters, header, names)
+            except ValueError as e:
+                raise MergeError(f"{source_label(source)}: {str(e)}")
+            read_options.append(options)
+        return read_options
+
+    def output_header(self, index):
+        """来源读取后的第一行：选择了列时只包含这些列；按列名对齐时为合并后的列名"""
+        if self.schema is not None:
+            return self.schema.header
+        header = self.read_headers()[index]
+        if self.read_options is None or 'columns' not in self.read_options[index]:
+            return header
+        return [header[col] if col < len(header) else None for col in self.read_options[index]['columns']]
+
+    def check_headers(self):
+        """只保留第一个文件的第一行时，检查所有文件（工作表）的第一行是否一致；选择了列时只比较这些列
+
+        追加合并时所有文件都与之前合并结果的第一行比较。
+        """
+        headers = [self.output_header(i) for i in range(len(self.sources))]
+        if self.manifest is not None and self.manifest.header is not None:
+            first_row, start = self.manifest.header, 0
+        else:
+            first_row, start = headers[0], 1
+        self.mismatched_sources = [source for source, header in zip(self.sources[start:], headers[start:])
+                                   if header != first_row]
+        # 一次性列出所有不一致的文件，由调用方决定是否继续；已取消时不再询问
+        if self.mismatched_sources:
+            self._check_cancelled()
+            if not self._emit(self.on_header_mismatch, [source_label(source) for source in self.mismatched_sources]):
+                raise MergeCancelled()
+
+    def create_deduplicator(self):
+        """创建去重器；指定了去重列时按第一个文件（选择列之后）的第一行解析列名"""
+        key_columns = None
+        if self.dedup_columns:
+            try:
+                key_columns = resolve_columns(self.dedup_columns, self.output_header(0))
+            except ValueError as e:
+                raise MergeError(f"去重列设置有误: {str(e)}")
+        return RowDeduplicator(key_columns, self.dedup_memory_keys)
+
+    def result_header(self):
+        """输出文件的第一行（含来源工作表列），用于解析排序列和汇总列"""
+        header = self.output_header(0)
+        if self.add_source_sheet:
+            header = [SOURCE_SHEET_HEADER] + list(header)
+        return header
+
+    def create_sorter(self):
+        """创建外部排序器；排序列按输出文件的第一行（含来源工作表列）解析"""
+        try:
+            key_columns = resolve_columns(self.sort_columns, self.result_header())
+        except ValueError as e:
+            raise MergeError(f"排序列设置有误: {str(e)}")
+        return ExternalSorter(key_columns, self.sort_descending, self.sort_memory_rows, typer=self.sort_typer)
+
+    def create_summary(self):
+        """创建分组汇总；分组列和汇总列按输出文件的第一行（含来源工作表列）解析"""
+        try:
+            return GroupSummary(self.group_by, self.aggregations, self.result_header(), self.summary_max_groups)
+        except ValueError as e:
+            raise MergeError(f"分组汇总设置有误: {str(e)}")
+
+    def result_options(self):
+        """影响合并结果的选项，记录在检查点和合并清单中"""
+        return {
+            'keep_all_headers': self.keep_all_headers,
+            'keep_first_header': self.keep_first_header,
+            'sheet_pattern': self.sheet_pattern,
+            'add_source_sheet': self.add_source_sheet,
+            'columns': self.columns,
+            'row_filters': self.row_filters,
+            'align_columns': self.align_columns,
+            'dedup': self.dedup,
+            'dedup_columns': self.dedup_columns,
+            'sort_columns': self.sort_columns,
+            'sort_descending': self.sort_descending,
+            'group_by': self.group_by,
+            'aggregations': self.aggregations,
+        }
+
+    def open_checkpoint(self):
+        """打开与本次合并的文件和设置对应的检查点，返回是否从上次中断处继续"""
+        options = dict(self.result_options(), output_format=self.output_format, output_path=self.output_path,
+                       append_to=self.append_to)
+        self.checkpoint = MergeCheckpoint(self.sources, options, self.checkpoint_dir)
+        finished = self.checkpoint.load()
+        if finished and self.checkpoint.output_path:
+            self._check_cancelled()
+            resume = self.on_resume is None or self.on_resume(finished, len(self.sources))
+            if resume:
+                return True
+        self.checkpoint.remove()
+        return False
+
+    def select_new_sources(self, sources):
+        """追加合并：读取之前的合并清单，只保留清单中没有的来源"""
+        blocked = whole_result_options(self.result_options())
+        if blocked:
+            raise MergeError(f"追加合并时不能{'、'.join(blocked)}：新的部分只包含新文件的行，"
+                             f"无法与之前的合并结果一起处理，请重新完整合并")
+        try:
+            self.manifest = MergeManifest.load(self.append_to)
+        except ValueError as e:
+            raise MergeError(str(e))
+        blocked = whole_result_options(self.manifest.options)
+        if blocked:
+            raise MergeError(f"之前的合并结果经过了{'、'.join(blocked)}，追加的新行无法包含在内，请重新完整合并")
+        conflicts = self.manifest.option_conflicts(self.result_options())
+        if conflicts:
+            raise MergeError(f"以下设置与之前的合并结果不同，无法追加合并: {', '.join(conflicts)}")
+
+        new_sources = []
+        self.merged_sources = 0
+        for source in sources:
+            state = self.manifest.source_state(source)
+            if state == 'new':
+                new_sources.append(source)
+                continue
+            self.merged_sources += 1
+            if state == 'modified':
+                # 已合并的行在之前的部分中，追加合并不会修改已有的部分
+                self._emit(self.on_warning, f"文件 {source_label(source)} 在合并后被修改过，已跳过；"
+                                            f"需要更新已合并的行时请重新完整合并")
+            elif state == 'partial':
+                # 再次合并会使已写入的行重复
+                self._emit(self.on_warning, f"文件 {source_label(source)} 上次合并时出错，只合并了部分行，已跳过；"
+                                            f"请修正该文件后重新完整合并")
+        if not new_sources:
+            raise MergeError("没有需要追加的新文件：所有文件都已合并过")
+        if (self.max_part_rows and self.manifest.parts[-1]['rows'] < self.max_part_rows
+                and self.manifest.last_part_tail() is not None
+                and not (self.manifest.output_format == 'xlsx' and self.xlsx_writer == 'openpyxl')):
+            # 最后一个部分还不大时在它末尾继续写入，避免每次追加少量文件都产生一个新的部分
+            self.extending = True
+        return new_sources
+
+    def resolve_output(self):
+        """确定输出格式和输出路径"""
+        if self.manifest is not None:
+            # 追加合并时新的部分与之前的合并结果格式相同，保存在同一目录
+            output_format = self.manifest.output_format
+            if self.extending:
+                return output_format, self.manifest.last_part_path()
+            output_dir = os.path.dirname(self.manifest.output_path)
+            base_name = part_base_name(self.manifest.output_path, len(self.manifest.parts) + 1)
+            return output_format, make_output_path(output_dir, output_format, base_name)
+
+        output_format = self.output_format
+        if self.output_path:
+            if output_format == 'auto':
+                output_format = output_format_from_path(self.output_path)
+            return output_format, self.output_path
+
+        # 选择自动时根据各文件记录的行数估算是否超出Excel上限
+        output_format = choose_output_format(output_format, sum(rows for rows, _ in self.source_sizes))
+        # 保存在第一个文件所在目录，如果文件已存在则添加序号
+        output_dir = os.path.dirname(os.path.abspath(self.file_list[0]))
+        return output_format, make_output_path(output_dir, output_format)
+
+    def run(self):
+        """执行合并，返回输出文件路径"""
+        if not self.file_list:
+            raise MergeError("请先选择Excel文件")
+
+        self.trace = MergeTrace() if self.use_trace else None
+        self.trace_file = self.profile_files = self.result_path = None
+        profiler = RunProfiler() if self.profile else None
+        if profiler is not None:
+            profiler.start()
+        try:
+            return self._run()
+        finally:
+            if profiler is not None:
+                profiler.stop()
+            # 合并失败或取消时也保存，便于分析慢在哪里
+            self.save_diagnostics(profiler)
+
+    def save_diagnostics(self, profiler=None):
+        """保存耗时记录和性能分析结果；还没有确定输出文件时保存在第一个文件所在目录"""
+        if self.trace is None and profiler is None:
+            return
+        base_path = self.result_path or os.path.join(os.path.dirname(os.path.abspath(self.file_list[0])),
+                                                     "合并结果")
+        try:
+            if self.trace is not None:
+                self.trace_file = self.trace_path or base_path + TRACE_SUFFIX
+                self.trace.export_chrome(self.trace_file)
+            if profiler is not None:
+                self.profile_files = profiler.save(base_path + PROFILE_SUFFIX)
+        except OSError as e:
+            self._emit(self.on_warning, f"保存耗时记录时出错: {str(e)}")
+
+    def _run(self):
+        self.stage_times = {}
+        self.checkpoint = None
+        self.manifest = None
+        self.extending = False
+        try:
+            self.sources = self.resolve_sources()
+            if not self.sources:
+                raise MergeError("没有可合并的工作表，请检查文件和设置")
+            if self.append_to:
+                self.sources = self.select_new_sources(self.sources)
+            # 合并开始前根据各工作表记录的数据区域估算行数和字节数
+            self.source_sizes = estimate_source_sizes(self.sources)
+            self.source_headers = None
+            self.schema = None
+            self.read_options = self.resolve_read_options()
+            if self.align_columns:
+                # 每个文件的列映射只计算一次
+                self.schema = SchemaUnion([self.output_header(i) for i in range(len(self.sources))],
+                                          self.manifest.header if self.manifest is not None else None)
+                if self.extending and len(self.schema.header) > len(self.manifest.header):
+                    # 出现了新的列时最后一个部分的第一行已经不完整，新的行写入新的部分
+                    self.extending = False
+
+            resume = self.open_checkpoint() if self.use_checkpoint else False
+            if resume:
+                # 第一行已在上次合并时检查过，输出到上次的文件
+                output_format, output_path = self.checkpoint.output_format, self.checkpoint.output_path
+            else:
+                # 按列名对齐时各文件的第一行本来就可以不同，不需要检查
+                if not self.keep_all_headers and self.keep_first_header and self.schema is None:
+                    started = time.perf_counter()
+                    self.check_headers()
+                    self._add_stage_time('header_check', started)
+                self._check_cancelled()
+                output_format, output_path = self.resolve_output()
+            if self.checkpoint is not None:
+                self.checkpoint.start(output_format, output_path)
+            self.result_path = output_path
+
+            if self.extending:
+                # 先写入临时文件，合并失败或取消时原来的部分保持不变
+                self.merge(output_format, rewrite_path(output_path))
+                os.replace(rewrite_path(output_path), output_path)
+            else:
+                self.merge(output_format, output_path)
+            if self.checkpoint is not None:
+                self.checkpoint.remove()
+            self.save_manifest(output_format, output_path)
+            return output_path
+        finally:
+            # 清理内存
+            gc.collect()
+
+    def save_manifest(self, output_format, output_path):
+        """在合并结果旁边记录合并清单；追加合并时把新的部分加入之前的清单"""
+        manifest = self.manifest
+        if manifest is None:
+            manifest = MergeManifest(output_path)
+            manifest.output_format = output_format
+            manifest.options = self.result_options()
+        if self.schema is not None:
+            manifest.header = list(self.schema.header)
+        elif manifest.header is None:
+            # 没有读取过各来源的第一行时只读取第一个来源的
+            manifest.header = (self.output_header(0) if self.source_headers is not None
+                               else read_first_row(*split_source(self.sources[0])))
+        try:
+            merged = [source for i, source in enumerate(self.sources) if i not in self.failed_sources]
+            partial = [self.sources[i] for i in sorted(self.partial_sources)]
+            if self.extending:
+                manifest.replace_last_part(merged, self.total_rows, self.part_tail, partial)
+            else:
+                manifest.add_part(output_path, merged, self.total_rows, self.part_tail, partial)
+            manifest.save()
+        except OSError as e:
+            # 合并结果已经完整保存，清单保存失败只影响之后的追加合并
+            self._emit(self.on_warning, f"保存合并清单时出错: {str(e)}")
+        self.manifest = manifest
+
+    def merge(self, output_format, output_path):
+        """流式合并：逐批读取每个文件并直接写入输出文件，内存占用不随行数增长"""
+        # 需要在内存中缓存大量行时（排序、Parquet的行组），按紧凑类型保存；
+        # 排序器和写入器各用一个，排序后的行写入Parquet时不会与排序时的统计混在一起
+        self.typer = self.sort_typer = None
+        if self.compact_types and compact_types_available():
+            if self.sort_columns:
+                self.sort_typer = CompactTyper()
+            if output_format == 'parquet':
+                self.typer = CompactTyper()
+        writer = create_writer(output_format, output_path, self.keep_first_header and not self.keep_all_headers,
+                               categorical_columns=(0,) if self.add_source_sheet else (), typer=self.typer,
+                               xlsx_writer=self.xlsx_writer, workers=self.write_workers)
+        total_sources = len(self.sources)
+        self.total_rows = 0
+        self.part_tail = None
+        self.duplicate_rows = 0
+        self.failed_sources = set()
+        self.partial_sources = set()
+        self.summary = None
+        self.summary_path = None
+        keep_header = self.keep_all_headers or self.keep_first_header
+
+        # 内存接近预算时缩小批大小、暂停派发解析任务，并把缓冲数据刷到磁盘
+        self.memory_budget = MemoryBudgetController(self.memory_budget_gb, self.batch_size, self.on_throttle)
+
+        # 只有新增或修改过的文件需要重新解析，其余直接读取缓存
+        self.cache = ParseCache(self.cache_dir, self.cache_size_mb) if self.use_cache else None
+
+        # 多个文件在子进程中并行解析，解析结果仍按列表顺序写入；检查点中已完成的文件不再解析
+        checkpoint = self.checkpoint
+        pending = [i for i in range(total_sources) if checkpoint is None or not checkpoint.is_finished(i)]
+        self.resumed_sources = total_sources - len(pending)
+        self._parse_pool = OrderedParsePool(self.workers, self.batch_size, self.memory_budget_gb * 1024,
+                                            self.memory_budget, self.cache, self.trace)
+        # 列选择和筛选条件在解析时应用，未选中的单元格不会被转换和保存
+        parsed = self._parse_pool.iter_files([self.sources[i] for i in pending],
+                                             self.read_options and [self.read_options[i] for i in pending])
+        deduplicator = None
+        sorter = None
+        summary = None
+        progress_sizes = self.source_sizes
+        if self.sort_columns:
+            # 排序后的输出阶段作为最后一个进度单元，按写出一遍数据的工作量估算为读取的一半
+            progress_sizes = progress_sizes + [(sum(rows for rows, _ in self.source_sizes),
+                                                sum(size for _, size in self.source_sizes) // 2)]
+        progress = ProgressTracker(progress_sizes, self.on_progress, self.on_throughput)
+
+        try:
+            if self.extending:
+                # 复制最后一个部分已有的内容，新的行接在后面
+                part = self.manifest.parts[-1]
+                started = time.perf_counter()
+                writer.continue_from(self.manifest.last_part_path(), part['rows'], part['tail'])
+                self.total_rows = part['rows']
+                self._add_stage_time('write', started)
+            # 合并时逐批删除重复行，行哈希过多或内存紧张时转存到磁盘
+            if self.dedup:
+                deduplicator = self.create_deduplicator()
+            if self.sort_columns:
+                sorter = self.create_sorter()
+            if self.group_by or self.aggregations:
+                # 汇总与合并同时进行，每批数据写入时累计
+                self.summary = summary = self.create_summary()
+
+            for i, source in enumerate(self.sources):
+                self._check_cancelled()
+                if checkpoint is not None and checkpoint.is_finished(i):
+                    batches = checkpoint.replay(i)
+                else:
+                    _, batches = next(parsed)
+                    if checkpoint is not None:
+                        # 全部批数据处理完后，该文件记录为已完成
+                        batches = checkpoint.record(i, batches)
+                label = source_label(source)
+                source_started = time.perf_counter()
+                source_rows = self.total_rows
+                try:
+                    progress.start_source(i)
+
+                    # 非第一个文件且不保留所有第一行时，跳过该文件的第一行；排序时只保留第一个文件的第一行。
+                    # 在最后一个部分末尾继续写入时，第一个文件也不是该部分的第一个文件
+                    skip_first_row = (i > 0 or self.extending) and (not self.keep_all_headers or sorter is not None)
+                    first_batch = True
+                    # 来源工作表名称，所有行共用同一个字符串对象
+                    sheet_name = sys.intern(str(source[1])) if self.add_source_sheet else None
+
+                    started = time.perf_counter()
+                    for batch in batches:
+                        self._add_stage_time('read', started, source=label, rows=len(batch))
+                        started = time.perf_counter()
+                        self._check_cancelled()
+                        notify = progress.advance(len(batch))
+                        header_row = None
+                        if first_batch:
+                            if skip_first_row:
+                                batch = batch[1:]
+                            elif batch and keep_header and (self.add_source_sheet or deduplicator is not None
+                                                            or self.schema is not None or sorter is not None
+                                                            or summary is not None):
+                                # 保留的第一行是表头，不参与去重
+                                header_row = batch[0] if self.schema is None else list(self.schema.header)
+                                batch = batch[1:]
+                            first_batch = False
+                        if self.schema is not None:
+                            batch = self.schema.reindex(i, batch)
+                        if deduplicator is not None:
+                            batch = deduplicator.filter(batch)
+                        if sheet_name is not None:
+                            batch = [[sheet_name] + row for row in batch]
+                            if header_row is not None:
+                                # 来源列在表头中填写列名
+                                header_row = [SOURCE_SHEET_HEADER] + header_row
+                        if header_row is not None:
+                            batch.insert(0, header_row)
+                        self._add_stage_time('transform', started, source=label)
+                        if summary is not None:
+                            started = time.perf_counter()
+                            summary.add(batch[1:] if header_row is not None else batch)
+                            self._add_stage_time('summary', started, source=label)
+                            if summary.overflowed:
+                                self._emit(self.on_warning, f"分组数超过 {summary.max_groups} 个，已停止生成分组汇总，"
+                                                            f"请减少分组列或按日期的年、月分组")
+                                self.summary = summary = None
+                        started = time.perf_counter()
+                        if sorter is not None:
+                            # 表头直接写入输出文件，数据行先交给排序器
+                            if header_row is not None:
+                                writer.write_rows([batch.pop(0)])
+                                self.total_rows += 1
+                            sorter.add(batch)
+                            self.total_rows += len(batch)
+                            self._add_stage_time('sort', started, source=label, rows=len(batch))
+                        else:
+                            writer.write_rows(batch)
+                            self.total_rows += len(batch)
+                            self._add_stage_time('write', started, source=label, rows=len(batch))
+
+                        # 每处理一批检查一次内存预算，并上报内存使用情况
+                        if self.memory_budget.check():
+                            writer.flush()
+                            if deduplicator is not None:
+                                deduplicator.spill()
+                            if sorter is not None:
+                                sorter.spill()
+                            gc.collect()
+                        if notify and self.on_memory is not None:
+                            self.on_memory(current_memory_gb())
+                        started = time.perf_counter()
+                    self._add_stage_time('read', started, source=label)
+
+                    if self.cache is not None:
+                        self._emit(self.on_cache, self.cache.hits, self.cache.misses)
+                    if deduplicator is not None:
+                        self.duplicate_rows = deduplicator.duplicates
+                        self._emit(self.on_dedup, self.duplicate_rows)
+                    typer = self.sort_typer if sorter is not None else self.typer
+                    if typer is not None and typer.rows:
+                        self._emit(self.on_typing, typer.python_bytes, typer.arrow_bytes)
+
+                except (OutputWriteError, MergeCancelled):
+                    raise
+                except Exception as e:
+                    self._check_cancelled()
+                    self.failed_sources.add(i)
+                    if self.total_rows > source_rows:
+                        # 出错前写入的行无法从输出中撤回
+                        self.partial_sources.add(i)
+                        self._emit(self.on_error, f"处理文件 {source_label(source)} 时出错，已合并该文件的前 "
+                                                  f"{self.total_rows - source_rows} 行: {str(e)}")
+                    else:
+                        self._emit(self.on_error, f"处理文件 {source_label(source)} 时出错: {str(e)}")
+                finally:
+                    progress.finish_source()
+                    if self.trace is not None:
+                        self.trace.add(SOURCE_SPAN, source_started, source=label, rows=self.total_rows - source_rows)
+
+            if self.total_rows == 0:
+                raise MergeError("合并结果为空，请检查文件和设置")
+
+            if sorter is not None:
+                self.write_sorted(writer, sorter, progress)
+
+            if summary is not None and output_format == 'xlsx':
+                started = time.perf_counter()
+                writer.add_sheet(SUMMARY_SHEET_NAME, summary.result_rows())
+                self.summary_path = output_path
+                self._add_stage_time('summary', started)
+
+            started = time.perf_counter()
+            writer.close()
+            self.part_tail = writer.tail_state()
+            self._add_stage_time('finalize', started)
+        except BaseException:
+            # 合并失败、取消或被中断时删除不完整的输出文件
+            writer.discard()
+            raise
+        finally:
+            parsed.close()
+            self._parse_pool = None
+            if deduplicator is not None:
+                deduplicator.close()
+            if sorter is not None:
+                sorter.close()
+            if self.cache is not None:
+                self.cache.evict()
+
+        if summary is not None and output_format != 'xlsx':
+            self.write_summary_file(output_format, output_path, summary)
+        progress.finish()
+
+    def write_summary_file(self, output_format, output_path, summary):
+        """输出CSV/Parquet时把汇总保存为单独的文件；合并结果已经完整保存，汇总保存失败只给出提醒"""
+        started = time.perf_counter()
+        summary_path = summary_file_path(output_path)
+        writer = create_writer(output_format, summary_path, keep_first_header=True)
+        try:
+            writer.write_rows(summary.result_rows())
+            writer.close()
+        except Exception as e:
+            writer.discard()
+            self._emit(self.on_warning, f"保存分组汇总时出错: {str(e)}")
+            return
+        self.summary_path = summary_path
+        self._add_stage_time('summary', started)
+
+    def write_sorted(self, writer, sorter, progress):
+        """把排序结果逐批写入输出文件"""
+        progress.start_source(len(self.sources))
+        started = time.perf_counter()
+        for batch in sorter.iter_batches(self.memory_budget.batch_size):
+            self._add_stage_time('sort', started)
+            self._check_cancelled()
+            notify = progress.advance(len(batch))
+            started = time.perf_counter()
+            writer.write_rows(batch)
+            self._add_stage_time('write', started)
+            if self.memory_budget.check():
+                writer.flush()
+                gc.collect()
+            if notify and self.on_memory is not None:
+                self.on_memory(current_memory_gb())
+            started = time.perf_counter()
+        self._add_stage_time('sort', started)
+        progress.finish_source()
+
+
+def merge_files(file_list, **options):
+    """合并文件并返回输出路径，参数同 ExcelMergeEngine"""
+    return ExcelMergeEngine(file_list, **options).run()
@@ -0,0 +1,169 @@
+import os
+import re
+import json
+import time
+
+from merge_checkpoint import file_fingerprint, source_key
+
+MANIFEST_VERSION = 1  # 清单格式变化时加一
+MANIFEST_SUFFIX = '.manifest.json'  # 清单文件保存为 输出文件路径 + 此后缀
+# 追加合并时必须与已合并结果相同的选项及其显示名称，否则新旧部分的列和第一行对不上
+APPEND_OPTIONS = {
+    'keep_all_headers': '保留所有文件的第一行',
+    'keep_first_header': '只保留第一个文件的第一行',
+    'sheet_pattern': '工作表',
+    'add_source_sheet': '添加来源工作表列',
+    'columns': '只合并这些列',
+    'row_filters': '筛选条件',
+    'align_columns': '按列名对齐',
+}
+
+# 作用于整个合并结果的选项及其显示名称：追加的部分只包含新文件的行，无法与之前的部分一起去重、排序或汇总，
+# 因此启用这些选项时不能追加合并
+WHOLE_RESULT_OPTIONS = {
+    'dedup': '删除重复行',
+    'sort_columns': '排序',
+    'group_by': '分组汇总',
+    'aggregations': '分组汇总',
+}
+
+
+def whole_result_options(options):
+    """options 中启用了的作用于整个合并结果的选项（显示名称）"""
+    labels = []
+    for name, label in WHOLE_RESULT_OPTIONS.items():
+        if options.get(name) and label not in labels:
+            labels.append(label)
+    return labels
+
+
+def manifest_path(output_path):
+    """合并结果对应的清单文件路径"""
+    return output_path + MANIFEST_SUFFIX
+
+
+def part_base_name(output_path, number):
+    """追加合并的第 number 部分的文件名（不含扩展名），如 合并结果_第2部分"""
+    stem = os.path.splitext(os.path.basename(output_path))[0]
+    return f"{stem}_第{number}部分"
+
+
+def rewrite_path(part_path):
+    """重新合并已有的部分时先写入的临时文件（隐藏文件），合并成功后替换该部分"""
+    part_dir, name = os.path.split(part_path)
+    return os.path.join(part_dir, f".{name}.tmp")
+
+
+def is_part_file(output_path, file_path):
+    """file_path 是否为追加合并 output_path 时生成的部分（同一目录下的 合并结果_第N部分.xlsx 或 合并结果_第N部分_1.xlsx）"""
+    output_dir, output_name = os.path.split(os.path.abspath(output_path))
+    if os.path.dirname(os.path.abspath(file_path)) != output_dir:
+        return False
+    stem, ext = os.path.splitext(output_name)
+    pattern = re.escape(stem) + r'_第\d+部分(_\d+)?' + re.escape(ext)
+    return re.fullmatch(pattern, os.path.basename(file_path), re.IGNORECASE) is not None
+
+
+class MergeManifest:
+    """合并清单：记录合并结果由哪些来源合并而成，保存在输出文件旁边
+
+    第一次合并时输出文件就是第1部分；之后追加合并只合并清单中没有的来源，
+    新的行写入新的部分（合并结果_第2部分.xlsx 等），已合并的来源不再读取，已有的部分也不会重写。
+    每个部分记录行数、文件指纹和写入器的结尾状态（tail），部分未被修改时可以在它的末尾继续写入新的行。
+    """
+
+    def __init__(self, output_path):
+        self.output_path = os.path.abspath(output_path)  # 第1部分，即第一次合并的输出文件
+        self.path = manifest_path(self.output_path)
+        self.output_format = None
+        self.options = {}  # 合并时的选项，只比较 APPEND_OPTIONS 中的项
+        self.header = None  # 合并结果的第一行（列名），追加时用于检查新文件的列
+        # [{'file': 文件名, 'rows': 行数, 'tail': 结尾状态, 'fingerprint': 文件指纹, 'created': 时间}]，按合并顺序排列
+        self.parts = []
+        # (文件绝对路径, 工作表名称) -> {'fingerprint': 指纹, 'part': 部分序号}；
+        # 处理出错时已有部分行写入的来源另记 'partial': True，之后不再追加，避免这些行重复
+        self.sources = {}
+
+    @classmethod
+    def load(cls, output_path):
+        """读取合并结果旁边的清单；没有清单或无法读取时抛出 ValueError"""
+        manifest = cls(output_path)
+        try:
+            with open(manifest.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            raise ValueError(f"找不到合并清单 {os.path.basename(manifest.path)}，请先完整合并一次")
+        except (OSError, ValueError) as e:
+            raise ValueError(f"无法读取合并清单 {os.path.basename(manifest.path)}: {str(e)}")
+        if data.get('version') != MANIFEST_VERSION:
+            raise ValueError(f"合并清单的版本不受支持: {data.get('version')}")
+        manifest.output_format = data.get('output_format')
+        manifest.options = data.get('options', {})
+        manifest.header = data.get('header')
+        manifest.parts = data.get('parts', [])
+        for item in data.get('sources', []):
+            manifest.sources[(item['path'], item['sheet'])] = {key: value for key, value in item.items()
+                                                               if key not in ('path', 'sheet')}
+        return manifest
+
+    def save(self):
+        data = {
+            'version': MANIFEST_VERSION,
+            'output_format': self.output_format,
+            'options': self.options,
+            'header': self.header,
+            'parts': self.parts,
+            'sources': [{'path': path, 'sheet': sheet, **item} for (path, sheet), item in self.sources.items()],
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1, default=str)
+        os.replace(tmp_path, self.path)
+
+    def option_conflicts(self, options):
+        """与已合并结果不同的追加选项（显示名称）"""
+        return [label for name, label in APPEND_OPTIONS.items() if self.options.get(name) != options.get(name)]
+
+    def source_state(self, source):
+        """来源在清单中的状态：new（未合并）、merged（已合并且未修改）、modified（合并后被修改过）、
+        partial（合并时出错，只写入了部分行）"""
+        item = self.sources.get(tuple(source_key(source)))
+        if item is None:
+            return 'new'
+        if item.get('partial'):
+            return 'partial'
+        try:
+            fingerprint = file_fingerprint(source_key(source)[0])
+        except OSError:
+            return 'modified'
+        return 'merged' if fingerprint == item['fingerprint'] else 'modified'
+
+    def last_part_path(self):
+        return os.path.join(os.path.dirname(self.output_path), self.parts[-1]['file'])
+
+    def last_part_tail(self):
+        """在最后一个部分末尾继续写入所需的结尾状态；写入器不支持、或该部分被修改或删除过时返回 None"""
+        part = self.parts[-1]
+        if part.get('tail') is None:
+            return None
+        try:
+            fingerprint = file_fingerprint(self.last_part_path())
+        except OSError:
+            return None
+        return part['tail'] if fingerprint == part.get('fingerprint') else None
+
+    def add_part(self, part_path, sources, rows, tail=None, partial_sources=()):
+        """记录新合并的一个部分和它包含的来源；partial_sources 为处理出错、只写入了部分行的来源"""
+        self.parts.append({'file': os.path.basename(part_path), 'rows': rows})
+        self.replace_last_part(sources, rows, tail, partial_sources)
+
+    def replace_last_part(self, sources, rows, tail=None, partial_sources=()):
+        """在最后一个部分末尾继续写入后，更新它的行数、结尾状态，并记录新加入的来源"""
+        self.parts[-1].update(rows=rows, tail=tail, fingerprint=file_fingerprint(self.last_part_path()),
+                              created=time.strftime('%Y-%m-%d %H:%M:%S'))
+        for source in sources:
+            self.sources[tuple(source_key(source))] = {'fingerprint': file_fingerprint(source_key(source)[0]),
+                                                       'part': len(self.parts)}
+        for source in partial_sources:
+            self.sources[tuple(source_key(source))] = {'fingerprint': file_fingerprint(source_key(source)[0]),
+                                                       'part': len(self.parts), 'partial': True}
@@ -0,0 +1,160 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from xlsx_reader import open_reader, is_csv_file
+from merge_engine import match_sheets, DEFAULT_BATCH_SIZE, DEFAULT_WORKERS
+from external_sort import DEFAULT_SORT_MEMORY_ROWS
+from output_writers import choose_output_format, PARQUET_ROW_GROUP_SIZE
+from xlsx_writer import DEFAULT_WRITE_WORKERS, CHUNK_CELLS, MAX_SHARED_STRINGS
+
+# 以下速度和内存系数来自 merge_benchmark.py 在参考机器上的测量结果，只用于合并前的粗略估算
+PARSE_CELLS_PER_SECOND = 220000  # 每个解析进程每秒解析的单元格数
+WRITE_CELLS_PER_SECOND = {'xlsx': 550000, 'csv': 1400000, 'parquet': 1000000}  # 每秒写入的单元格数（xlsx为每个写入进程）
+SOURCE_SECONDS = 0.01  # 每个工作表额外的打开、检查第一行等耗时
+XML_BYTES_PER_CELL = 30  # 工作表没有记录数据区域时，按XML大小估算单元格数
+BASE_MEMORY_MB = 90  # 主进程的基础内存
+WORKER_MEMORY_MB = 40  # 每个解析进程的基础内存
+CELL_BYTES = 60  # 一批行数据中每个单元格约占的内存
+SHARED_STRING_BYTES = 100  # 解析进程加载的共享字符串表中每一项约占的内存
+OUTPUT_STRING_BYTES = 200  # 写入xlsx时共享字符串表中每一项约占的内存
+COMPACT_CELL_BYTES = 10  # 排序或输出Parquet时按紧凑类型缓存的每个单元格
+
+
+class SheetInfo:
+    """工作表的元数据：数据区域和压缩前后的大小"""
+
+    def __init__(self, name, dimension_ref, rows, cols, compressed_bytes, xml_bytes):
+        self.name = name
+        self.dimension_ref = dimension_ref  # 如 "A1:F1000"，没有记录时为 None
+        self.rows = rows
+        self.cols = cols
+        self.compressed_bytes = compressed_bytes
+        self.xml_bytes = xml_bytes
+
+    @property
+    def cells(self):
+        """单元格数；没有记录数据区域（也没有估算的行列数）时按XML大小估算"""
+        if self.dimension_ref is not None or self.rows:
+            return self.rows * self.cols
+        return self.xml_bytes // XML_BYTES_PER_CELL
+
+
+class WorkbookInfo:
+    """文件的元数据：只读取工作簿目录、各工作表开头的数据区域和共享字符串表的开头，不解析数据"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file_bytes = 0
+        self.mtime = None
+        self.sheets = []  # [SheetInfo]
+        self.shared_strings = 0  # 共享字符串表中不同文字的个数，未记录时为 None
+        self.error = None  # 无法读取时的错误信息
+
+    def selected_sheets(self, sheet_pattern=None):
+        """按工作表名称通配符选出会参与合并的工作表；CSV只有一个工作表，总是参与合并"""
+        if is_csv_file(self.path):
+            return list(self.sheets)
+        names = match_sheets([sheet.name for sheet in self.sheets], sheet_pattern)
+        return [sheet for sheet in self.sheets if sheet.name in names]
+
+
+def read_workbook_info(file_path):
+    """读取一个文件的元数据；出错时记录在 error 中而不是抛出异常"""
+    info = WorkbookInfo(file_path)
+    try:
+        stat = os.stat(file_path)
+        info.file_bytes, info.mtime = stat.st_size, stat.st_mtime
+        with open_reader(file_path) as reader:
+            if is_csv_file(file_path):
+                # CSV按文件开头的样本估算行数和列数
+                info.sheets.append(SheetInfo(reader.sheet_name, None, *(reader.read_dimension() or (0, 0)),
+                                             info.file_bytes, info.file_bytes))
+                return info
+            sizes = {item.filename: item for item in reader.archive.infolist()}
+            for name, sheet_path in reader.sheets:
+                ref = reader.read_dimension_ref(sheet_path)
+                dimension = reader.read_dimension(sheet_path) if ref else None
+                item = sizes.get(sheet_path)
+                info.sheets.append(SheetInfo(name, ref, *(dimension or (0, 0)),
+                                             item.compress_size if item else 0, item.file_size if item else 0))
+            info.shared_strings = reader.shared_string_count()
+    except Exception as e:
+        info.error = str(e)
+    return info
+
+
+def read_workbook_infos(file_paths, workers=8):
+    """并发读取多个文件的元数据，按列表顺序返回"""
+    if not file_paths:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(file_paths)))) as executor:
+        return list(executor.map(read_workbook_info, file_paths))
+
+
+class MergeEstimate:
+    """合并前的预估结果"""
+
+    def __init__(self):
+        self.files = 0
+        self.sheets = 0
+        self.rows = 0
+        self.cells = 0
+        self.shared_strings = 0
+        self.compressed_bytes = 0
+        self.output_format = None
+        self.peak_memory_bytes = 0
+        self.seconds = 0.0
+        self.unknown_dimensions = 0  # 没有记录数据区域、按大小估算的工作表数
+        self.errors = []  # [(文件路径, 错误信息)]
+
+
+def estimate_merge(infos, sheet_pattern=None, workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE,
+                   output_format='auto', write_workers=DEFAULT_WRITE_WORKERS, sort=False,
+                   sort_memory_rows=DEFAULT_SORT_MEMORY_ROWS):
+    """根据各文件的元数据估算总行数、峰值内存和耗时"""
+    estimate = MergeEstimate()
+    widest = 0
+    largest_strings = 0
+    for info in infos:
+        if info.error is not None:
+            estimate.errors.append((info.path, info.error))
+            continue
+        sheets = info.selected_sheets(sheet_pattern)
+        estimate.files += 1
+        estimate.sheets += len(sheets)
+        estimate.compressed_bytes += info.file_bytes
+        estimate.shared_strings += info.shared_strings or 0
+        largest_strings = max(largest_strings, info.shared_strings or 0)
+        for sheet in sheets:
+            estimate.rows += sheet.rows
+            estimate.cells += sheet.cells
+            estimate.unknown_dimensions += sheet.dimension_ref is None
+            widest = max(widest, sheet.cols)
+    if not estimate.sheets:
+        return estimate
+
+    estimate.output_format = choose_output_format(output_format, estimate.rows)
+    cpus = os.cpu_count() or 1
+    parse_workers = max(1, min(workers, cpus, estimate.sheets))
+    write_rate = WRITE_CELLS_PER_SECOND[estimate.output_format]
+    if estimate.output_format == 'xlsx':
+        write_rate *= max(1, min(write_workers, cpus))
+    estimate.seconds = (estimate.cells / (PARSE_CELLS_PER_SECOND * parse_workers) + estimate.cells / write_rate
+                        + estimate.sheets * SOURCE_SECONDS)
+
+    # 每个解析进程同时持有一个文件的共享字符串表和一批行数据
+    width = widest or max(1, estimate.cells // max(1, estimate.rows))
+    worker_bytes = (WORKER_MEMORY_MB * 1024 * 1024 + largest_strings * SHARED_STRING_BYTES
+                    + batch_size * width * CELL_BYTES)
+    memory = BASE_MEMORY_MB * 1024 * 1024 + parse_workers * worker_bytes
+    if estimate.output_format == 'xlsx':
+        # 输出的共享字符串表和排队等待写入的数据块
+        memory += min(estimate.shared_strings, MAX_SHARED_STRINGS) * OUTPUT_STRING_BYTES
+        memory += (max(1, write_workers) * 2 + 1) * CHUNK_CELLS * CELL_BYTES
+    elif estimate.output_format == 'parquet':
+        # 一个行组的缓冲数据
+        memory += min(estimate.cells, PARQUET_ROW_GROUP_SIZE * width) * COMPACT_CELL_BYTES
+    if sort:
+        memory += min(estimate.cells, sort_memory_rows * width) * COMPACT_CELL_BYTES
+    estimate.peak_memory_bytes = memory
+    return estimate
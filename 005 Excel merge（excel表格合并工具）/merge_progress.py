@@ -0,0 +1,99 @@
+import time
+
+PROGRESS_INTERVAL = 0.25  # 两次进度通知之间的最短间隔（秒）
+
+
+def format_duration(seconds):
+    """把秒数格式化为 "1小时2分"、"3分20秒"、"15秒"；未知时返回 "--" """
+    if seconds is None or seconds < 0:
+        return "--"
+    seconds = int(seconds + 0.5)
+    if seconds >= 3600:
+        return f"{seconds // 3600}小时{seconds % 3600 // 60}分"
+    if seconds >= 60:
+        return f"{seconds // 60}分{seconds % 60}秒"
+    return f"{seconds}秒"
+
+
+class ProgressTracker:
+    """按行数和字节数计算合并进度、速度和剩余时间
+
+    合并开始前根据每个来源记录的数据区域估算行数、按工作表XML大小估算所占字节数；
+    合并时按已处理的行数推算当前来源完成的比例，按字节数加权得到总进度，
+    因此一个大文件和许多小文件混在一起时进度也能平稳前进。
+    通知按时间间隔限流，每批数据只需记一次数；完成时调用 finish() 不受间隔限制地发送最终结果。
+
+    - on_progress(percent)：进度变化时通知（处理中为0-99，finish() 时为100）
+    - on_throughput(rows, rows_per_sec, mb_per_sec, eta_seconds)：已处理行数、速度和预计剩余秒数（未知时为-1）
+    """
+
+    def __init__(self, sizes, on_progress=None, on_throughput=None, interval=PROGRESS_INTERVAL):
+        self.sizes = list(sizes)  # 每个来源的 (估算行数, 字节数)
+        # 无法估算字节数的来源按1字节计算，至少保证完成时进度会前进
+        self.weights = [max(size_bytes, 1) for _, size_bytes in self.sizes]
+        self.total_bytes = sum(self.weights)
+        self.on_progress = on_progress
+        self.on_throughput = on_throughput
+        self.interval = interval
+        self.rows = 0  # 已处理的总行数
+        self.finished_bytes = 0  # 已完成来源的字节数
+        self.index = None  # 当前来源的序号
+        self.source_rows = 0  # 当前来源已处理的行数
+        self.started = time.perf_counter()
+        self.next_emit = 0.0
+        self.last_percent = -1
+
+    def start_source(self, index):
+        self.index = index
+        self.source_rows = 0
+
+    def finish_source(self):
+        if self.index is not None:
+            self.finished_bytes += self.weights[self.index]
+            self.index = None
+            self.source_rows = 0
+        return self.advance(0)
+
+    def advance(self, rows):
+        """记录处理了 rows 行；距上次通知超过间隔时发送通知并返回 True"""
+        self.rows += rows
+        self.source_rows += rows
+        now = time.perf_counter()
+        if now < self.next_emit:
+            return False
+        self.next_emit = now + self.interval
+        self.emit(now)
+        return True
+
+    def finish(self):
+        """全部完成时发送100%进度和最终的行数、速度，不受通知间隔限制"""
+        self.index = None
+        self.source_rows = 0
+        self.finished_bytes = self.total_bytes
+        self.emit(final=True)
+
+    def processed_bytes(self):
+        processed = self.finished_bytes
+        if self.index is not None:
+            estimated_rows = self.sizes[self.index][0]
+            if estimated_rows:
+                processed += self.weights[self.index] * min(1.0, self.source_rows / estimated_rows)
+        return processed
+
+    def emit(self, now=None, final=False):
+        now = time.perf_counter() if now is None else now
+        processed = self.processed_bytes()
+        if self.on_throughput is not None:
+            elapsed = max(now - self.started, 1e-6)
+            bytes_per_sec = processed / elapsed
+            eta = (self.total_bytes - processed) / bytes_per_sec if processed else -1
+            self.on_throughput(self.rows, self.rows / elapsed, bytes_per_sec / 1024 / 1024, eta)
+
+        if final:
+            percent = 100
+        else:
+            percent = min(99, int(processed / self.total_bytes * 100)) if self.total_bytes else 0
+        if percent != self.last_percent:
+            self.last_percent = percent
+            if self.on_progress is not None:
+                self.on_progress(percent)
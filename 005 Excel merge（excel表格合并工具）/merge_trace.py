@@ -0,0 +1,193 @@
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+TRACE_SUFFIX = '.trace.json'  # 阶段耗时记录保存为 输出文件路径 + 此后缀
+PROFILE_SUFFIX = '.profile'  # 性能分析结果保存为 输出文件路径 + 此后缀 + .prof / .txt
+PROFILE_TOP = 30  # 性能分析报告中列出的函数数
+TRACEMALLOC_TOP = 20  # 性能分析报告中列出的内存分配位置数
+TRACEMALLOC_FRAMES = 5
+
+# 各阶段的显示名称，按合并时的先后顺序排列
+STAGE_LABELS = {
+    'header_check': '检查第一行',
+    'open': '加载共享字符串和样式',
+    'unzip': '解压',
+    'parse': 'XML解析与类型转换',
+    'spill': '写临时文件',
+    'read': '读取批数据（含等待解析进程）',
+    'transform': '对齐与去重',
+    'summary': '分组汇总',
+    'write': '写入',
+    'sort': '排序',
+    'finalize': '保存文件',
+}
+# 按来源记录的整体耗时，包含各阶段，不计入阶段汇总
+SOURCE_SPAN = 'source'
+# 只用一个解析进程时在主进程中解析，这些阶段包含在读取批数据（read）的耗时中
+PARSE_STAGES = ('open', 'parse')
+
+
+class MergeTrace:
+    """合并各阶段的耗时记录（span）
+
+    每条记录为 (名称, 开始时间, 结束时间, 进程号, 线程号, 附加信息)，时间取 time.perf_counter()，
+    解析进程中的记录随解析结果交回主进程后合并在一起。可以导出为Chrome trace格式
+    （在 chrome://tracing 或 https://ui.perfetto.dev 中打开），也可以按阶段汇总耗时。
+    """
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def add(self, name, started, ended=None, **args):
+        """记录一段已经结束的耗时"""
+        if ended is None:
+            ended = time.perf_counter()
+        event = (name, started, ended, os.getpid(), threading.get_ident(), args)
+        with self._lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name, **args):
+        started = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.add(name, started, **args)
+
+    def extend(self, events):
+        """合并解析进程交回的记录"""
+        if events:
+            with self._lock:
+                self.events.extend(events)
+
+    def summary(self):
+        """按阶段汇总耗时，返回 [(阶段, 秒数, 次数)]，按 STAGE_LABELS 的顺序排列
+
+        parse 中包含解压的时间（记录在附加信息 unzip_seconds 中），汇总时分开统计；
+        在主进程中解析的耗时从读取批数据的耗时中扣除，各阶段之间不重复计算。
+        """
+        totals = {}
+        main_pid = os.getpid()
+        nested = 0.0
+        for name, started, ended, pid, _, args in self.events:
+            if name == SOURCE_SPAN:
+                continue
+            seconds = ended - started
+            if name in PARSE_STAGES and pid == main_pid:
+                nested += seconds
+            unzip = args.get('unzip_seconds', 0.0)
+            if unzip:
+                total = totals.setdefault('unzip', [0.0, 0])
+                total[0] += unzip
+                total[1] += 1
+                seconds -= unzip
+            total = totals.setdefault(name, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+        if 'read' in totals:
+            totals['read'][0] = max(0.0, totals['read'][0] - nested)
+        order = list(STAGE_LABELS)
+        return sorted(((name, seconds, count) for name, (seconds, count) in totals.items()),
+                      key=lambda item: order.index(item[0]) if item[0] in order else len(order))
+
+    def format_summary(self):
+        """阶段汇总的文字说明；解析进程中的阶段与主进程并行，各阶段之和可能超过总耗时"""
+        summary = self.summary()
+        total = sum(seconds for _, seconds, _ in summary) or 1.0
+        return "，".join(f"{STAGE_LABELS.get(name, name)} {seconds:.2f}秒（{seconds / total:.0%}）"
+                        for name, seconds, _ in summary if seconds >= 0.005)
+
+    def export_chrome(self, path):
+        """导出为Chrome trace格式的JSON文件"""
+        with self._lock:
+            events = list(self.events)
+        origin = min((started for _, started, _, _, _, _ in events), default=0.0)
+        main_pid = os.getpid()
+        trace_events = []
+        for pid in sorted({event[3] for event in events}):
+            trace_events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                                 'args': {'name': '主进程' if pid == main_pid else f'解析进程 {pid}'}})
+        for name, started, ended, pid, tid, args in events:
+            trace_events.append({
+                'name': STAGE_LABELS.get(name, args.get('source', name)),
+                'cat': name,
+                'ph': 'X',
+                'ts': round((started - origin) * 1e6, 1),
+                'dur': round((ended - started) * 1e6, 1),
+                'pid': pid,
+                'tid': tid,
+                'args': args,
+            })
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+
+
+def traced_batches(reader, batches, trace, source):
+    """逐批产出 reader 解析出的数据，同时记录加载共享字符串和样式的耗时、每批的解析耗时及其中解压的耗时"""
+    with trace.span('open', source=source):
+        reader.preload()
+    reader.time_unzip = True
+    batches = iter(batches)
+    unzip_seconds = 0.0
+    while True:
+        started = time.perf_counter()
+        try:
+            batch = next(batches)
+        except StopIteration:
+            return
+        args = {'source': source, 'rows': len(batch)}
+        timer = getattr(reader, 'unzip_timer', None)
+        if timer is not None:
+            args['unzip_seconds'] = timer.seconds - unzip_seconds
+            unzip_seconds = timer.seconds
+        trace.add('parse', started, **args)
+        yield batch
+
+
+class RunProfiler:
+    """用 cProfile 和 tracemalloc 分析一次合并：记录主进程各函数的耗时和内存分配位置"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.snapshot = None
+        self.peak_bytes = 0
+
+    def start(self):
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        if tracemalloc.is_tracing():
+            self.snapshot = tracemalloc.take_snapshot()
+            _, self.peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    def save(self, base_path):
+        """保存为 base_path.prof（可用 snakeviz 等工具查看）和 base_path.txt（文字报告），返回两个路径"""
+        prof_path, text_path = base_path + '.prof', base_path + '.txt'
+        self.profile.dump_stats(prof_path)
+        stream = io.StringIO()
+        stream.write(f"tracemalloc 峰值内存: {self.peak_bytes / 1024 / 1024:.1f} MB（仅主进程）\n\n")
+        stream.write(f"按累计耗时排列的前 {PROFILE_TOP} 个函数：\n")
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats('cumulative').print_stats(PROFILE_TOP)
+        if self.snapshot is not None:
+            stream.write(f"\n合并结束时占用内存最多的 {TRACEMALLOC_TOP} 个分配位置：\n")
+            for stat in self.snapshot.statistics('traceback')[:TRACEMALLOC_TOP]:
+                stream.write(f"{stat.size / 1024:.1f} KB，{stat.count} 个对象\n")
+                for line in stat.traceback.format():
+                    stream.write(f"  {line}\n")
+        with open(text_path, 'w', encoding='utf-8') as f:
+            f.write(stream.getvalue())
+        return prof_path, text_path
@@ -0,0 +1,205 @@
+import os
+import time
+import fnmatch
+import threading
+
+from merge_engine import ExcelMergeEngine, MergeError, MergeCancelled
+from merge_manifest import MergeManifest, manifest_path, is_part_file, whole_result_options
+from merge_checkpoint import file_fingerprint
+from xlsx_reader import INPUT_EXTENSIONS, list_sheets, split_source
+from group_summary import summary_owner
+
+DEFAULT_POLL_SECONDS = 2.0  # 扫描文件夹的间隔
+DEFAULT_DEBOUNCE_SECONDS = 10.0  # 文件夹中的文件停止变化这么久之后才开始合并
+IGNORED_PREFIXES = ('~$', '.')  # Excel打开文件时生成的锁文件、隐藏文件（含重新合并部分时的临时文件）
+DEFAULT_PART_ROWS = 100000  # 最后一个部分少于这么多行时，新的行接在它的末尾
+DEFAULT_RETRY_SECONDS = 30.0  # 合并失败后第一次重试前等待的时间，之后每次失败加倍
+MAX_RETRY_SECONDS = 600.0  # 重试等待时间的上限
+
+
+class FolderWatcher:
+    """监视文件夹，把新放入的文件追加合并到同一个合并结果
+
+    定时扫描文件夹（不依赖操作系统的文件通知，共享文件夹上也能使用），发现新增或修改过的文件后，
+    等到文件夹中的文件连续 debounce_seconds 秒没有变化（一批文件复制完成、文件写入完成）再合并一次。
+    第一次合并输出到 output_path；之后按合并清单追加合并（见 ExcelMergeEngine 的 append_to），
+    只读取清单中没有的文件。最后一个部分少于 part_rows 行时，新的行接在该部分的末尾，
+    达到 part_rows 行后才新建部分（合并结果_第2部分 等），因此部分数随总行数增长，而不是随合并次数增长。
+    删除重复行、排序和分组汇总作用于整个合并结果，无法逐次追加，不能在监视时使用。
+    合并成功后文件才记为已处理。合并失败时（如合并结果正在Excel中打开、磁盘暂时出错）这些文件等待
+    retry_seconds 秒后重试，每次失败等待时间加倍；第一行不一致的文件跳过到修改后再合并，其余文件下次扫描时重新合并。
+    """
+
+    def __init__(self, folder, output_path, engine_options=None, pattern=None,
+                 poll_seconds=DEFAULT_POLL_SECONDS, debounce_seconds=DEFAULT_DEBOUNCE_SECONDS,
+                 part_rows=DEFAULT_PART_ROWS, retry_seconds=DEFAULT_RETRY_SECONDS,
+                 on_merge_start=None, on_merged=None, on_error=None, on_warning=None):
+        self.folder = os.path.abspath(folder)
+        self.output_path = os.path.abspath(output_path)
+        self.engine_options = dict(engine_options or {})  # 传给 ExcelMergeEngine 的其他选项
+        blocked = whole_result_options(self.engine_options)
+        if blocked:
+            raise MergeError(f"监视文件夹时不能{'、'.join(blocked)}：每次只追加新文件的行，"
+                             f"无法与已合并的行一起处理")
+        self.pattern = pattern  # 文件名通配符，如 "*发票*.xlsx"；为空时监视所有支持的文件
+        self.poll_seconds = poll_seconds
+        self.debounce_seconds = debounce_seconds
+        self.part_rows = part_rows
+        self.retry_seconds = retry_seconds
+        self.on_merge_start = on_merge_start  # on_merge_start(files)：开始合并这些文件
+        self.on_merged = on_merged  # on_merged(engine)：合并完成，engine 中有输出路径和行数
+        self.on_error = on_error  # on_error(message)：合并失败或某个文件处理失败
+        self.on_warning = on_warning  # on_warning(message)：不影响合并的提醒，如跳过了合并后被修改过的文件
+        self.handled = {}  # 已合并（或因第一行不一致而跳过）的文件 -> 当时的文件指纹，修改后才会重新合并
+        self.retries = {}  # 合并失败的文件 -> (当时的指纹, 连续失败次数, 可以重试的时间)
+        self.snapshot = {}  # 上次扫描到的 文件 -> 指纹
+        self.last_change = None  # 文件夹中的文件最后一次变化的时间
+        self.engine = None
+        self.runs = 0
+        self._stop_event = threading.Event()
+
+    def _emit(self, callback, *args):
+        if callback is not None:
+            return callback(*args)
+        return None
+
+    def is_output(self, file_path):
+        """合并结果、追加合并生成的部分以及它们的汇总文件不作为输入"""
+        file_path = summary_owner(file_path) or file_path
+        return file_path == self.output_path or is_part_file(self.output_path, file_path)
+
+    def scan(self):
+        """扫描文件夹中要合并的文件，返回 文件 -> 指纹"""
+        files = {}
+        try:
+            entries = list(os.scandir(self.folder))
+        except OSError as e:
+            self._emit(self.on_error, f"无法读取文件夹 {self.folder}: {str(e)}")
+            return files
+        for entry in entries:
+            name = entry.name
+            if name.startswith(IGNORED_PREFIXES) or not name.lower().endswith(INPUT_EXTENSIONS):
+                continue
+            if self.pattern and not fnmatch.fnmatch(name.lower(), self.pattern.lower()):
+                continue
+            file_path = os.path.abspath(entry.path)
+            if self.is_output(file_path):
+                continue
+            try:
+                if entry.is_file():
+                    files[file_path] = file_fingerprint(file_path)
+            except OSError:
+                # 扫描时文件被删除或移走
+                continue
+        return files
+
+    def load_merged(self):
+        """读取合并清单中已合并且未修改的文件，作为已处理的文件"""
+        if not os.path.exists(self.output_path):
+            return
+        try:
+            manifest = MergeManifest.load(self.output_path)
+        except ValueError as e:
+            # 没有清单时无法判断哪些文件已经合并过，不能覆盖已有的合并结果
+            raise MergeError(f"合并结果 {self.output_path} 已存在，但{str(e)}")
+        for (file_path, _), item in manifest.sources.items():
+            self.handled[file_path] = item['fingerprint']
+
+    def waiting_retry(self, file_path, now):
+        """文件上次合并失败、还没到重试的时间；失败后被修改过的文件不需要等待"""
+        retry = self.retries.get(file_path)
+        return retry is not None and retry[0] == self.snapshot[file_path] and now < retry[2]
+
+    def pending(self, now=None):
+        """上次扫描到的文件中还没有合并、也不在等待重试的文件，按修改时间（相同时按文件名）排列"""
+        now = time.monotonic() if now is None else now
+        files = [path for path, fingerprint in self.snapshot.items()
+                 if self.handled.get(path) != fingerprint and not self.waiting_retry(path, now)]
+        return sorted(files, key=lambda path: (self.snapshot[path][1], path))
+
+    def retry_later(self, files, now):
+        """合并失败的文件等待一段时间后重试，同一版本的文件每次失败等待时间加倍；返回等待的秒数"""
+        delay = 0
+        for file_path in files:
+            fingerprint = self.snapshot[file_path]
+            retry = self.retries.get(file_path)
+            failures = retry[1] + 1 if retry is not None and retry[0] == fingerprint else 1
+            delay = min(self.retry_seconds * 2 ** (failures - 1), MAX_RETRY_SECONDS)
+            self.retries[file_path] = (fingerprint, failures, now + delay)
+        return delay
+
+    def mark_handled(self, files):
+        for file_path in files:
+            self.handled[file_path] = self.snapshot[file_path]
+            self.retries.pop(file_path, None)
+
+    def poll(self, now=None):
+        """扫描一次文件夹；有待合并的文件且文件夹已稳定 debounce_seconds 秒时合并，返回是否合并了"""
+        now = time.monotonic() if now is None else now
+        snapshot = self.scan()
+        if snapshot != self.snapshot or self.last_change is None:
+            self.snapshot = snapshot
+            self.last_change = now
+        if not self.pending(now) or now - self.last_change < self.debounce_seconds:
+            return False
+        self.merge_pending(now)
+        return True
+
+    def merge_pending(self, now=None):
+        """合并所有待合并的文件：第一次完整合并，之后追加到已有的合并结果"""
+        now = time.monotonic() if now is None else now
+        files = []
+        for file_path in self.pending(now):
+            try:
+                # 一个文件无法打开会使整次合并失败，先单独检查，无法打开的文件稍后再试
+                list_sheets(file_path)
+            except Exception as e:
+                delay = self.retry_later([file_path], now)
+                self._emit(self.on_error, f"无法打开文件 {os.path.basename(file_path)}，"
+                                          f"{delay:.0f} 秒后或修改后重试: {str(e)}")
+                continue
+            files.append(file_path)
+        if not files:
+            return
+        options = dict(self.engine_options, on_error=self.on_error, on_warning=self.on_warning)
+        if os.path.exists(manifest_path(self.output_path)):
+            options.update(append_to=self.output_path, output_path=None, max_part_rows=self.part_rows)
+        else:
+            options.update(output_path=self.output_path)
+        self.engine = ExcelMergeEngine(files, **options)
+        self._emit(self.on_merge_start, files)
+        self.runs += 1
+        try:
+            self.engine.run()
+        except MergeCancelled:
+            mismatched = {split_source(source)[0] for source in self.engine.mismatched_sources}
+            if mismatched and not self._stop_event.is_set():
+                # 第一行不一致的文件跳过到修改后，其余文件下次扫描时重新合并
+                self.mark_handled(sorted(mismatched))
+                self._emit(self.on_error, f"以下文件的第一行与合并结果不一致，已跳过，修改后会重新合并："
+                                          f"{'、'.join(os.path.basename(path) for path in sorted(mismatched))}")
+            else:
+                self._emit(self.on_error, "本次合并已取消，这些文件会在重新开始监视时合并")
+            return
+        except Exception as e:
+            # 监视需要持续运行，单次合并失败不退出；失败的原因可能是暂时的（如合并结果正在Excel中打开），稍后重试
+            delay = self.retry_later(files, now)
+            message = str(e) if isinstance(e, MergeError) else f"合并时出错: {str(e)}"
+            self._emit(self.on_error, f"{message}；{delay:.0f} 秒后重试")
+            return
+        self.mark_handled(files)
+        self._emit(self.on_merged, self.engine)
+
+    def run(self):
+        """持续监视文件夹，直到调用 stop()"""
+        self.load_merged()
+        while not self._stop_event.is_set():
+            self.poll()
+            self._stop_event.wait(self.poll_seconds)
+
+    def stop(self):
+        """停止监视（可从其他线程调用）；正在进行的合并会先取消"""
+        self._stop_event.set()
+        engine = self.engine
+        if engine is not None:
+            engine.cancel()
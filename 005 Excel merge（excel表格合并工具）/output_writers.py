@@ -0,0 +1,656 @@
+import os
+import csv
+import shutil
+import zipfile
+import datetime
+from collections import deque
+from functools import partial
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from openpyxl import Workbook
+
+from compact_types import CompactTyper
+from xlsx_reader import XlsxRowReader
+from xlsx_writer import (DEFAULT_WRITE_WORKERS, CHUNK_CELLS, STRINGS_CHUNK, MAX_SHARED_STRINGS, SHEET_START,
+                         SHEET_END, STRINGS_START, STRINGS_END, XlsxPackageError, ZipPackage, serialize_rows,
+                         serialize_strings, workbook_parts)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet输出为可选功能
+    pa = None
+    pq = None
+
+XLSX_MAX_ROWS = 1048576  # Excel单个工作表的最大行数
+PARQUET_ROW_GROUP_SIZE = 100000  # Parquet每个行组的行数
+
+OUTPUT_FORMATS = ('auto', 'xlsx', 'csv', 'parquet')
+COPY_CHUNK_SIZE = 4 * 1024 * 1024  # 继续写入已有文件时每次复制的字节数
+XLSX_WRITERS = ('parallel', 'openpyxl')  # xlsx输出的写入方式：多进程并行序列化 / openpyxl只写模式
+OUTPUT_EXTENSIONS = {'xlsx': '.xlsx', 'csv': '.csv', 'parquet': '.parquet'}
+
+
+class OutputWriteError(ValueError):
+    """写入输出文件失败（此时应中止整个合并，而不是跳过当前文件）"""
+
+
+def parquet_available():
+    """是否安装了写Parquet所需的pyarrow"""
+    return pa is not None
+
+
+def choose_output_format(output_format, estimated_rows):
+    """确定实际使用的输出格式
+
+    选择"auto"时，预计行数不超过Excel上限则输出xlsx，
+    否则优先输出Parquet（未安装pyarrow时输出CSV）。
+    """
+    if output_format != 'auto':
+        return output_format
+    if estimated_rows <= XLSX_MAX_ROWS:
+        return 'xlsx'
+    return 'parquet' if parquet_available() else 'csv'
+
+
+def make_output_path(output_dir, output_format, base_name="合并结果"):
+    """生成不覆盖已有文件的输出路径"""
+    ext = OUTPUT_EXTENSIONS[output_format]
+    output_path = os.path.join(output_dir, f"{base_name}{ext}")
+    counter = 1
+    while os.path.exists(output_path):
+        output_path = os.path.join(output_dir, f"{base_name}_{counter}{ext}")
+        counter += 1
+    return output_path
+
+
+class BaseWriter:
+    """流式输出写入器基类：逐批写入行数据"""
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.rows_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def write_rows(self, rows):
+        raise NotImplementedError
+
+    def tail_state(self):
+        """关闭后调用：之后用 continue_from() 在这个文件末尾继续写入所需的状态，保存在合并清单中；
+        不支持继续写入时返回 None"""
+        return None
+
+    def continue_from(self, part_path, rows, tail):
+        """在写入任何行之前调用：以之前由同类写入器输出的 part_path（共 rows 行）的内容开头，
+        之后写入的行接在它的末尾；tail 为当时 tail_state() 的返回值"""
+        raise NotImplementedError
+
+    def flush(self):
+        """把缓冲在内存中的数据写到磁盘（内存紧张时调用）"""
+
+    def close(self):
+        raise NotImplementedError
+
+    def discard(self):
+        """放弃输出并删除已写入的部分文件"""
+        try:
+            self.close()
+        except Exception:
+            pass
+        if os.path.exists(self.output_path):
+            os.remove(self.output_path)
+
+
+class XlsxRolloverWriter(BaseWriter):
+    """写入只写模式的xlsx，行数达到上限时自动新建工作表（合并结果_2、_3……）"""
+
+    def __init__(self, output_path, sheet_name='合并结果', max_rows=XLSX_MAX_ROWS, repeat_header=False):
+        super().__init__(output_path)
+        self.sheet_name = sheet_name
+        self.max_rows = max_rows
+        self.repeat_header = repeat_header  # 新工作表是否重复第一行
+        self.header = None
+        self.workbook = Workbook(write_only=True)
+        self.sheet_count = 0
+        self.sheet_rows = 0
+        self._new_sheet()
+
+    def _new_sheet(self):
+        self.sheet_count += 1
+        name = self.sheet_name if self.sheet_count == 1 else f"{self.sheet_name}_{self.sheet_count}"
+        self.sheet = self.workbook.create_sheet(name)
+        self.sheet_rows = 0
+        if self.sheet_count > 1 and self.repeat_header and self.header is not None:
+            self.sheet.append(self.header)
+            self.sheet_rows += 1
+
+    def write_rows(self, rows):
+        for row in rows:
+            if self.header is None:
+                self.header = row
+            if self.sheet_rows >= self.max_rows:
+                self._new_sheet()
+            self.sheet.append(row)
+            self.sheet_rows += 1
+        self.rows_written += len(rows)
+
+    def add_sheet(self, name, rows):
+        """在合并结果之后添加一个单独的工作表（如汇总表），之后不再写入合并结果的行"""
+        sheet = self.workbook.create_sheet(name)
+        for row in rows:
+            sheet.append(row)
+
+    def close(self):
+        if self.workbook is not None:
+            self.workbook.save(self.output_path)
+            self.workbook = None
+
+    def discard(self):
+        if self.workbook is not None:
+            self.workbook.close()
+            self.workbook = None
+        super().discard()
+
+
+class ParallelXlsxWriter(BaseWriter):
+    """多进程并行写入xlsx，行数达到上限时自动新建工作表（合并结果_2、_3……）
+
+    连续的若干行作为一个任务交给子进程序列化为工作表XML并压缩成独立的deflate数据块，
+    主进程按顺序把数据块拼接进zip文件，因此结果与逐行写入相同；文字统一放入一个共享字符串表，
+    由主进程分配序号。输出只有一块（数据较少）时直接在当前进程中序列化，不启动子进程。
+    """
+
+    def __init__(self, output_path, sheet_name='合并结果', max_rows=XLSX_MAX_ROWS, repeat_header=False,
+                 workers=DEFAULT_WRITE_WORKERS, chunk_cells=CHUNK_CELLS):
+        super().__init__(output_path)
+        self.sheet_name = sheet_name
+        self.max_rows = max_rows
+        self.repeat_header = repeat_header  # 新工作表是否重复第一行
+        self.workers = max(1, workers)
+        self.chunk_cells = chunk_cells
+        self.header = None
+        self.package = ZipPackage(output_path)
+        self.executor = None
+        self.pending = deque()  # 按输出顺序排列的序列化任务（Future）和工作表的开始/结束操作
+        self.in_flight = 0
+        self.strings = {}  # 共享字符串表：文字 -> 序号
+        self.string_cells = 0
+        self.sheet_names = []
+        self.sheet_rows = 0
+        self.buffer = []
+        self.buffer_first_row = 1
+        self.buffer_cells = 0
+        self._new_sheet()
+
+    def _sheet_title(self, number):
+        return self.sheet_name if number == 1 else f"{self.sheet_name}_{number}"
+
+    def _new_sheet(self):
+        if self.sheet_names:
+            self._submit_buffer()
+            self.pending.append(self._end_sheet)
+        count = len(self.sheet_names) + 1
+        self.sheet_names.append(self._sheet_title(count))
+        self.pending.append(partial(self._start_sheet, count))
+        self.sheet_rows = 0
+        if count > 1 and self.repeat_header and self.header is not None:
+            self._buffer_rows([self.header])
+
+    def _start_sheet(self, number):
+        self.package.start_member(f'xl/worksheets/sheet{number}.xml')
+        self.package.write_data(SHEET_START.encode('utf-8'))
+
+    def tail_state(self):
+        return {'sheets': len(self.sheet_names), 'sheet_rows': self.sheet_rows, 'string_cells': self.string_cells}
+
+    def continue_from(self, part_path, rows, tail):
+        """复制已有工作表的XML（最后一个工作表去掉结尾），沿用它的共享字符串表，新的行接在最后一个工作表的末尾"""
+        with XlsxRowReader(part_path) as reader:
+            strings = reader.shared_strings
+            self.header = reader.read_first_row() or None
+        self.strings = {value: index for index, value in enumerate(strings)}
+        self.string_cells = tail['string_cells']
+        self.pending.clear()
+        self.sheet_names = []
+        for number in range(1, tail['sheets'] + 1):
+            self.sheet_names.append(self._sheet_title(number))
+            self.pending.append(partial(self._copy_sheet, part_path, number, number == tail['sheets']))
+        self.sheet_rows = tail['sheet_rows']
+        self.rows_written = rows
+
+    def _copy_sheet(self, part_path, number, last):
+        name = f'xl/worksheets/sheet{number}.xml'
+        end = SHEET_END.encode('utf-8')
+        self.package.start_member(name)
+        with zipfile.ZipFile(part_path) as archive, archive.open(name) as f:
+            held = b''
+            for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+                # 保留末尾的几个字节，最后一个工作表去掉结尾后继续写入
+                data = held + chunk
+                held = data[-len(end):]
+                if len(data) > len(end):
+                    self.package.write_data(data[:-len(end)])
+        if held != end:
+            raise OutputWriteError(f"无法继续写入 {os.path.basename(part_path)}：工作表 {number} 的格式不是本程序生成的")
+        if not last:
+            self.package.write_data(end)
+            self._end_member()
+
+    def _end_sheet(self):
+        self.package.write_data(SHEET_END.encode('utf-8'))
+        self._end_member()
+
+    def _end_member(self):
+        try:
+            self.package.end_member()
+        except XlsxPackageError as e:
+            raise OutputWriteError(str(e))
+
+    def write_rows(self, rows):
+        if rows and self.header is None:
+            self.header = rows[0]
+        start = 0
+        while start < len(rows):
+            if self.sheet_rows >= self.max_rows:
+                self._new_sheet()
+            end = start + self.max_rows - self.sheet_rows
+            self._buffer_rows(rows[start:end])
+            start = end
+        self.rows_written += len(rows)
+
+    def add_sheet(self, name, rows):
+        """在合并结果之后添加一个单独的工作表（如汇总表），之后不再写入合并结果的行"""
+        self._submit_buffer()
+        self.pending.append(self._end_sheet)
+        self.sheet_names.append(name)
+        self.pending.append(partial(self._start_sheet, len(self.sheet_names)))
+        self.sheet_rows = 0
+        self._buffer_rows(rows)
+
+    def _buffer_rows(self, rows):
+        if not self.buffer:
+            self.buffer_first_row = self.sheet_rows + 1
+        self.buffer.extend(rows)
+        self.sheet_rows += len(rows)
+        self.buffer_cells += sum(map(len, rows))
+        if self.buffer_cells >= self.chunk_cells:
+            self._submit_buffer()
+
+    def _string_indexes(self, rows):
+        """为这些行中新出现的文字分配共享字符串序号，返回这些行用到的 文字 -> 序号"""
+        strings = self.strings
+        values = {value for row in rows for value in row if value.__class__ is str and value}
+        # 排序后分配序号，使相同的输入得到相同的输出文件
+        for value in sorted(values.difference(strings)):
+            if len(strings) >= MAX_SHARED_STRINGS:
+                break
+            strings[value] = len(strings)
+        return {value: strings[value] for value in values if value in strings}
+
+    def _submit(self, function, *args, final=False):
+        if self.executor is None and self.workers > 1 and not final:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        if self.executor is None:
+            future = Future()
+            future.set_result(function(*args))
+        else:
+            future = self.executor.submit(function, *args)
+        self.pending.append(future)
+        self.in_flight += 1
+        # 限制同时排队的任务数，避免待写入的数据占用过多内存
+        self._drain(self.workers * 2)
+
+    def _submit_buffer(self, final=False):
+        if not self.buffer:
+            return
+        rows, self.buffer = self.buffer, []
+        self.buffer_cells = 0
+        self._submit(serialize_rows, rows, self.buffer_first_row, self._string_indexes(rows), final=final)
+
+    def _drain(self, keep=0):
+        """按顺序写出已完成的任务，直到排队中的任务不超过 keep 个"""
+        while self.pending and (self.in_flight > keep or not isinstance(self.pending[0], Future)):
+            item = self.pending.popleft()
+            if not isinstance(item, Future):
+                item()
+                continue
+            self.in_flight -= 1
+            try:
+                data, crc, size, string_cells = item.result()
+            except Exception as e:
+                raise OutputWriteError(f"序列化xlsx数据失败: {e}")
+            self.package.write_fragment(data, crc, size)
+            self.string_cells += string_cells
+
+    def flush(self):
+        self._submit_buffer()
+        self._drain()
+        self.package.file.flush()
+
+    def close(self):
+        if self.package is None:
+            return
+        try:
+            self._submit_buffer(final=True)
+            self.pending.append(self._end_sheet)
+            self._drain()
+            has_shared_strings = bool(self.strings)
+            if has_shared_strings:
+                self._write_shared_strings()
+            for name, xml in workbook_parts(self.sheet_names, has_shared_strings):
+                self.package.write_member(name, xml.encode('utf-8'))
+            self.package.close()
+        except BaseException:
+            self._shutdown(wait=False)
+            raise
+        self.package = None
+        self._shutdown()
+
+    def _write_shared_strings(self):
+        self.package.start_member('xl/sharedStrings.xml')
+        self.package.write_data(STRINGS_START.format(count=self.string_cells, unique=len(self.strings)).encode('utf-8'))
+        # 字典按插入顺序排列，即序号顺序
+        strings = list(self.strings)
+        self.strings = {}
+        for start in range(0, len(strings), STRINGS_CHUNK):
+            self._submit(serialize_strings, strings[start:start + STRINGS_CHUNK],
+                         final=len(strings) <= STRINGS_CHUNK)
+        self.pending.append(partial(self.package.write_data, STRINGS_END.encode('utf-8')))
+        self.pending.append(self._end_member)
+        self._drain()
+
+    def _shutdown(self, wait=True):
+        if self.executor is not None:
+            # 出错或放弃输出时不等待子进程，参数无法序列化等错误可能使等待一直阻塞
+            self.executor.shutdown(wait=wait, cancel_futures=True)
+            self.executor = None
+
+    def discard(self):
+        if self.package is not None:
+            self.package.abort()
+            self.package = None
+        self._shutdown(wait=False)
+        self.pending.clear()
+        if os.path.exists(self.output_path):
+            os.remove(self.output_path)
+
+
+class CsvWriter(BaseWriter):
+    """流式写入CSV，默认带BOM的UTF-8编码，便于Excel直接打开"""
+
+    def __init__(self, output_path, encoding='utf-8-sig', delimiter=','):
+        super().__init__(output_path)
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self.file = open(output_path, 'w', encoding=encoding, newline='')
+        self.writer = csv.writer(self.file, delimiter=delimiter)
+
+    def tail_state(self):
+        return {}
+
+    def continue_from(self, part_path, rows, tail):
+        """复制已有的文件，之后的行追加在末尾（追加模式下不会再写入BOM）"""
+        self.file.close()
+        shutil.copyfile(part_path, self.output_path)
+        self.file = open(self.output_path, 'a', encoding=self.encoding, newline='')
+        self.writer = csv.writer(self.file, delimiter=self.delimiter)
+        self.rows_written = rows
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+        self.rows_written += len(rows)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class ParquetWriter(BaseWriter):
+    """流式写入Parquet
+
+    列类型根据第一个行组的数据推断（整数保持紧凑类型推断的位宽，混合类型的列按文本保存），之后的数据放不进这些类型时
+    放宽该列的类型（整数改为更宽的整数，整数与小数改为float64，其余改为文本）：已经写入的行组留在临时的分段文件中，
+    之后的行组按新类型写入，关闭时按最终的类型把各分段依次转换一次，已写入的行组不会因为多次放宽而被反复重写；
+    use_header 为 True 时把第一行作为列名；categorical_columns 中的列按字典编码（分类）保存。
+    缓冲中的行按紧凑类型（CompactTyper）保存，重复较多的文字列按分类（字典编码）写入。
+    """
+
+    def __init__(self, output_path, use_header=False, row_group_size=PARQUET_ROW_GROUP_SIZE,
+                 categorical_columns=(), typer=None):
+        if not parquet_available():
+            raise ValueError("输出Parquet需要安装pyarrow：pip install pyarrow")
+        super().__init__(output_path)
+        self.use_header = use_header
+        self.row_group_size = row_group_size
+        self.categorical_columns = set(categorical_columns)
+        self.typer = typer or CompactTyper()
+        self.header = None
+        self.schema = None
+        self.writer = None
+        self.buffer = []  # 紧凑类型的批数据
+        self.buffered_rows = 0
+        self.segments = []  # 放宽类型之前写入的分段文件，按写入顺序排列
+
+    def write_rows(self, rows):
+        if self.use_header and self.rows_written == 0 and rows:
+            self.header = rows[0]
+            rows = rows[1:]
+            self.rows_written += 1
+        if rows:
+            self.buffer.append(self.typer.encode(rows))
+            self.buffered_rows += len(rows)
+        self.rows_written += len(rows)
+        if self.buffered_rows >= self.row_group_size:
+            self._flush()
+
+    def flush(self):
+        self._flush()
+
+    def tail_state(self):
+        return {}
+
+    def continue_from(self, part_path, rows, tail):
+        """沿用已有文件的列名和列类型，原样复制它的行组"""
+        with pq.ParquetFile(part_path) as old_file:
+            self.schema = old_file.schema_arrow
+            self.header = list(self.schema.names)
+            self.writer = pq.ParquetWriter(self.output_path, self.schema)
+            for group in range(old_file.num_row_groups):
+                self.writer.write_table(old_file.read_row_group(group))
+        self.rows_written = rows
+
+    def _column_names(self, width):
+        names = []
+        header = self.header or []
+        for i in range(width):
+            name = header[i] if i < len(header) else None
+            name = str(name) if name not in (None, '') else f"列{i + 1}"
+            # 列名重复时追加序号
+            while name in names:
+                name = f"{name}_{i + 1}"
+            names.append(name)
+        return names
+
+    @staticmethod
+    def _infer_type(values):
+        types = {type(value) for value in values if value is not None}
+        if not types:
+            return pa.string()
+        if types == {int}:
+            return pa.int64()
+        if types <= {int, float}:
+            return pa.float64()
+        if types == {bool}:
+            return pa.bool_()
+        if types <= {datetime.datetime, datetime.date}:
+            return pa.timestamp('us')
+        return pa.string()
+
+    def _file_type(self, i, column):
+        """第 i 列在Parquet文件中的类型：分类列保持字典编码，整数保持紧凑类型推断的位宽"""
+        if i in self.categorical_columns or pa.types.is_dictionary(column.type):
+            return pa.dictionary(pa.int32(), pa.string())
+        if pa.types.is_floating(column.type):
+            return pa.float64()
+        if (pa.types.is_integer(column.type) or pa.types.is_boolean(column.type)
+                or pa.types.is_timestamp(column.type)):
+            return column.type
+        if pa.types.is_string(column.type):
+            return pa.string()
+        # 空列和混合类型的列按实际的值推断
+        return self._infer_type(CompactTyper.decode_column(column))
+
+    @staticmethod
+    def _common_type(current, new):
+        """文件中一列的类型为 current、新一批数据推断为 new 时，能同时容纳两者的类型"""
+        if current == new or pa.types.is_null(new):
+            return current
+        if pa.types.is_string(current) or pa.types.is_dictionary(current):
+            # 文本列中的其他类型的值按文字写入
+            return current
+        if pa.types.is_integer(current) and pa.types.is_integer(new):
+            return current if current.bit_width >= new.bit_width else new
+        number_types = (pa.types.is_integer, pa.types.is_floating)
+        if any(is_number(current) for is_number in number_types) and any(is_number(new) for is_number in number_types):
+            return pa.float64()
+        return pa.string()
+
+    def _end_segment(self):
+        """关闭正在写入的文件，保存为下一个分段文件"""
+        self.writer.close()
+        self.writer = None
+        segment_path = f"{self.output_path}.{len(self.segments)}.tmp"
+        os.replace(self.output_path, segment_path)
+        self.segments.append(segment_path)
+
+    def _widen(self, schema):
+        """放宽列类型：已写入的行组保存为分段文件，之后的行组按新类型写入"""
+        self._end_segment()
+        self.schema = schema
+        self.writer = pq.ParquetWriter(self.output_path, schema)
+
+    def _combine_segments(self):
+        """把各分段的行组按最终的类型转换后依次写入输出文件，每个行组只转换一次"""
+        self._end_segment()
+        with pq.ParquetWriter(self.output_path, self.schema) as writer:
+            for segment_path in self.segments:
+                with pq.ParquetFile(segment_path) as segment:
+                    for group in range(segment.num_row_groups):
+                        table = segment.read_row_group(group)
+                        arrays = [self._convert(table.column(i).combine_chunks(), field) if i < table.num_columns
+                                  else pa.nulls(table.num_rows, type=field.type)
+                                  for i, field in enumerate(self.schema)]
+                        writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+                os.remove(segment_path)
+        self.segments = []
+
+    @staticmethod
+    def _convert(column, field):
+        """把一列紧凑类型的数据转换为文件中的类型"""
+        if column.type == field.type:
+            return column
+        if pa.types.is_dictionary(field.type) and pa.types.is_string(column.type):
+            return column.dictionary_encode().cast(field.type)
+        if pa.types.is_string(field.type) and pa.types.is_dictionary(column.type):
+            return column.cast(field.type)
+        if pa.types.is_integer(field.type) and pa.types.is_integer(column.type):
+            return column.cast(field.type)
+        if pa.types.is_floating(field.type) and (pa.types.is_integer(column.type) or pa.types.is_floating(column.type)):
+            return column.cast(field.type)
+        values = CompactTyper.decode_column(column)
+        if pa.types.is_string(field.type) or pa.types.is_dictionary(field.type):
+            values = [None if value is None else str(value) for value in values]
+        return pa.array(values, type=field.type)
+
+    def _flush(self):
+        if not self.buffer:
+            return
+        table = self.typer.concat(self.buffer)
+        self.buffer = []
+        self.buffered_rows = 0
+        # 第0列记录的是每行的列数，数据从第1列开始
+        columns = table.columns[1:]
+        width = len(columns)
+
+        if self.schema is None:
+            width = max(width, len(self.header or []))
+            columns.extend(pa.nulls(table.num_rows) for _ in range(width - len(columns)))
+            names = self._column_names(width)
+            self.schema = pa.schema([pa.field(name, self._file_type(i, column))
+                                     for i, (name, column) in enumerate(zip(names, columns))])
+            self.writer = pq.ParquetWriter(self.output_path, self.schema)
+        else:
+            # 之后的数据放不进文件中的列类型、或者出现了新的列时放宽类型
+            fields = list(self.schema)
+            for i, field in enumerate(fields):
+                if i < width:
+                    fields[i] = field.with_type(self._common_type(field.type, self._file_type(i, columns[i])))
+            names = self._column_names(width)
+            fields.extend(pa.field(names[i], self._file_type(i, columns[i])) for i in range(len(fields), width))
+            schema = pa.schema(fields)
+            if schema != self.schema:
+                self._widen(schema)
+
+        arrays = []
+        for i, field in enumerate(self.schema):
+            column = columns[i] if i < width else pa.nulls(table.num_rows)
+            try:
+                arrays.append(self._convert(column, field))
+            except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+                # 推断的类型仍然放不下这些值（如超出范围的整数）时改为文本
+                self._widen(self.schema.set(i, field.with_type(pa.string())))
+                arrays.append(self._convert(column, self.schema[i]))
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self._flush()
+        if self.writer is None and self.header is not None:
+            # 只有表头没有数据行时，写出只有列名的空文件
+            self.schema = pa.schema([pa.field(name, pa.string())
+                                     for name in self._column_names(len(self.header))])
+            self.writer = pq.ParquetWriter(self.output_path, self.schema)
+        if self.writer is not None:
+            if self.segments:
+                self._combine_segments()
+            else:
+                self.writer.close()
+                self.writer = None
+
+    def discard(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        for path in self.segments + [self.output_path]:
+            if os.path.exists(path):
+                os.remove(path)
+        self.segments = []
+
+
+def create_writer(output_format, output_path, keep_first_header=False, categorical_columns=(), typer=None,
+                  xlsx_writer='parallel', workers=DEFAULT_WRITE_WORKERS):
+    """按输出格式创建写入器
+
+    categorical_columns 和 typer（缓冲数据的紧凑类型）只对Parquet生效，
+    xlsx_writer（写入方式，见 XLSX_WRITERS）和 workers（并行写入进程数）只对xlsx生效。
+    """
+    if output_format == 'xlsx':
+        if xlsx_writer == 'openpyxl':
+            return XlsxRolloverWriter(output_path, repeat_header=keep_first_header)
+        return ParallelXlsxWriter(output_path, repeat_header=keep_first_header, workers=workers)
+    if output_format == 'csv':
+        return CsvWriter(output_path)
+    if output_format == 'parquet':
+        return ParquetWriter(output_path, use_header=keep_first_header, categorical_columns=categorical_columns,
+                             typer=typer)
+    raise ValueError(f"不支持的输出格式: {output_format}")
@@ -0,0 +1,239 @@
+import os
+import glob
+import struct
+import hashlib
+import datetime
+
+try:
+    import pyarrow as pa
+except ImportError:  # 解析缓存为可选功能
+    pa = None
+
+CACHE_VERSION = 2  # 缓存格式或解析逻辑变化时加一，旧缓存自动失效
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.excel_merger_cache')
+DEFAULT_CACHE_SIZE_MB = 2048
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+ENTRY_EXT = '.arrows'
+STAMP_EXT = '.stamp'  # 文件路径、大小、修改时间 -> 缓存键，文件没有变化时不必计算内容哈希
+
+# Python类型与Arrow类型的对应关系；混合类型的列存为这些类型的联合（dense union）
+if pa is not None:
+    VALUE_TYPES = [
+        (bool, pa.bool_()),
+        (int, pa.int64()),
+        (float, pa.float64()),
+        (str, pa.string()),
+        (datetime.datetime, pa.timestamp('us')),
+        (datetime.time, pa.time64('us')),
+    ]
+    TYPE_CODES = {python_type: code for code, (python_type, _) in enumerate(VALUE_TYPES)}
+
+
+def cache_available():
+    """是否安装了解析缓存所需的pyarrow"""
+    return pa is not None
+
+
+def file_content_hash(file_path):
+    """计算文件内容的哈希"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _column_array(values):
+    """把一列Python值转换为Arrow数组：单一类型直接转换，混合类型转为dense union"""
+    types = {type(value) for value in values if value is not None}
+    if not types:
+        return pa.nulls(len(values))
+    if len(types) == 1:
+        python_type = types.pop()
+        return pa.array(values, type=VALUE_TYPES[TYPE_CODES[python_type]][1])
+    return union_array(values)
+
+
+def union_array(values):
+    """把一列Python值转换为dense union数组，无论实际有几种类型，数组的类型都相同"""
+    children = [[] for _ in VALUE_TYPES]
+    type_ids = []
+    offsets = []
+    for value in values:
+        # 空值放在第一个子数组中，以null表示
+        code = 0 if value is None else TYPE_CODES[type(value)]
+        offsets.append(len(children[code]))
+        children[code].append(value)
+        type_ids.append(code)
+    return pa.UnionArray.from_dense(
+        pa.array(type_ids, type=pa.int8()),
+        pa.array(offsets, type=pa.int32()),
+        [pa.array(child, type=arrow_type) for child, (_, arrow_type) in zip(children, VALUE_TYPES)],
+        [str(code) for code in range(len(VALUE_TYPES))],
+        list(range(len(VALUE_TYPES))),
+    )
+
+
+def rows_to_ipc(rows):
+    """把一批行数据编码为Arrow IPC流（按列存储）"""
+    width = max((len(row) for row in rows), default=0)
+    columns = [_column_array([row[i] if i < len(row) else None for row in rows]) for i in range(width)]
+    if not columns:
+        # 整批都是空行时只记录行数
+        columns = [pa.nulls(len(rows))]
+    batch = pa.record_batch(columns, names=[str(i) for i in range(len(columns))])
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue()
+
+
+def ipc_to_rows(buffer):
+    """把Arrow IPC流解码回行数据，去掉每行末尾的空值"""
+    batch = pa.ipc.open_stream(buffer).read_next_batch()
+    rows = [list(row) for row in zip(*(column.to_pylist() for column in batch.columns))]
+    for row in rows:
+        while row and row[-1] is None:
+            row.pop()
+    return rows
+
+
+def write_entry(batches, entry_path):
+    """把批数据写入缓存文件，同时原样产出这些批数据；全部写完后才生效"""
+    tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            for batch in batches:
+                data = rows_to_ipc(batch)
+                f.write(struct.pack('<Q', data.size))
+                f.write(data)
+                yield batch
+        os.replace(tmp_path, entry_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_entry(entry_path):
+    """按顺序读取缓存文件中的批数据"""
+    with open(entry_path, 'rb') as f:
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            size = struct.unpack('<Q', header)[0]
+            yield ipc_to_rows(pa.py_buffer(f.read(size)))
+
+
+class ParseCache:
+    """已解析文件内容的磁盘缓存
+
+    以内容哈希作为键，内容按Arrow列式格式保存；文件路径、大小和修改时间没有变化时直接使用上次的键，
+    不必重新读取整个文件计算哈希。总大小超过上限时按最近使用时间淘汰最旧的缓存。
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size_mb=DEFAULT_CACHE_SIZE_MB):
+        if not cache_available():
+            raise ValueError("解析缓存需要安装pyarrow：pip install pyarrow")
+        self.cache_dir = cache_dir
+        self.max_size_mb = max_size_mb
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def _digest(*parts):
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (CACHE_VERSION,) + parts:
+            digest.update(str(part).encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def key_for(self, file_path, options=''):
+        """计算文件的缓存键；options 为影响解析结果的选项
+
+        先按路径、大小和修改时间查找上次计算的键，找到且缓存仍在时直接返回；
+        否则计算内容哈希，内容没有变化（如只是修改时间变了）的文件仍能命中缓存。
+        """
+        stat = os.stat(file_path)
+        stamp_path = os.path.join(self.cache_dir, self._digest(os.path.abspath(file_path), stat.st_size,
+                                                               stat.st_mtime_ns, options) + STAMP_EXT)
+        try:
+            with open(stamp_path, encoding='utf-8') as f:
+                key = f.read().strip()
+            if key and os.path.exists(self.entry_path(key)):
+                return key
+        except OSError:
+            pass
+        key = self._digest(file_content_hash(file_path), options)
+        tmp_path = f"{stamp_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(key)
+            os.replace(tmp_path, stamp_path)
+        except OSError:
+            # 记录失败只会让下次重新计算哈希
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return key
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ENTRY_EXT)
+
+    def lookup(self, key):
+        """查找缓存，命中时更新其使用时间并返回缓存文件路径"""
+        path = self.entry_path(key)
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+        return None
+
+    def record(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def size_mb(self):
+        return sum(os.path.getsize(path) for path in glob.glob(os.path.join(self.cache_dir, '*' + ENTRY_EXT))) / 1024 / 1024
+
+    def evict(self):
+        """按最近使用时间淘汰缓存，直到总大小不超过上限"""
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, '*' + ENTRY_EXT)):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        limit = self.max_size_mb * 1024 * 1024
+        evicted = False
+        for _, size, path in sorted(entries):
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                evicted = True
+            except OSError:
+                pass
+        if evicted:
+            self._remove_stale_stamps()
+
+    def _remove_stale_stamps(self):
+        """删除指向已淘汰缓存的记录"""
+        for path in glob.glob(os.path.join(self.cache_dir, '*' + STAMP_EXT)):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    key = f.read().strip()
+                if not os.path.exists(self.entry_path(key)):
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for path in glob.glob(os.path.join(self.cache_dir, '*' + ENTRY_EXT)):
+            os.remove(path)
+        for path in glob.glob(os.path.join(self.cache_dir, '*' + STAMP_EXT)):
+            os.remove(path)
@@ -0,0 +1,367 @@
+import os
+import time
+import pickle
+import shutil
+import zipfile
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from xlsx_reader import open_reader, split_source
+from csv_reader import CsvRowReader, is_csv_file
+import csv_reader
+from parse_cache import ParseCache, read_entry, write_entry
+from merge_trace import MergeTrace, traced_batches
+
+WORKER_BASE_MEMORY_MB = 128  # 单个解析进程的基础内存估算（解释器 + 一批数据）
+SHARED_STRINGS_FACTOR = 4    # 共享字符串XML展开成Python字符串后的内存放大倍数
+CANCEL_MARKER = '.cancel'    # 临时目录中出现该文件时，子进程在下一批停止解析
+
+
+class ParseCancelled(Exception):
+    """解析被取消"""
+
+
+def iter_cancellable(batches, cancel_path):
+    """每产出一批前检查取消标记"""
+    for batch in batches:
+        if cancel_path and os.path.exists(cancel_path):
+            raise ParseCancelled()
+        yield batch
+
+
+def trace_label(file_path, sheet):
+    """耗时记录中来源的名称：文件名，或 文件名[工作表]"""
+    name = os.path.basename(file_path)
+    return f"{name}[{sheet}]" if isinstance(sheet, str) else name
+
+
+def read_batches(reader, batch_size, read_options=None, trace=None, source=None):
+    """reader.iter_batches；指定 trace 时同时记录每批的解析耗时"""
+    batches = reader.iter_batches(batch_size, **(read_options or {}))
+    if trace is None:
+        return batches
+    return traced_batches(reader, batches, trace, source)
+
+
+def write_spill(reader, batch_size, spill_dir, cancel_path=None, read_options=None, recorder=None, source=None):
+    """把 reader 解析出的每批行数据依次写入临时文件，返回临时文件路径"""
+    fd, spill_path = tempfile.mkstemp(suffix='.batches', dir=spill_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            batches = read_batches(reader, batch_size, read_options, recorder, source)
+            for batch in iter_cancellable(batches, cancel_path):
+                started = time.perf_counter()
+                pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+                if recorder is not None:
+                    recorder.add('spill', started, source=source, rows=len(batch))
+    except Exception:
+        os.remove(spill_path)
+        raise
+    return spill_path
+
+
+def parse_to_spill(file_path, sheet, batch_size, spill_dir, cancel_path=None, read_options=None, trace=False):
+    """在子进程中解析工作表，把每批行数据依次写入临时文件，返回 (临时文件路径, 耗时记录)
+
+    read_options 为传给行读取器 iter_batches 的列选择和筛选条件（columns / row_filter）；
+    trace 为 True 时记录解析和写临时文件的耗时（MergeTrace.events），否则耗时记录为 None
+    """
+    recorder = MergeTrace() if trace else None
+    with open_reader(file_path, sheet) as reader:
+        spill_path = write_spill(reader, batch_size, spill_dir, cancel_path, read_options, recorder,
+                                 trace_label(file_path, sheet))
+    return spill_path, recorder and recorder.events
+
+
+def parse_csv_block_to_spill(file_path, sheet, block, encoding, delimiter, batch_size, spill_dir, cancel_path=None,
+                             read_options=None, trace=False):
+    """在子进程中解析CSV文件的一个数据块（见 CsvRowReader.split_blocks），各块按切分时确定的编码和分隔符解析
+
+    返回 (临时文件路径, 块末尾没有产出的空行数, 块是否在引号外结束, 耗时记录)
+    """
+    recorder = MergeTrace() if trace else None
+    with CsvRowReader(file_path, sheet, encoding=encoding, delimiter=delimiter) as reader:
+        spill_path = write_spill(reader, batch_size, spill_dir, cancel_path, dict(read_options or {}, block=block),
+                                 recorder, trace_label(file_path, sheet))
+        return spill_path, reader.block_trailing_rows, reader.block_complete, recorder and recorder.events
+
+
+def cache_options(sheet, read_options=None):
+    """影响解析结果的选项，作为缓存键的一部分"""
+    if read_options:
+        return f"sheet={sheet!r};" + ';'.join(f"{name}={value!r}" for name, value in sorted(read_options.items()))
+    return f"sheet={sheet!r}"
+
+
+def parse_to_cache(file_path, sheet, batch_size, cache_dir, max_size_mb, cancel_path=None, read_options=None,
+                   trace=False):
+    """在子进程中查找解析缓存，未命中时解析工作表并写入缓存，返回 (缓存文件路径, 是否命中, 耗时记录)"""
+    cache = ParseCache(cache_dir, max_size_mb)
+    key = cache.key_for(file_path, cache_options(sheet, read_options))
+    entry_path = cache.lookup(key)
+    if entry_path is not None:
+        return entry_path, True, None
+    recorder = MergeTrace() if trace else None
+    entry_path = cache.entry_path(key)
+    with open_reader(file_path, sheet) as reader:
+        batches = read_batches(reader, batch_size, read_options, recorder, trace_label(file_path, sheet))
+        for _ in write_entry(iter_cancellable(batches, cancel_path), entry_path):
+            pass
+    return entry_path, False, recorder and recorder.events
+
+
+def read_spill(spill_path):
+    """按写入顺序读回临时文件中的各批数据，读完后删除临时文件"""
+    try:
+        with open(spill_path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    break
+    finally:
+        os.remove(spill_path)
+
+
+def estimate_worker_memory_mb(file_path):
+    """估算解析单个文件时子进程的内存占用（MB）"""
+    shared_strings_mb = 0
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            info = archive.getinfo('xl/sharedStrings.xml')
+            shared_strings_mb = info.file_size / 1024 / 1024
+    except (KeyError, OSError, zipfile.BadZipFile):
+        pass
+    return WORKER_BASE_MEMORY_MB + shared_strings_mb * SHARED_STRINGS_FACTOR
+
+
+def estimate_tasks(file_path):
+    """文件拆分成的解析任务数：大的CSV文件按数据块拆分，其余每个文件一个任务"""
+    if not is_csv_file(file_path):
+        return 1
+    try:
+        return max(1, os.path.getsize(file_path) // csv_reader.BLOCK_BYTES)
+    except OSError:
+        return 1
+
+
+def effective_workers(workers, file_list, memory_budget_mb=None, tasks=None):
+    """根据内存预算限制并行解析的进程数；tasks 为解析任务数，为空时每个文件一个任务"""
+    workers = max(1, min(workers, tasks or len(file_list), os.cpu_count() or 1))
+    if memory_budget_mb and file_list:
+        per_worker_mb = max(estimate_worker_memory_mb(path) for path in file_list)
+        workers = max(1, min(workers, int(memory_budget_mb // per_worker_mb)))
+    return workers
+
+
+class OrderedParsePool:
+    """多进程并行解析Excel文件，并按原列表顺序交回解析结果
+
+    子进程把解析好的批数据写入临时文件，主进程按顺序逐批读回，
+    因此主进程的内存占用与文件大小无关；同时在途的解析任务数不超过进程数。
+    大的CSV文件在开始解析时按数据块切分（见 CsvRowReader.split_blocks），每块作为一个任务并行解析，
+    单个CSV文件也能用上多个进程。
+    """
+
+    def __init__(self, workers=1, batch_size=10000, memory_budget_mb=None, controller=None, cache=None,
+                 trace=None):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.memory_budget_mb = memory_budget_mb
+        self.controller = controller  # MemoryBudgetController，内存紧张时缩小批大小并暂停派发
+        self.cache = cache  # ParseCache，已解析过且未修改的文件直接读取缓存
+        self.trace = trace  # MergeTrace，记录各来源每批的解析耗时（含子进程中的记录）
+        self.cancel_path = None
+        self._executor = None
+        self._spill_dir = None
+        self._tasks = []  # 按合并顺序排列的解析任务：(来源序号, 文件路径, 工作表, 数据块或None)
+        self._source_tasks = []  # 每个来源的任务序号
+        self._futures = {}  # 任务序号 -> 已派发的任务
+
+    @property
+    def current_batch_size(self):
+        if self.controller is not None:
+            return self.controller.batch_size
+        return self.batch_size
+
+    @property
+    def paused(self):
+        return self.controller is not None and self.controller.paused
+
+    def iter_files(self, sources, read_options=None):
+        """按列表顺序产出 (来源, 批数据迭代器)
+
+        来源为文件路径（读取第一个工作表）或 (文件路径, 工作表)，
+        同一文件的不同工作表作为独立任务并行解析。
+        read_options 为与来源一一对应的列选择和筛选条件（见 parse_to_spill），为空时读取全部数据。
+        某个来源解析失败时，异常会在迭代它的批数据时抛出，不影响其他来源。
+        """
+        if read_options is None:
+            read_options = [None] * len(sources)
+        file_list = [split_source(source)[0] for source in sources]
+        tasks = len(file_list) if self.cache is not None else sum(map(estimate_tasks, file_list))
+        workers = effective_workers(self.workers, file_list, self.memory_budget_mb, tasks)
+        if workers <= 1:
+            for source, options in zip(sources, read_options):
+                yield source, self._iter_local(*split_source(source), options)
+            return
+
+        self._spill_dir = tempfile.mkdtemp(prefix='excel_merge_')
+        self.cancel_path = os.path.join(self._spill_dir, CANCEL_MARKER)
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+        self._tasks, self._source_tasks, self._futures = [], [], {}
+        try:
+            for i, source in enumerate(sources):
+                self._plan(sources, read_options, i)
+                yield source, self._iter_source(sources, read_options, i, workers)
+        finally:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            self.cancel_path = None
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+
+    def _plan(self, sources, read_options, i):
+        """把前 i + 1 个来源拆分为解析任务；大的CSV文件每个数据块一个任务"""
+        while len(self._source_tasks) <= i:
+            index = len(self._source_tasks)
+            file_path, sheet = split_source(sources[index])
+            blocks = [None]
+            if self.cache is None and is_csv_file(file_path):
+                try:
+                    with CsvRowReader(file_path, sheet) as reader:
+                        blocks = [(block, reader.encoding, reader.delimiter) for block in reader.split_blocks()]
+                except Exception:
+                    # 无法切分时整个文件作为一个任务，错误在解析时报告
+                    blocks = [None]
+                if len(blocks) == 1:
+                    blocks = [None]
+            first = len(self._tasks)
+            self._tasks.extend((index, file_path, sheet, block) for block in blocks)
+            self._source_tasks.append(range(first, len(self._tasks)))
+
+    def _fill(self, sources, read_options, task, workers):
+        """从第 task 个任务起保持最多 workers 个任务在解析中；内存达到上限时只派发当前需要的任务"""
+        window = 1 if self.paused else workers
+        for j in range(task, task + window):
+            if j >= len(self._tasks) and len(self._source_tasks) < len(sources):
+                self._plan(sources, read_options, len(self._source_tasks))
+            if j >= len(self._tasks):
+                break
+            if j not in self._futures:
+                index, file_path, sheet, block = self._tasks[j]
+                if block is None:
+                    self._futures[j] = self._submit(self._executor, file_path, sheet, self._spill_dir,
+                                                    read_options[index])
+                else:
+                    self._futures[j] = self._submit_block(file_path, sheet, block, read_options[index])
+
+    def _iter_source(self, sources, read_options, i, workers):
+        """按顺序产出一个来源的各批数据；数据块的结果按顺序拼接"""
+        tasks = self._source_tasks[i]
+        try:
+            if len(tasks) == 1 and self._tasks[tasks[0]][3] is None:
+                self._fill(sources, read_options, tasks[0], workers)
+                yield from self._iter_future(self._futures.pop(tasks[0]))
+                return
+            empty_rows = 0  # 前面的块末尾还没有产出的空行，后面的块有数据时补齐
+            for task in tasks:
+                self._fill(sources, read_options, task, workers)
+                _, file_path, sheet, (block, encoding, delimiter) = self._tasks[task]
+                spill_path, trailing, complete, events = self._futures.pop(task).result()
+                self._add_trace(events)
+                if not complete:
+                    # 切分位置在引号包围的单元格中（没有引号包围的单元格中出现了引号），该块的最后一行不完整；
+                    # 从该块起把文件的剩余部分作为一块重新解析
+                    os.remove(spill_path)
+                    self._cancel_tasks(tasks)
+                    rest = (block[0], os.path.getsize(file_path))
+                    future = self._submit_block(file_path, sheet, (rest, encoding, delimiter), read_options[i])
+                    spill_path, trailing, _, events = future.result()
+                    self._add_trace(events)
+                for batch in read_spill(spill_path):
+                    if empty_rows:
+                        batch = [[] for _ in range(empty_rows)] + batch
+                        empty_rows = 0
+                    yield batch
+                empty_rows += trailing
+                if not complete:
+                    break
+        finally:
+            self._cancel_tasks(tasks)
+
+    def _cancel_tasks(self, tasks):
+        """取消还没有读取结果的任务；已经开始的任务解析完后，临时文件随临时目录一起删除"""
+        for task in tasks:
+            future = self._futures.pop(task, None)
+            if future is not None:
+                future.cancel()
+
+    def cancel(self):
+        """通知正在解析的子进程尽快停止"""
+        cancel_path = self.cancel_path
+        if cancel_path is not None:
+            try:
+                open(cancel_path, 'w').close()
+            except OSError:
+                pass
+
+    def _submit(self, executor, file_path, sheet, spill_dir, read_options=None):
+        if self.cache is not None:
+            return executor.submit(parse_to_cache, file_path, sheet, self.current_batch_size,
+                                   self.cache.cache_dir, self.cache.max_size_mb, self.cancel_path, read_options,
+                                   self.trace is not None)
+        return executor.submit(parse_to_spill, file_path, sheet, self.current_batch_size, spill_dir,
+                               self.cancel_path, read_options, self.trace is not None)
+
+    def _submit_block(self, file_path, sheet, block, read_options=None):
+        block, encoding, delimiter = block
+        return self._executor.submit(parse_csv_block_to_spill, file_path, sheet, block, encoding, delimiter,
+                                     self.current_batch_size, self._spill_dir, self.cancel_path, read_options,
+                                     self.trace is not None)
+
+    def _iter_local(self, file_path, sheet, read_options=None):
+        if self.cache is None:
+            yield from self._iter_reader(file_path, sheet, read_options)
+            return
+        key = self.cache.key_for(file_path, cache_options(sheet, read_options))
+        entry_path = self.cache.lookup(key)
+        self.cache.record(entry_path is not None)
+        if entry_path is not None:
+            yield from read_entry(entry_path)
+        else:
+            yield from write_entry(self._iter_reader(file_path, sheet, read_options), self.cache.entry_path(key))
+
+    def _iter_reader(self, file_path, sheet, read_options=None):
+        with open_reader(file_path, sheet) as reader:
+            batches = self._iter_reader_batches(reader, read_options)
+            if self.trace is not None:
+                batches = traced_batches(reader, batches, self.trace, trace_label(file_path, sheet))
+            yield from batches
+
+    def _iter_reader_batches(self, reader, read_options=None):
+        # 每批开始时读取当前批大小，内存紧张时后续批次随之变小
+        batch = []
+        batch_size = self.current_batch_size
+        for row in reader.iter_rows(**(read_options or {})):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+                batch_size = self.current_batch_size
+        if batch:
+            yield batch
+
+    def _iter_future(self, future):
+        if self.cache is None:
+            spill_path, events = future.result()
+            self._add_trace(events)
+            yield from read_spill(spill_path)
+            return
+        entry_path, hit, events = future.result()
+        self.cache.record(hit)
+        self._add_trace(events)
+        yield from read_entry(entry_path)
+
+    def _add_trace(self, events):
+        if self.trace is not None:
+            self.trace.extend(events)
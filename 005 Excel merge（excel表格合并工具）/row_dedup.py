@@ -0,0 +1,107 @@
+import os
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+
+DEFAULT_DEDUP_MEMORY_KEYS = 2000000  # 内存中最多保存的行哈希数，超过后转存到磁盘
+SQLITE_MAX_PARAMS = 500  # 每条查询语句的参数个数上限
+
+
+class RowDeduplicator:
+    """流式删除重复行
+
+    对整行或指定的列计算16字节哈希，只保留第一次出现的行。
+    哈希先保存在内存中，超过 memory_keys 个或调用 spill() 后转存到磁盘上的SQLite数据库，
+    之后内存占用不再随行数增长。
+    """
+
+    def __init__(self, key_columns=None, memory_keys=DEFAULT_DEDUP_MEMORY_KEYS, spill_dir=None):
+        self.key_columns = key_columns  # 从0开始的列序号，为空时按整行去重
+        self.memory_keys = memory_keys
+        self.spill_dir = spill_dir
+        self.seen = set()
+        self.db = None
+        self.db_dir = None
+        self.duplicates = 0  # 已删除的重复行数
+
+    @property
+    def on_disk(self):
+        return self.db is not None
+
+    def row_key(self, row):
+        """计算行（或指定列）的哈希"""
+        if self.key_columns is not None:
+            row = [row[i] if i < len(row) else None for i in self.key_columns]
+        else:
+            # 末尾的空单元格不影响比较
+            row = list(row)
+            while row and row[-1] is None:
+                row.pop()
+        return hashlib.blake2b(repr(row).encode('utf-8'), digest_size=16).digest()
+
+    def spill(self):
+        """把内存中的哈希转存到磁盘，之后的去重都在磁盘上进行"""
+        if self.db is None:
+            self.db_dir = tempfile.mkdtemp(prefix='excel_dedup_', dir=self.spill_dir)
+            self.db = sqlite3.connect(os.path.join(self.db_dir, 'seen.db'))
+            self.db.execute('PRAGMA journal_mode=OFF')
+            self.db.execute('PRAGMA synchronous=OFF')
+            self.db.execute('CREATE TABLE seen (key BLOB PRIMARY KEY) WITHOUT ROWID')
+        if self.seen:
+            self.db.executemany('INSERT OR IGNORE INTO seen VALUES (?)', ((key,) for key in self.seen))
+            self.db.commit()
+            self.seen = set()
+
+    def _existing_on_disk(self, keys):
+        existing = set()
+        for start in range(0, len(keys), SQLITE_MAX_PARAMS):
+            chunk = keys[start:start + SQLITE_MAX_PARAMS]
+            placeholders = ','.join('?' * len(chunk))
+            existing.update(key for (key,) in self.db.execute(
+                f'SELECT key FROM seen WHERE key IN ({placeholders})', chunk))
+        return existing
+
+    def filter(self, rows):
+        """返回去掉重复行后的行列表，保持原有顺序"""
+        keys = [self.row_key(row) for row in rows]
+        result = []
+        if self.db is None:
+            seen = self.seen
+            for row, key in zip(rows, keys):
+                if key in seen:
+                    continue
+                seen.add(key)
+                result.append(row)
+            if len(seen) > self.memory_keys:
+                self.spill()
+        else:
+            # 整批一次查询磁盘，批内的重复行用临时集合判断
+            existing = self._existing_on_disk(list(set(keys)))
+            new_keys = []
+            for row, key in zip(rows, keys):
+                if key in existing:
+                    continue
+                existing.add(key)
+                new_keys.append((key,))
+                result.append(row)
+            self.db.executemany('INSERT INTO seen VALUES (?)', new_keys)
+            self.db.commit()
+        self.duplicates += len(rows) - len(result)
+        return result
+
+    def close(self):
+        """删除磁盘上的哈希数据库"""
+        self.seen = set()
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+        if self.db_dir is not None:
+            shutil.rmtree(self.db_dir, ignore_errors=True)
+            self.db_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
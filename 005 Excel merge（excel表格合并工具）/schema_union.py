@@ -0,0 +1,70 @@
+from operator import itemgetter
+
+
+def _header_keys(header):
+    """把第一行转换为列键 (列名, 第几次出现)，同名列按出现顺序一一对应"""
+    counts = {}
+    keys = []
+    for value in header or []:
+        name = str(value).strip() if value is not None else ''
+        occurrence = counts.get(name, 0)
+        counts[name] = occurrence + 1
+        keys.append((name, occurrence))
+    return keys
+
+
+class SchemaUnion:
+    """按列名对齐多个文件：取所有文件列的并集，缺少的列填空
+
+    每个文件的列映射只在开始时计算一次并编译为 itemgetter，
+    合并时每行只需一次C层面的取值调用即可完成重排，不需要逐个单元格查找。
+    超出文件第一行宽度的单元格没有列名，对齐时去掉，不会落到其他文件的列中。
+    指定 base_header 时合并结果先按它排列列（如追加合并时已合并结果的列），再加上新出现的列。
+    """
+
+    def __init__(self, headers, base_header=None):
+        self.keys = []  # 合并后各列的列键，按第一次出现的顺序排列
+        positions = {}
+        for header in [base_header or []] + list(headers):
+            for key in _header_keys(header):
+                if key not in positions:
+                    positions[key] = len(self.keys)
+                    self.keys.append(key)
+        self.header = [name for name, _ in self.keys]
+        # mappings[i][j]：合并后第 j 列在第 i 个文件中的列序号，None 表示该文件没有这一列
+        self.mappings = []
+        self._getters = []
+        self._widths = []  # 每个文件第一行的宽度
+        for header in headers:
+            source_positions = {key: col for col, key in enumerate(_header_keys(header))}
+            mapping = [source_positions.get(key) for key in self.keys]
+            # 文件的列正好是合并结果的前几列时不需要重排（缺少的末尾列本来就是空的）
+            width = len(source_positions)
+            identity = mapping[:width] == list(range(width)) and all(col is None for col in mapping[width:])
+            self.mappings.append(None if identity else mapping)
+            self._widths.append(width)
+            self._getters.append(None if identity else self._compile(mapping, width))
+
+    @staticmethod
+    def _compile(mapping, width):
+        """把列映射编译为 (取值函数, 补齐用的空值列表)；缺少的列从补齐位置（第 width 列）取空值
+
+        取值前每行都截断到 width 列，补齐位置总是空值。
+        """
+        indexes = [col if col is not None else width for col in mapping]
+        getter = itemgetter(*indexes)
+        if len(indexes) == 1:
+            # itemgetter 只有一个序号时返回单个值而不是元组
+            return (lambda row: (row[indexes[0]],)), [None] * (width + 1)
+        return getter, [None] * (width + 1)
+
+    def reindex(self, index, batch):
+        """把第 index 个文件的一批数据按合并后的列顺序重排"""
+        compiled = self._getters[index]
+        width = self._widths[index]
+        if compiled is None:
+            # 列顺序不变，只需去掉超出第一行宽度的单元格
+            return [row[:width] if len(row) > width else row for row in batch]
+        getter, padding = compiled
+        # 行截断到第一行的宽度，末尾被省略的空单元格补齐到补齐位置，再一次取出所有列
+        return [list(getter(row[:width] + padding[min(len(row), width):])) for row in batch]
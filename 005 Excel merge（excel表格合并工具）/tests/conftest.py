@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 各模块位于项目目录下（没有打包），测试时直接导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
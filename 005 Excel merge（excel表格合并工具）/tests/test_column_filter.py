@@ -0,0 +1,120 @@
+import datetime
+
+import pytest
+
+from column_filter import RowFilter, parse_column_list, parse_filter_list, resolve_columns
+from merge_engine import ExcelMergeEngine, MergeError
+from xlsx_reader import column_index
+
+HEADER = ['日期', '金额', '备注', '状态']
+
+
+def _matches(condition, value, column='金额'):
+    row_filter = RowFilter.parse([condition], HEADER)
+    values = {} if value is None else {HEADER.index(column): value}
+    return row_filter.matches(values)
+
+
+@pytest.mark.parametrize('condition, expected', [
+    ('金额>1000', False),
+    ('金额>=1000', False),
+    ('金额<1000', False),
+    ('金额<=1000', False),
+    ('金额~1', False),
+    ('金额=1000', False),
+    ('金额==1000', False),
+    ('金额!=1000', True),
+    ('金额=', True),
+    ('金额==', True),
+    ('金额!=', False),
+])
+def test_empty_cell(condition, expected):
+    """空单元格只满足 "列=" 和 "列!=值"，不满足大小比较和包含"""
+    assert _matches(condition, None) is expected
+
+
+@pytest.mark.parametrize('condition, value, expected', [
+    ('金额>1000', 1000.5, True),
+    ('金额>1000', 1000, False),
+    ('金额>=1000', 1000, True),
+    ('金额<1000', 999, True),
+    ('金额<=1000', 1001, False),
+    ('金额=1000', 1000.0, True),
+    ('金额!=1000', 1000, False),
+    # 文本格式的单元格按文字比较
+    ('金额=1000', '1000', True),
+])
+def test_numeric_comparison(condition, value, expected):
+    assert _matches(condition, value) is expected
+
+
+@pytest.mark.parametrize('condition, value, expected', [
+    ('日期>=2024-01-01', datetime.datetime(2024, 1, 1), True),
+    ('日期>=2024-01-01', datetime.datetime(2023, 12, 31, 23, 59), False),
+    ('日期<2024/02/01', datetime.datetime(2024, 1, 31), True),
+    ('日期=20240105', datetime.datetime(2024, 1, 5), True),
+    ('日期>2024-01-01 12:00', datetime.datetime(2024, 1, 1, 12, 30), True),
+])
+def test_date_comparison(condition, value, expected):
+    assert _matches(condition, value, '日期') is expected
+
+
+@pytest.mark.parametrize('condition, value, expected', [
+    ('备注~退货', '客户退货', True),
+    ('备注~退货', '正常', False),
+    ('备注~12', 3127, True),
+])
+def test_contains(condition, value, expected):
+    assert _matches(condition, value, '备注') is expected
+
+
+def test_all_conditions_must_match():
+    row_filter = RowFilter.parse(['金额>100', '状态=已开票'], HEADER)
+    assert row_filter.columns == [1, 3]
+    assert row_filter.matches({1: 200, 3: '已开票'})
+    assert not row_filter.matches({1: 200, 3: '作废'})
+    assert not row_filter.matches({3: '已开票'})
+
+
+def test_boolean_cells():
+    assert _matches('状态=是', True, '状态')
+    assert not _matches('状态=是', False, '状态')
+
+
+def test_parse_errors():
+    with pytest.raises(ValueError, match='无法识别的筛选条件'):
+        RowFilter.parse(['金额'], HEADER)
+    with pytest.raises(ValueError, match='找不到列'):
+        RowFilter.parse(['税额>1'], HEADER)
+
+
+def test_column_lists():
+    assert parse_column_list('A， C,,发票号码 ') == ['A', 'C', '发票号码']
+    assert parse_column_list('') is None
+    assert parse_filter_list('金额>1；状态=已开票;') == ['金额>1', '状态=已开票']
+    assert resolve_columns(['金额', 'C', 0], HEADER) == [1, 2, 0]
+
+
+def test_name_missing_from_this_header_is_not_a_column_letter():
+    """其他文件第一行中有的列名（如 SKU）在本文件中缺少时报错，不当作列字母"""
+    header = ['发票号码', '金额']
+    names = {'发票号码', '金额', 'SKU'}
+    assert resolve_columns(['SKU'], header) == [column_index('SKU')]
+    with pytest.raises(ValueError, match='找不到列: SKU'):
+        resolve_columns(['SKU'], header, names)
+    with pytest.raises(ValueError, match='找不到列: SKU'):
+        RowFilter.parse(['SKU=1'], header, names)
+    assert resolve_columns(['B', 'SKU'], ['发票号码', '金额', 'SKU'], names) == [1, 2]
+
+
+@pytest.mark.parametrize('options', [{'columns': ['SKU', '数量']}, {'row_filters': ['SKU=A1']}])
+def test_engine_rejects_column_missing_from_one_file(tmp_path, options):
+    """按列名选择列或筛选时，某个文件缺少这一列就报错，而不是按列字母取到空列、筛掉所有行"""
+    first = tmp_path / '一月.csv'
+    first.write_text('SKU,数量\nA1,3\n', encoding='utf-8')
+    second = tmp_path / '二月.csv'
+    second.write_text('编码,数量\nA1,5\n', encoding='utf-8')
+    engine = ExcelMergeEngine([str(first), str(second)], output_path=str(tmp_path / '合并结果.csv'), workers=1,
+                              **options)
+    with pytest.raises(MergeError, match='二月.csv: 找不到列: SKU'):
+        engine.run()
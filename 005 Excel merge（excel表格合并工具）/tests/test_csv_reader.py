@@ -0,0 +1,175 @@
+import os
+import datetime
+
+import pytest
+
+import csv_reader
+from csv_reader import CsvRowReader, convert_value, detect_delimiter, detect_encoding
+from parse_pool import OrderedParsePool
+
+ROWS = [['编号', '名称', '金额'], ['001', '甲公司', '12.5'], ['2', '乙公司', '2024-01-31']]
+EXPECTED = [['编号', '名称', '金额'], ['001', '甲公司', 12.5], [2, '乙公司', datetime.datetime(2024, 1, 31)]]
+
+
+def _write(path, text, encoding):
+    with open(path, 'wb') as f:
+        f.write(text.encode(encoding))
+    return str(path)
+
+
+def _text(rows, delimiter=','):
+    return ''.join(delimiter.join(row) + '\r\n' for row in rows)
+
+
+@pytest.mark.parametrize('encoding, detected', [('utf-8-sig', 'utf-8-sig'), ('utf-8', 'utf-8'), ('gbk', 'gb18030')])
+def test_detect_encoding(tmp_path, encoding, detected):
+    path = _write(tmp_path / 'a.csv', _text(ROWS), encoding)
+    reader = CsvRowReader(path)
+    assert reader.encoding == detected
+    assert list(reader.iter_rows()) == EXPECTED
+    assert reader.read_first_row() == EXPECTED[0]
+
+
+def test_detect_encoding_ignores_truncated_utf8_at_sample_end():
+    """样本末尾截断的多字节字符不影响识别为UTF-8"""
+    assert detect_encoding('金额'.encode('utf-8')[:-1]) == 'utf-8'
+    assert detect_encoding('金额'.encode('gbk')) == 'gb18030'
+
+
+def test_gbk_after_ascii_sample_falls_back_to_gb18030(tmp_path, monkeypatch):
+    """开头的样本只有ASCII、后面出现GBK文字时改用gb18030读取，不会产生替换字符"""
+    monkeypatch.setattr(csv_reader, 'SAMPLE_BYTES', 64)
+    monkeypatch.setattr(csv_reader, 'READ_BYTES', 128)
+    rows = [['id', 'name']] + [[str(i), 'abc'] for i in range(50)] + [['99', '中文名称']]
+    path = _write(tmp_path / 'a.csv', _text(rows), 'gbk')
+    reader = CsvRowReader(path)
+    assert reader.encoding == 'utf-8'
+    result = list(reader.iter_rows())
+    assert result[-1] == [99, '中文名称']
+    assert reader.encoding == 'gb18030'
+    assert not any('�' in str(value) for row in result for value in row)
+
+
+def test_undecodable_content_raises(tmp_path, monkeypatch):
+    """UTF-8文字之后出现GBK文字时报错，而不是替换为乱码"""
+    monkeypatch.setattr(csv_reader, 'SAMPLE_BYTES', 64)
+    with open(tmp_path / 'a.csv', 'wb') as f:
+        f.write('编号,名称\r\n'.encode('utf-8') + b'1,abc\r\n' * 50 + '2,中文\r\n'.encode('gbk'))
+    reader = CsvRowReader(str(tmp_path / 'a.csv'))
+    assert reader.encoding == 'utf-8'
+    with pytest.raises(ValueError, match='无法按 utf-8 编码读取'):
+        list(reader.iter_rows())
+
+
+def test_explicit_encoding_does_not_fall_back(tmp_path):
+    path = _write(tmp_path / 'a.csv', 'a,b\r\n1,中文\r\n', 'gbk')
+    with pytest.raises(ValueError):
+        list(CsvRowReader(path, encoding='utf-8').iter_rows())
+
+
+@pytest.mark.parametrize('delimiter', [',', '\t', ';', '|'])
+def test_detect_delimiter(tmp_path, delimiter):
+    path = _write(tmp_path / 'a.csv', _text(ROWS, delimiter), 'utf-8')
+    assert CsvRowReader(path).delimiter == delimiter
+    assert detect_delimiter('a', 'b.tsv') == '\t'
+    assert detect_delimiter('abc', 'b.csv') == ','
+
+
+def test_quoted_newlines_across_read_blocks(tmp_path, monkeypatch):
+    """引号内的换行跨越读取块时仍然解析为同一个单元格"""
+    monkeypatch.setattr(csv_reader, 'READ_BYTES', 7)
+    text = 'a,b\r\n1,"第一行\r\n第二行, ""引号"""\r\n\r\n2,x\r\n\r\n\r\n'
+    path = _write(tmp_path / 'a.csv', text, 'utf-8')
+    # 中间的空行保留，末尾的空行去掉
+    assert list(CsvRowReader(path).iter_rows()) == [['a', 'b'], [1, '第一行\r\n第二行, "引号"'], [], [2, 'x']]
+
+
+def test_columns_and_dimension(tmp_path):
+    path = _write(tmp_path / 'a.csv', _text(ROWS), 'utf-8')
+    reader = CsvRowReader(path)
+    assert list(reader.iter_rows(columns=[2, 0])) == [[row[2], row[0]] for row in EXPECTED]
+    assert reader.read_dimension() == (3, 3)
+    assert reader.sheet_names == ['a']
+
+
+def test_convert_value():
+    assert convert_value('') is None
+    assert convert_value('-12') == -12
+    assert convert_value('0012') == '0012'
+    assert convert_value('110101199001011234') == '110101199001011234'
+    assert convert_value('.5') == 0.5
+    assert convert_value('2024/1/2 3:04') == datetime.datetime(2024, 1, 2, 3, 4)
+    assert convert_value('2024-02-30') == '2024-02-30'
+    assert convert_value('abc') == 'abc'
+
+
+def _block_text():
+    """引号内有换行和分隔符、中间有空行的CSV，用于按数据块解析"""
+    lines = ['编号,名称,备注']
+    for i in range(300):
+        if i % 7 == 0:
+            lines.append(f'{i},"多行\r\n第{i}行, ""引号""",x')
+        elif i % 11 == 0:
+            lines.append('')
+        else:
+            lines.append(f'{i},名称{i},')
+    return '\r\n'.join(lines) + '\r\n\r\n'
+
+
+@pytest.mark.parametrize('options', [{}, {'columns': [1, 0]}])
+def test_blocks_split_outside_quotes_and_match_sequential(tmp_path, options):
+    """数据块在引号外的换行处切分，逐块解析拼接后与按顺序解析的结果相同"""
+    path = _write(tmp_path / 'a.csv', _block_text(), 'utf-8')
+    reader = CsvRowReader(path)
+    blocks = reader.split_blocks(block_bytes=500)
+    assert len(blocks) > 5
+    assert blocks[0][0] == 0 and blocks[-1][1] == os.path.getsize(path)
+    assert all(end == start for (_, end), (start, _) in zip(blocks, blocks[1:]))
+
+    rows, empty_rows = [], 0
+    for block in blocks:
+        block_reader = CsvRowReader(path, encoding=reader.encoding)
+        block_rows = list(block_reader.iter_rows(block=block, **options))
+        assert block_reader.block_complete
+        if block_rows:
+            rows += [[]] * empty_rows + block_rows
+            empty_rows = 0
+        empty_rows += block_reader.block_trailing_rows
+    assert rows == list(reader.iter_rows(**options))
+
+
+def test_block_ending_inside_quotes_is_reported(tmp_path):
+    """没有引号包围的单元格中出现引号时按引号数切分可能落在单元格中间，解析该块时 block_complete 为 False"""
+    text = 'a,b\r\n1,5"\r\n2,"跨行\r\n单元格"\r\n3,x\r\n'
+    path = _write(tmp_path / 'a.csv', text, 'utf-8')
+    middle = text.encode('utf-8').index('单元格'.encode('utf-8'))
+    reader = CsvRowReader(path)
+    list(reader.iter_rows(block=(0, middle)))
+    assert not reader.block_complete
+    list(reader.iter_rows(block=(0, len('a,b\r\n1,5"\r\n'))))
+    assert reader.block_complete
+
+
+def test_split_blocks_resolves_gbk_after_ascii_prefix(tmp_path):
+    """开头只有ASCII、后面出现GBK文字时，切分时就确定按 gb18030 解码，各块使用同一编码"""
+    rows = [['id', 'name']] + [[str(i), 'abc'] for i in range(20000)] + [['99', '中文名称']]
+    path = _write(tmp_path / 'a.csv', _text(rows), 'gbk')
+    reader = CsvRowReader(path)
+    assert reader.encoding == 'utf-8'
+    blocks = reader.split_blocks(block_bytes=4096)
+    assert reader.encoding == 'gb18030'
+    block_reader = CsvRowReader(path, encoding=reader.encoding)
+    assert list(block_reader.iter_rows(block=blocks[-1]))[-1] == [99, '中文名称']
+
+
+@pytest.mark.parametrize('text', [_block_text(), 'a,b\r\n' + '1,5"\r\n' * 41 + '2,"跨\r\n行"\r\n' * 100])
+def test_parse_pool_parses_csv_blocks_in_parallel(tmp_path, monkeypatch, text):
+    """大的CSV文件按数据块分给多个解析进程，结果与按顺序解析相同；切分位置不对时从该块起按顺序重新解析"""
+    monkeypatch.setattr(csv_reader, 'BLOCK_BYTES', 400)
+    monkeypatch.setattr(os, 'cpu_count', lambda: 2)
+    path = _write(tmp_path / 'a.csv', text, 'utf-8')
+    other = _write(tmp_path / 'b.csv', _text(ROWS), 'utf-8')
+    pool = OrderedParsePool(workers=2, batch_size=25)
+    result = [[row for batch in batches for row in batch] for _, batches in pool.iter_files([path, other])]
+    assert len(pool._source_tasks[0]) > 3
+    assert result == [list(CsvRowReader(path).iter_rows()), EXPECTED]
@@ -0,0 +1,78 @@
+import csv
+import random
+import datetime
+
+import pytest
+
+from compact_types import CompactTyper, compact_types_available
+from external_sort import ExternalSorter, sort_value
+from merge_engine import ExcelMergeEngine
+
+
+def _rows(count, seed=7):
+    random.seed(seed)
+    values = [3, 1.5, '10', '9', '甲', '乙', None, '', datetime.datetime(2024, 5, 1), True]
+    # 第二列是原来的行号，用来检查关键列相同的行是否保持原来的顺序
+    return [[random.choice(values), i] for i in range(count)]
+
+
+def _sorted(sorter, batch_size=333):
+    return [row for batch in sorter.iter_batches(batch_size) for row in batch]
+
+
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('typed', [False, True])
+def test_sort_is_stable_across_spilled_runs(tmp_path, descending, typed):
+    """分多个有序段落盘并分组归并后，结果与内存中的稳定排序相同"""
+    if typed and not compact_types_available():
+        pytest.skip("需要pyarrow")
+    rows = _rows(5000)
+    sorter = ExternalSorter([0], descending=descending, memory_rows=400, spill_dir=str(tmp_path), max_fan_in=3,
+                            typer=CompactTyper() if typed else None)
+    with sorter:
+        for start in range(0, len(rows), 250):
+            sorter.add([list(row) for row in rows[start:start + 250]])
+        assert sorter.on_disk
+        result = _sorted(sorter)
+    expected = sorted(rows, key=lambda row: sort_value(row[0], descending), reverse=descending)
+    assert result == expected
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_sort_in_memory_matches_spilled():
+    """没有落盘时的结果与落盘后相同"""
+    rows = _rows(2000, seed=11)
+    results = []
+    for memory_rows in (10 ** 6, 150):
+        with ExternalSorter([0], memory_rows=memory_rows) as sorter:
+            sorter.add([list(row) for row in rows])
+            results.append(_sorted(sorter))
+    assert results[0] == results[1]
+
+
+def test_empty_cells_sort_last_in_both_directions():
+    """空单元格无论升序降序都排在最后"""
+    rows = [[None], [2], [''], [1]]
+    for descending in (False, True):
+        with ExternalSorter([0], descending=descending) as sorter:
+            sorter.add([list(row) for row in rows])
+            result = [row[0] for row in _sorted(sorter)]
+        assert result[:2] == ([1, 2] if not descending else [2, 1])
+        assert result[2:] == [None, '']
+
+
+def test_sorted_parquet_merge_counts_each_row_once_per_typer(tmp_path):
+    """排序后输出Parquet时，排序器和写入器各用一个紧凑类型，每行在各自的统计中只计入一次"""
+    if not compact_types_available():
+        pytest.skip("需要pyarrow")
+    path = str(tmp_path / '数据.csv')
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        csv.writer(f).writerows([['编号', '名称']] + [[i % 7, f'名称{i}'] for i in range(50)])
+    typing = []
+    engine = ExcelMergeEngine([path], output_path=str(tmp_path / '合并结果.parquet'), workers=1, batch_size=10,
+                              sort_columns=['编号'], on_typing=lambda *sizes: typing.append(sizes))
+    engine.run()
+    assert engine.sort_typer is not engine.typer
+    assert engine.sort_typer.rows == 50
+    assert engine.typer.rows == 50
+    assert typing[-1] == (engine.sort_typer.python_bytes, engine.sort_typer.arrow_bytes)
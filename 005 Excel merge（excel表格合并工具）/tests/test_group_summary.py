@@ -0,0 +1,88 @@
+import csv
+import datetime
+
+import pytest
+
+from group_summary import COUNT_HEADER, GroupSummary, parse_aggregations, parse_group_keys, summary_file_path, summary_owner
+from merge_engine import ExcelMergeEngine
+
+HEADER = ['公司', '开票日期', '金额']
+
+
+def test_summary_accumulates_across_batches():
+    """逐批累计的结果与一次累计所有行相同；空文字与空单元格为同一组，文本格式的数字参与求和"""
+    rows = [
+        ['甲', datetime.datetime(2024, 1, 5), 0.1],
+        ['乙', datetime.datetime(2024, 1, 9), '30'],
+        ['甲', datetime.datetime(2024, 2, 1), 0.2],
+        ['', datetime.datetime(2024, 2, 3), 5],
+        [None, '2024-03-01', '无'],
+        ['乙'],
+    ]
+    summary = GroupSummary(['公司'], ['sum:金额', 'count', 'max:开票日期'], HEADER)
+    summary.add(rows[:2])
+    summary.add(rows[2:])
+    assert summary.rows == len(rows)
+
+    expected = [
+        ['公司', '金额（合计）', COUNT_HEADER, '开票日期（最大值）'],
+        ['乙', 30.0, 2, datetime.datetime(2024, 1, 9)],
+        ['甲', 0.3, 2, datetime.datetime(2024, 2, 1)],
+        # 日期与文字比较时文字排在后面
+        [None, 5, 2, '2024-03-01'],
+    ]
+    result = summary.result_rows()
+    assert result[0] == expected[0]
+    assert sorted(result[1:], key=repr) == sorted(expected[1:], key=repr)
+
+
+def test_summary_groups_dates_by_month():
+    """按 "开票日期:月" 分组时，日期和日期文字都按年-月分组"""
+    summary = GroupSummary(['开票日期:月'], ['计数'], HEADER)
+    summary.add([
+        ['甲', datetime.datetime(2024, 1, 5), 1],
+        ['甲', '2024-01-20', 2],
+        ['乙', datetime.datetime(2024, 2, 1), 3],
+    ])
+    assert summary.result_rows() == [['开票日期（月）', COUNT_HEADER], ['2024-01', 2], ['2024-02', 1]]
+
+
+def test_summary_stops_when_groups_exceed_limit():
+    summary = GroupSummary(['公司'], [], HEADER, max_groups=2)
+    summary.add([['甲'], ['乙'], ['丙']])
+    assert summary.overflowed
+    assert summary.result_rows() == [['公司', COUNT_HEADER]]
+
+
+def test_parse_specs_and_rejects_unknown():
+    assert parse_group_keys(['公司', '开票日期：年']) == [('公司', None), ('开票日期', 'year')]
+    assert parse_aggregations(['合计:金额', 'count']) == [('sum', '金额'), ('count', None)]
+    with pytest.raises(ValueError):
+        parse_group_keys(['开票日期:周'])
+    with pytest.raises(ValueError):
+        parse_aggregations(['sum'])
+    with pytest.raises(ValueError):
+        GroupSummary(['地区'], [], HEADER)
+
+
+def test_summary_file_path_round_trip():
+    path = summary_file_path('合并结果.csv')
+    assert path == '合并结果_汇总.csv'
+    assert summary_owner(path) == '合并结果.csv'
+    assert summary_owner('合并结果.csv') is None
+
+
+def test_engine_warns_and_keeps_merging_when_groups_overflow(tmp_path):
+    """分组数超过上限只停止汇总并给出提醒，不作为错误，合并结果仍完整保存"""
+    path = str(tmp_path / '数据.csv')
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        csv.writer(f).writerows([['编号', '金额']] + [[i, i] for i in range(20)])
+    errors, warnings = [], []
+    engine = ExcelMergeEngine([path], output_path=str(tmp_path / '合并结果.csv'), workers=1, batch_size=5,
+                              group_by=['编号'], summary_max_groups=10,
+                              on_error=errors.append, on_warning=warnings.append)
+    engine.run()
+    assert errors == []
+    assert len(warnings) == 1 and '分组数超过 10 个' in warnings[0]
+    assert engine.total_rows == 21
+    assert engine.summary_path is None
@@ -0,0 +1,158 @@
+import random
+
+import pytest
+
+from join_engine import ExcelJoinEngine, HashJoin, JOIN_TYPES, LeftBuildHashJoin, normalize_key_value
+
+
+def _tables(seed=3):
+    random.seed(seed)
+    keys = [1, 2.0, '3', ' 4 ', '007', '甲', None, '']
+    keys += list(range(10, 300))
+    right = [[random.choice(keys), f'右{i}', i] for i in range(2000)]
+    left = [[random.choice(keys + list(range(300, 600))), f'左{i}'] for i in range(3000)]
+    return left, right
+
+
+def _join(left, right, join_type, first_match, memory_rows=10 ** 9, spill_after=None, tmp_path=None):
+    join = HashJoin([0], [0], 2, 3, join_type, first_match, memory_rows=memory_rows, partitions=7,
+                    spill_dir=str(tmp_path) if tmp_path else None)
+    try:
+        for start in range(0, len(right), 100):
+            join.add_build_rows(right[start:start + 100])
+            if spill_after is not None and start == spill_after:
+                join.spill()
+        result = []
+        for start in range(0, len(left), 250):
+            result.extend(join.probe(left[start:start + 250]))
+        result.extend(join.finish())
+        return result, join.partitioned, join.matched_rows
+    finally:
+        join.close()
+
+
+def _left_build_join(left, right, join_type, first_match, memory_rows=10 ** 9, spill_every=None, tmp_path=None):
+    join = LeftBuildHashJoin([0], [0], 2, 3, join_type, first_match, memory_rows=memory_rows,
+                             spill_dir=str(tmp_path) if tmp_path else None)
+    try:
+        for start in range(0, len(left), 250):
+            join.add_build_rows(left[start:start + 250])
+            if join.too_large:
+                return None
+        result = []
+        for index, start in enumerate(range(0, len(right), 100)):
+            result.extend(join.probe(right[start:start + 100]))
+            if spill_every and index % spill_every == 0:
+                join.spill()
+        result.extend(join.finish())
+        return result, join.matched_rows
+    finally:
+        join.close()
+
+
+@pytest.mark.parametrize('first_match', [True, False])
+@pytest.mark.parametrize('join_type', JOIN_TYPES)
+def test_left_build_join_equals_right_build_join(tmp_path, join_type, first_match):
+    """左表建哈希表（结果写到临时有序段后归并）的输出与右表建哈希表的输出相同，包括行的顺序"""
+    left, right = _tables()
+    expected, _, matched = _join(left, right, join_type, first_match)
+    for options in ({}, {'spill_every': 1}, {'spill_every': 7}, {'memory_rows': 3000}):
+        result, matched_rows = _left_build_join(left, right, join_type, first_match, tmp_path=tmp_path, **options)
+        assert result == expected
+        assert matched_rows == matched
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_left_build_join_reports_too_large():
+    """左表超过内存行数或读入左表时内存接近预算，标记为放不下，由调用方改用右表建表"""
+    left, right = _tables()
+    assert _left_build_join(left, right, 'left', True, memory_rows=1000) is None
+    join = LeftBuildHashJoin([0], [0], 2, 3)
+    join.add_build_rows(left[:10])
+    join.spill()
+    assert join.too_large
+    join.close()
+
+
+def _write_csv(path, rows):
+    path.write_text('\n'.join(','.join('' if v is None else str(v) for v in row) for row in rows) + '\n',
+                    encoding='utf-8')
+    return str(path)
+
+
+@pytest.mark.parametrize('join_type', JOIN_TYPES)
+def test_engine_build_side_does_not_change_output(tmp_path, join_type):
+    """关联引擎用左表或右表建哈希表得到相同的结果文件；auto 时选择行数较少的一边，左表放不下时改用右表"""
+    left_path = _write_csv(tmp_path / 'left.csv', [['编码', '名称']] + [[i % 40, f'左{i}'] for i in range(60)])
+    right_path = _write_csv(tmp_path / 'right.csv', [['编码', '值', '备注']] +
+                            [[i % 50, i, f'右{i}'] for i in range(200)])
+    outputs = {}
+    for build_side, memory_rows in (('right', 10 ** 6), ('left', 10 ** 6), ('auto', 10 ** 6), ('auto', 30),
+                                    ('left', 30)):
+        output = tmp_path / f'out_{build_side}_{memory_rows}.csv'
+        engine = ExcelJoinEngine(left_path, right_path, ['编码'], join_type=join_type, first_match=False,
+                                 memory_rows=memory_rows, build_side=build_side, output_path=str(output))
+        engine.run()
+        expected_side = 'left' if memory_rows > 60 and build_side != 'right' else 'right'
+        assert engine.built_side == expected_side
+        outputs[build_side, memory_rows] = output.read_text(encoding='utf-8-sig')
+    assert len(set(outputs.values())) == 1
+
+
+@pytest.mark.parametrize('first_match', [True, False])
+@pytest.mark.parametrize('join_type', JOIN_TYPES)
+def test_partitioned_join_equals_in_memory_join(tmp_path, join_type, first_match):
+    """右表超过内存行数（或中途落盘）后分区连接的结果与内存中连接的结果相同，包括行的顺序"""
+    left, right = _tables()
+    expected, partitioned, matched = _join(left, right, join_type, first_match)
+    assert not partitioned
+    for options in ({'memory_rows': 500}, {'spill_after': 0}, {'spill_after': 900}):
+        result, partitioned, matched_rows = _join(left, right, join_type, first_match, tmp_path=tmp_path, **options)
+        assert partitioned
+        assert result == expected
+        assert matched_rows == matched
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_left_join_keeps_left_order_and_fills_right_columns():
+    """左连接保持左表的顺序，没有匹配的行只有左表的列；关键列为空的行不参与匹配"""
+    left = [['b', 1], ['x', 2], ['a', 3], [None, 4]]
+    right = [['a', 'A', 10], ['b', 'B', 20], ['b', 'B2', 21], [None, 'N', 0]]
+    result, _, matched = _join(left, right, 'left', True)
+    assert result == [['b', 1, 'B', 20], ['x', 2], ['a', 3, 'A', 10], [None, 4]]
+    assert matched == 2
+
+
+def test_right_join_appends_unmatched_right_rows():
+    """右连接按右表的顺序在最后追加没有匹配的右表行，左表的关键列填写右表关键列的值"""
+    left = [['a', 1]]
+    right = [['c', 'C', 3], ['a', 'A', 1], ['b', 'B', 2], ['c', 'C2', 4]]
+    result, _, _ = _join(left, right, 'right', False)
+    assert result == [['a', 1, 'A', 1], ['c', None, 'C', 3], ['b', None, 'B', 2], ['c', None, 'C2', 4]]
+
+
+def test_normalize_key_value():
+    assert normalize_key_value(' 12 ') == 12
+    assert normalize_key_value(12.0) == 12
+    assert normalize_key_value('007') == '007'
+    assert normalize_key_value(1.5) == 1.5
+
+
+@pytest.mark.parametrize('build_side', ['left', 'right'])
+@pytest.mark.parametrize('join_type', JOIN_TYPES)
+def test_engine_key_column_outside_header(tmp_path, join_type, build_side):
+    """关键列用列字母指定到左表列名行以外时，各行的列数一致，右表独有的行填写关键列的值"""
+    left_path = _write_csv(tmp_path / 'left.csv', [['名称', '数量'], ['甲', 1, '', 'a', '多余'], ['乙', 2, '', 'x']])
+    right_path = _write_csv(tmp_path / 'right.csv', [['编码', '值'], ['a', 10], ['b', 20]])
+    output = tmp_path / 'out.csv'
+    engine = ExcelJoinEngine(left_path, right_path, ['D'], ['A'], join_type=join_type, build_side=build_side,
+                             output_path=str(output))
+    engine.run()
+    rows = [line.split(',') for line in output.read_text(encoding='utf-8-sig').splitlines()]
+    expected = {
+        'inner': [['甲', '1', '', 'a', '10']],
+        'left': [['甲', '1', '', 'a', '10'], ['乙', '2', '', 'x']],
+        'right': [['甲', '1', '', 'a', '10'], ['', '', '', 'b', '20']],
+        'full': [['甲', '1', '', 'a', '10'], ['乙', '2', '', 'x'], ['', '', '', 'b', '20']],
+    }[join_type]
+    assert rows == [['名称', '数量', '', '', '值']] + expected
@@ -0,0 +1,136 @@
+import os
+from functools import partial
+
+import pytest
+from openpyxl import Workbook
+
+import merge_engine
+from merge_engine import ExcelMergeEngine, MergeCancelled
+from merge_progress import ProgressTracker
+
+FILES = 6
+ROWS = 300
+
+
+def _write_xlsx(path, number, rows=ROWS):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(['文件', '序号', '金额'])
+    for i in range(rows):
+        sheet.append([f'文件{number}', i, i * 0.5])
+    workbook.save(path)
+
+
+@pytest.fixture
+def sources(tmp_path):
+    paths = []
+    for number in range(FILES):
+        path = str(tmp_path / f'数据{number}.xlsx')
+        _write_xlsx(path, number)
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture(autouse=True)
+def every_batch_progress(monkeypatch):
+    # 每批数据都通知进度，便于在合并到一半时取消
+    monkeypatch.setattr(merge_engine, 'ProgressTracker', partial(ProgressTracker, interval=0))
+
+
+def _engine(sources, output_path, checkpoint_dir, **options):
+    return ExcelMergeEngine(sources, output_format='csv', output_path=output_path, checkpoint=True,
+                            checkpoint_dir=checkpoint_dir, workers=1, batch_size=100, **options)
+
+
+def _cancel_halfway(sources, output_path, checkpoint_dir):
+    engine = _engine(sources, output_path, checkpoint_dir)
+
+    def on_progress(percent):
+        if percent >= 50:
+            engine.cancel()
+
+    engine.on_progress = on_progress
+    with pytest.raises(MergeCancelled):
+        engine.run()
+    assert not os.path.exists(output_path)
+
+
+def _reference(sources, tmp_path):
+    path = str(tmp_path / '参考.csv')
+    ExcelMergeEngine(sources, output_format='csv', output_path=path, workers=1, batch_size=100).run()
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_cancel_then_resume_gives_same_output(tmp_path, sources):
+    """合并到一半取消后再次合并，已完成的文件从检查点读取，结果与一次完成的合并相同"""
+    output_path = str(tmp_path / '合并结果.csv')
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    _cancel_halfway(sources, output_path, checkpoint_dir)
+
+    asked = []
+    engine = _engine(sources, output_path, checkpoint_dir,
+                     on_resume=lambda finished, total: asked.append((finished, total)) or True)
+    engine.run()
+    assert len(asked) == 1
+    finished, total = asked[0]
+    assert 0 < finished < total == FILES
+    assert engine.resumed_sources == finished
+    with open(output_path, 'rb') as f:
+        assert f.read() == _reference(sources, tmp_path)
+    # 合并成功后删除检查点
+    assert os.listdir(checkpoint_dir) == []
+
+
+def test_declined_resume_merges_everything(tmp_path, sources):
+    """选择不继续时删除检查点，重新解析所有文件"""
+    output_path = str(tmp_path / '合并结果.csv')
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    _cancel_halfway(sources, output_path, checkpoint_dir)
+
+    engine = _engine(sources, output_path, checkpoint_dir, on_resume=lambda finished, total: False)
+    engine.run()
+    assert engine.resumed_sources == 0
+    with open(output_path, 'rb') as f:
+        assert f.read() == _reference(sources, tmp_path)
+
+
+def test_file_changed_after_interruption_is_parsed_again(tmp_path, sources):
+    """中断后被修改过的文件不使用检查点中的结果"""
+    output_path = str(tmp_path / '合并结果.csv')
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    _cancel_halfway(sources, output_path, checkpoint_dir)
+    _write_xlsx(sources[0], 0, rows=ROWS + 5)
+
+    engine = _engine(sources, output_path, checkpoint_dir, on_resume=lambda finished, total: True)
+    engine.run()
+    assert engine.total_rows == FILES * ROWS + 5 + 1
+    with open(output_path, 'rb') as f:
+        assert f.read() == _reference(sources, tmp_path)
+
+
+def test_cancelled_merge_does_not_ask(tmp_path, sources):
+    """已请求取消时不再询问是否继续上次的合并或第一行不一致时是否继续，界面可能已不再回复"""
+    output_path = str(tmp_path / '合并结果.csv')
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    _cancel_halfway(sources, output_path, checkpoint_dir)
+
+    asked = []
+    engine = _engine(sources, output_path, checkpoint_dir, on_resume=lambda *args: asked.append(args) or True)
+    engine.cancel()
+    with pytest.raises(MergeCancelled):
+        engine.run()
+    assert asked == []
+    # 检查点保留，下次仍可继续
+    assert os.listdir(checkpoint_dir) != []
+
+    other = str(tmp_path / '其他.xlsx')
+    workbook = Workbook()
+    workbook.active.append(['编号', '名称'])
+    workbook.save(other)
+    engine = ExcelMergeEngine(sources + [other], output_format='csv', output_path=output_path, workers=1,
+                              on_header_mismatch=lambda names: asked.append(names) or True)
+    engine.cancel()
+    with pytest.raises(MergeCancelled):
+        engine.run()
+    assert asked == []
@@ -0,0 +1,333 @@
+import csv
+import json
+import os
+
+import pytest
+from openpyxl import load_workbook
+
+import merge_watch
+from merge_engine import ExcelMergeEngine, MergeError
+from merge_manifest import MergeManifest, is_part_file, manifest_path
+from merge_watch import FolderWatcher
+
+
+def _write_csv(path, number, rows=5):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['文件', '序号'])
+        writer.writerows([f'文件{number}', i] for i in range(rows))
+
+
+def _read_csv(path):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        return list(csv.reader(f))
+
+
+@pytest.fixture
+def sources(tmp_path):
+    paths = []
+    for number in range(4):
+        path = str(tmp_path / f'数据{number}.csv')
+        _write_csv(path, number)
+        paths.append(path)
+    return paths
+
+
+def _merge(files, output_path, **options):
+    engine = ExcelMergeEngine(files, output_format='csv', output_path=output_path, workers=1, **options)
+    return engine, engine.run()
+
+
+def test_append_merges_only_new_sources_into_a_new_part(tmp_path, sources):
+    """追加合并只读取清单中没有的文件，新的行写入第2部分，清单记录各来源所在的部分"""
+    output_path = str(tmp_path / '合并结果.csv')
+    _merge(sources[:2], output_path)
+    assert os.path.exists(manifest_path(output_path))
+
+    engine, part_path = _merge(sources, None, append_to=output_path)
+    assert os.path.basename(part_path) == '合并结果_第2部分.csv'
+    assert is_part_file(output_path, part_path)
+    assert engine.merged_sources == 2
+    rows = _read_csv(part_path)
+    assert [row[0] for row in rows[1:]] == ['文件2'] * 5 + ['文件3'] * 5
+    # 之前的部分不会重写
+    assert [row[0] for row in _read_csv(output_path)[1:]] == ['文件0'] * 5 + ['文件1'] * 5
+
+    manifest = MergeManifest.load(output_path)
+    assert [part['file'] for part in manifest.parts] == ['合并结果.csv', '合并结果_第2部分.csv']
+    assert [manifest.sources[(os.path.abspath(path), None)]['part'] for path in sources] == [1, 1, 2, 2]
+    assert not os.path.exists(manifest_path(part_path))
+
+
+def test_append_extends_small_last_part(tmp_path, sources):
+    """最后一个部分少于 max_part_rows 行时新的行接在该部分末尾，不新建部分，也不重新读取该部分的来源"""
+    output_path = str(tmp_path / '合并结果.csv')
+    _merge(sources[:2], output_path)
+    # 已合并的文件之后被修改：该部分中的行保持合并时的内容
+    _write_csv(sources[0], 0, rows=8)
+
+    warnings = []
+    engine, part_path = _merge(sources[:3], None, append_to=output_path, max_part_rows=100, on_warning=warnings.append)
+    assert part_path == os.path.abspath(output_path)
+    assert engine.merged_sources == 2
+    assert len(warnings) == 1 and '被修改过' in warnings[0]
+    rows = _read_csv(output_path)
+    assert rows[0] == ['文件', '序号']
+    assert [row[0] for row in rows[1:]] == ['文件0'] * 5 + ['文件1'] * 5 + ['文件2'] * 5
+    manifest = MergeManifest.load(output_path)
+    assert [part['rows'] for part in manifest.parts] == [16]
+    assert manifest.last_part_tail() is not None
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+    # 达到上限后新建部分
+    _, part_path = _merge(sources, None, append_to=output_path, max_part_rows=10)
+    assert os.path.basename(part_path) == '合并结果_第2部分.csv'
+    assert [row[0] for row in _read_csv(part_path)[1:]] == ['文件3'] * 5
+
+
+def test_append_without_new_sources_fails(tmp_path, sources):
+    output_path = str(tmp_path / '合并结果.csv')
+    _merge(sources, output_path)
+    with pytest.raises(MergeError, match='没有需要追加的新文件'):
+        _merge(sources, None, append_to=output_path)
+
+
+def test_append_skips_modified_sources(tmp_path, sources):
+    """合并后被修改过的文件不会重复追加，并给出提醒"""
+    output_path = str(tmp_path / '合并结果.csv')
+    _merge(sources[:2], output_path)
+    _write_csv(sources[0], 0, rows=8)
+    errors, warnings = [], []
+    engine, part_path = _merge(sources[:3], None, append_to=output_path, on_error=errors.append,
+                               on_warning=warnings.append)
+    assert [row[0] for row in _read_csv(part_path)[1:]] == ['文件2'] * 5
+    assert errors == []
+    assert len(warnings) == 1 and '被修改过' in warnings[0]
+
+
+def test_partially_merged_source_is_not_appended_again(tmp_path, sources, monkeypatch):
+    """文件处理到一半出错时，已写入的行留在合并结果中；清单记录为部分合并，追加合并时不会重复合并该文件"""
+    import parse_pool
+    original_open_reader = parse_pool.open_reader
+
+    class FailingReader:
+        def __init__(self, reader):
+            self.reader = reader
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            return self.reader.__exit__(*exc_info)
+
+        def iter_rows(self, **options):
+            for number, row in enumerate(self.reader.iter_rows(**options)):
+                if number == 3:
+                    raise ValueError('文件损坏')
+                yield row
+
+    def failing_open_reader(file_path, *args, **kwargs):
+        reader = original_open_reader(file_path, *args, **kwargs)
+        return FailingReader(reader.__enter__()) if file_path == sources[1] else reader
+
+    monkeypatch.setattr(parse_pool, 'open_reader', failing_open_reader)
+    output_path = str(tmp_path / '合并结果.csv')
+    errors = []
+    engine, _ = _merge(sources[:2], output_path, batch_size=2, on_error=errors.append)
+    assert engine.partial_sources == {1}
+    assert len(errors) == 1 and '已合并该文件的前 1 行' in errors[0]
+    assert [row[0] for row in _read_csv(output_path)[1:]] == ['文件0'] * 5 + ['文件1']
+    manifest = MergeManifest.load(output_path)
+    assert manifest.source_state(sources[1]) == 'partial'
+
+    monkeypatch.setattr(parse_pool, 'open_reader', original_open_reader)
+    warnings = []
+    engine, part_path = _merge(sources[:3], None, append_to=output_path, on_warning=warnings.append)
+    assert engine.merged_sources == 2
+    assert len(warnings) == 1 and '只合并了部分行' in warnings[0]
+    assert [row[0] for row in _read_csv(part_path)[1:]] == ['文件2'] * 5
+
+
+@pytest.mark.parametrize('options', [{'dedup': True}, {'sort_columns': ['序号']}, {'group_by': ['文件']}])
+def test_append_refuses_whole_result_options(tmp_path, sources, options):
+    """去重、排序和分组汇总作用于整个合并结果，不能追加合并"""
+    output_path = str(tmp_path / '合并结果.csv')
+    _merge(sources[:2], output_path)
+    with pytest.raises(MergeError, match='追加合并时不能'):
+        _merge(sources, None, append_to=output_path, **options)
+
+
+def test_append_refuses_when_previous_result_was_deduplicated(tmp_path, sources):
+    output_path = str(tmp_path / '合并结果.csv')
+    _merge(sources[:2], output_path, dedup=True)
+    with pytest.raises(MergeError, match='之前的合并结果经过了删除重复行'):
+        _merge(sources, None, append_to=output_path)
+
+
+def test_append_refuses_different_options(tmp_path, sources):
+    output_path = str(tmp_path / '合并结果.csv')
+    _merge(sources[:2], output_path)
+    with pytest.raises(MergeError, match='添加来源工作表列'):
+        _merge(sources, None, append_to=output_path, add_source_sheet=True)
+
+
+def test_append_requires_manifest(tmp_path, sources):
+    output_path = str(tmp_path / '合并结果.csv')
+    _merge(sources[:2], output_path)
+    os.remove(manifest_path(output_path))
+    with pytest.raises(MergeError, match='找不到合并清单'):
+        _merge(sources, None, append_to=output_path)
+
+
+def test_manifest_round_trip(tmp_path, sources):
+    output_path = str(tmp_path / '合并结果.csv')
+    _merge(sources[:2], output_path)
+    with open(manifest_path(output_path), encoding='utf-8') as f:
+        data = json.load(f)
+    manifest = MergeManifest.load(output_path)
+    assert manifest.header == ['文件', '序号']
+    assert manifest.output_format == 'csv'
+    assert len(data['sources']) == 2
+    assert manifest.parts[0]['rows'] == 11
+    assert manifest.last_part_tail() == {}
+
+
+def test_is_part_file(tmp_path):
+    output_path = str(tmp_path / '合并结果.xlsx')
+    assert is_part_file(output_path, str(tmp_path / '合并结果_第2部分.xlsx'))
+    assert is_part_file(output_path, str(tmp_path / '合并结果_第12部分_1.xlsx'))
+    assert not is_part_file(output_path, str(tmp_path / '合并结果.xlsx'))
+    assert not is_part_file(output_path, str(tmp_path / '其他_第2部分.xlsx'))
+    assert not is_part_file(output_path, str(tmp_path / 'sub' / '合并结果_第2部分.xlsx'))
+
+
+@pytest.mark.parametrize('output_format', ['xlsx', 'parquet'])
+def test_append_continues_xlsx_and_parquet_parts(tmp_path, sources, output_format):
+    """xlsx和Parquet的最后一个部分同样按记录的结尾状态继续写入，结果与一次合并所有文件相同"""
+    if output_format == 'parquet':
+        pq = pytest.importorskip('pyarrow.parquet')
+    output_path = str(tmp_path / f'合并结果.{output_format}')
+    expected_path = str(tmp_path / f'一次合并.{output_format}')
+    options = dict(output_format=output_format, workers=1)
+    ExcelMergeEngine(sources, output_path=expected_path, **options).run()
+    ExcelMergeEngine(sources[:1], output_path=output_path, **options).run()
+    for count in (2, 4):
+        part_path = ExcelMergeEngine(sources[:count], append_to=output_path, max_part_rows=100, **options).run()
+        assert part_path == os.path.abspath(output_path)
+
+    if output_format == 'xlsx':
+        def read(path):
+            return [list(row) for row in load_workbook(path, read_only=True).active.iter_rows(values_only=True)]
+    else:
+        def read(path):
+            return pq.read_table(path).to_pylist()
+    assert read(output_path) == read(expected_path)
+    assert MergeManifest.load(output_path).parts[0]['rows'] == 21
+
+
+def test_append_starts_new_part_when_last_part_was_edited(tmp_path, sources):
+    """最后一个部分在合并后被修改过（如在Excel中编辑保存）时不在它末尾继续写入，新的行写入新的部分"""
+    output_path = str(tmp_path / '合并结果.csv')
+    _merge(sources[:2], output_path)
+    with open(output_path, 'a', encoding='utf-8') as f:
+        f.write('手工添加,1\n')
+    _, part_path = _merge(sources[:3], None, append_to=output_path, max_part_rows=100)
+    assert os.path.basename(part_path) == '合并结果_第2部分.csv'
+    assert _read_csv(output_path)[-1] == ['手工添加', '1']
+
+
+def test_watch_appends_new_files_to_last_part(tmp_path, monkeypatch):
+    """监视文件夹：每次放入的新文件接在最后一个部分末尾，之前合并过的文件不再读取"""
+    folder = tmp_path / '收件箱'
+    folder.mkdir()
+    output_path = str(tmp_path / '合并结果.csv')
+    opened = []
+    import parse_pool
+    original_open_reader = parse_pool.open_reader
+
+    def counting_open_reader(file_path, *args, **kwargs):
+        opened.append(os.path.basename(file_path))
+        return original_open_reader(file_path, *args, **kwargs)
+
+    monkeypatch.setattr(parse_pool, 'open_reader', counting_open_reader)
+    errors = []
+    watcher = FolderWatcher(str(folder), output_path, {'output_format': 'csv', 'workers': 1},
+                            debounce_seconds=1, part_rows=12, on_error=errors.append)
+    now = 0
+    for number in range(4):
+        _write_csv(str(folder / f'数据{number}.csv'), number)
+        opened.clear()
+        assert not watcher.poll(now)
+        assert watcher.poll(now + 2)
+        now += 10
+        # 只读取本次放入的文件
+        assert opened == [f'数据{number}.csv']
+
+    assert errors == []
+    assert [row[0] for row in _read_csv(output_path)[1:]] == ['文件0'] * 5 + ['文件1'] * 5 + ['文件2'] * 5
+    part_path = str(tmp_path / '合并结果_第2部分.csv')
+    assert [row[0] for row in _read_csv(part_path)[1:]] == ['文件3'] * 5
+    manifest = MergeManifest.load(output_path)
+    assert [part['rows'] for part in manifest.parts] == [16, 6]
+
+
+def test_watch_retries_failed_merge_with_back_off(tmp_path, monkeypatch):
+    """监视文件夹：合并失败（如合并结果被占用）时文件不记为已合并，等待时间逐次加倍后重试"""
+    folder = tmp_path / '收件箱'
+    folder.mkdir()
+    output_path = str(tmp_path / '合并结果.csv')
+    failures = [OSError('合并结果正在被其他程序使用')] * 2
+
+    class FlakyEngine(ExcelMergeEngine):
+        def run(self):
+            if failures:
+                raise failures.pop()
+            return super().run()
+
+    monkeypatch.setattr(merge_watch, 'ExcelMergeEngine', FlakyEngine)
+    errors = []
+    watcher = FolderWatcher(str(folder), output_path, {'output_format': 'csv', 'workers': 1},
+                            debounce_seconds=1, retry_seconds=30, on_error=errors.append)
+    for number in range(2):
+        _write_csv(str(folder / f'数据{number}.csv'), number)
+    assert not watcher.poll(0)
+    assert watcher.poll(2)
+    assert errors[-1].endswith('30 秒后重试')
+    assert not watcher.poll(31)
+    assert watcher.poll(33)
+    assert errors[-1].endswith('60 秒后重试')
+    assert not watcher.poll(92)
+    assert watcher.poll(94)
+    assert len(errors) == 2
+    assert [row[0] for row in _read_csv(output_path)[1:]] == ['文件0'] * 5 + ['文件1'] * 5
+    assert watcher.retries == {}
+
+
+def test_watch_skips_only_files_with_mismatched_header(tmp_path):
+    """监视文件夹：第一行不一致的文件跳过到修改后再合并，同一批的其他文件下次扫描时照常合并"""
+    folder = tmp_path / '收件箱'
+    folder.mkdir()
+    output_path = str(tmp_path / '合并结果.csv')
+    errors = []
+    watcher = FolderWatcher(str(folder), output_path, {'output_format': 'csv', 'workers': 1},
+                            debounce_seconds=1, on_error=errors.append)
+    other = str(folder / '其他.csv')
+    with open(other, 'w', encoding='utf-8', newline='') as f:
+        csv.writer(f).writerows([['编号', '名称'], [1, '甲']])
+    for number in range(2):
+        path = str(folder / f'数据{number}.csv')
+        _write_csv(path, number)
+        os.utime(path, (number, number))
+    assert not watcher.poll(0)
+    assert watcher.poll(2)
+    assert len(errors) == 1 and '其他.csv' in errors[0]
+    assert not os.path.exists(output_path)
+    assert watcher.poll(3)
+    assert [row[0] for row in _read_csv(output_path)[1:]] == ['文件0'] * 5 + ['文件1'] * 5
+    assert not watcher.poll(4)
+
+    _write_csv(other, 9)
+    assert not watcher.poll(5)
+    assert watcher.poll(7)
+    assert len(errors) == 1
+    assert [row[0] for row in _read_csv(output_path)[1:]] == ['文件0'] * 5 + ['文件1'] * 5 + ['文件9'] * 5
@@ -0,0 +1,105 @@
+import pytest
+from openpyxl import Workbook
+
+from merge_preflight import (BASE_MEMORY_MB, SheetInfo, WorkbookInfo, XML_BYTES_PER_CELL, estimate_merge,
+                             read_workbook_info, read_workbook_infos)
+from output_writers import ParallelXlsxWriter, XLSX_MAX_ROWS
+
+
+def _info(path, *sheets, shared_strings=0):
+    info = WorkbookInfo(path)
+    info.file_bytes = 1000
+    info.sheets = list(sheets)
+    info.shared_strings = shared_strings
+    return info
+
+
+def test_read_workbook_info_reads_dimensions_without_parsing(tmp_path):
+    """读取各工作表记录的数据区域、压缩前后的大小；没有记录数据区域时按XML大小估算单元格数"""
+    rows = [['编号', '金额', '备注']] + [[i, i * 10, f'备注{i}'] for i in range(9)]
+    path = str(tmp_path / 'a.xlsx')
+    workbook = Workbook()
+    workbook.active.title = '发票1'
+    for row in rows:
+        workbook.active.append(row)
+    workbook.create_sheet('说明').append(['只有一行'])
+    workbook.save(path)
+    info = read_workbook_info(path)
+    assert info.error is None
+    assert info.file_bytes > 0
+    assert [sheet.name for sheet in info.sheets] == ['发票1', '说明']
+    first = info.sheets[0]
+    assert (first.dimension_ref, first.rows, first.cols, first.cells) == ('A1:C10', 10, 3, 30)
+    assert first.compressed_bytes > 0 and first.xml_bytes > first.compressed_bytes
+
+    # 本程序输出的xlsx不记录数据区域，文字保存在共享字符串表中
+    path = str(tmp_path / 'b.xlsx')
+    writer = ParallelXlsxWriter(path, workers=1)
+    writer.write_rows(rows)
+    writer.close()
+    info = read_workbook_info(path)
+    sheet = info.sheets[0]
+    assert (sheet.dimension_ref, sheet.rows) == (None, 0)
+    assert sheet.cells == sheet.xml_bytes // XML_BYTES_PER_CELL
+    assert info.shared_strings == 12
+
+
+def test_read_workbook_info_for_csv_and_unreadable_files(tmp_path):
+    """CSV按文件内容估算行列数；无法读取的文件记录错误信息而不抛出异常"""
+    csv_path = tmp_path / 'a.csv'
+    csv_path.write_text('编号,金额\n1,2\n3,4\n', encoding='utf-8')
+    bad_path = tmp_path / 'bad.xlsx'
+    bad_path.write_bytes(b'not a zip')
+    csv_info, bad_info = read_workbook_infos([str(csv_path), str(bad_path)])
+    assert csv_info.error is None
+    assert [(sheet.rows, sheet.cols) for sheet in csv_info.sheets] == [(3, 2)]
+    assert csv_info.selected_sheets('不匹配*') == csv_info.sheets
+    assert bad_info.error and '不支持的文件格式' in bad_info.error
+    assert read_workbook_infos([]) == []
+
+
+def test_selected_sheets_follow_sheet_pattern():
+    """没有工作表通配符时只取第一个工作表，通配符不区分大小写"""
+    info = _info('a.xlsx', SheetInfo('Sheet1', None, 0, 0, 0, 0), SheetInfo('发票2024', None, 0, 0, 0, 0),
+                 SheetInfo('发票2025', None, 0, 0, 0, 0))
+    assert [sheet.name for sheet in info.selected_sheets()] == ['Sheet1']
+    assert [sheet.name for sheet in info.selected_sheets('发票*')] == ['发票2024', '发票2025']
+    assert [sheet.name for sheet in info.selected_sheets('sheet?')] == ['Sheet1']
+
+
+def test_estimate_sums_selected_sheets_and_reports_errors():
+    """汇总参与合并的工作表的行数和单元格数；没有记录数据区域的工作表按XML大小估算"""
+    good = _info('a.xlsx', SheetInfo('发票1', 'A1:C100', 100, 3, 500, 5000),
+                 SheetInfo('发票2', None, 0, 0, 200, XML_BYTES_PER_CELL * 40),
+                 SheetInfo('说明', 'A1:A1', 1, 1, 10, 100), shared_strings=50)
+    bad = WorkbookInfo('bad.xlsx')
+    bad.error = '无法读取'
+    estimate = estimate_merge([good, bad], sheet_pattern='发票*', workers=1)
+    assert (estimate.files, estimate.sheets, estimate.rows, estimate.cells) == (1, 2, 100, 340)
+    assert estimate.unknown_dimensions == 1
+    assert estimate.shared_strings == 50
+    assert estimate.errors == [('bad.xlsx', '无法读取')]
+    assert estimate.output_format == 'xlsx'
+    assert estimate.seconds > 0
+    assert estimate.peak_memory_bytes > BASE_MEMORY_MB * 1024 * 1024
+
+
+def test_estimate_without_sheets_is_empty():
+    estimate = estimate_merge([_info('a.xlsx')])
+    assert estimate.sheets == 0
+    assert estimate.output_format is None
+    assert estimate.peak_memory_bytes == 0
+
+
+def test_estimate_chooses_output_format_and_grows_with_work():
+    """行数超过Excel上限时自动选择其他格式；排序和更多的数据需要更多内存和时间"""
+    small = [_info('a.xlsx', SheetInfo('Sheet1', 'A1:J1000', 1000, 10, 0, 0))]
+    large = [_info('a.xlsx', SheetInfo('Sheet1', f'A1:J{XLSX_MAX_ROWS + 1}', XLSX_MAX_ROWS + 1, 10, 0, 0))]
+    assert estimate_merge(large).output_format in ('parquet', 'csv')
+    assert estimate_merge(large, output_format='xlsx').output_format == 'xlsx'
+    small_estimate = estimate_merge(small, output_format='csv')
+    large_estimate = estimate_merge(large, output_format='csv')
+    assert large_estimate.seconds > small_estimate.seconds
+    assert (estimate_merge(large, output_format='csv', sort=True).peak_memory_bytes
+            > large_estimate.peak_memory_bytes)
+    assert estimate_merge(small, output_format='csv').seconds == pytest.approx(small_estimate.seconds)
@@ -0,0 +1,42 @@
+from merge_progress import ProgressTracker, format_duration
+
+
+def test_finish_sends_final_progress_without_interval():
+    """通知间隔内完成时，finish() 仍然发送100%和最终的行数"""
+    progress, throughput = [], []
+    tracker = ProgressTracker([(100, 1000), (100, 3000)], progress.append,
+                              lambda *values: throughput.append(values), interval=3600)
+    tracker.start_source(0)
+    assert tracker.advance(10)
+    for _ in range(9):
+        assert not tracker.advance(10)
+    tracker.finish_source()
+    tracker.start_source(1)
+    tracker.advance(100)
+    tracker.finish_source()
+    assert progress == [2]
+
+    tracker.finish()
+    assert progress == [2, 100]
+    rows, rows_per_sec, mb_per_sec, eta = throughput[-1]
+    assert rows == 200
+    assert rows_per_sec > 0 and mb_per_sec > 0
+    assert eta == 0
+
+
+def test_progress_is_weighted_by_bytes():
+    progress = []
+    tracker = ProgressTracker([(100, 1000), (100, 3000)], progress.append, interval=0)
+    tracker.start_source(0)
+    tracker.advance(50)
+    tracker.finish_source()
+    tracker.start_source(1)
+    tracker.advance(50)
+    assert progress == [12, 25, 62]
+
+
+def test_format_duration():
+    assert format_duration(None) == '--'
+    assert format_duration(15.2) == '15秒'
+    assert format_duration(200) == '3分20秒'
+    assert format_duration(3720) == '1小时2分'
@@ -0,0 +1,118 @@
+import csv
+import json
+import os
+import time
+
+from openpyxl import Workbook
+
+from merge_engine import ExcelMergeEngine
+from merge_trace import MergeTrace, RunProfiler, SOURCE_SPAN, STAGE_LABELS, TRACE_SUFFIX, traced_batches
+from xlsx_reader import XlsxRowReader
+
+
+def test_summary_orders_stages_and_splits_unzip_time():
+    """阶段汇总按合并的先后顺序排列；解压时间从解析中分出，主进程中的解析从读取中扣除，来源的整体耗时不计入"""
+    trace = MergeTrace()
+    trace.add('write', 0.0, 1.0)
+    trace.add('read', 0.0, 3.0)
+    trace.add('parse', 0.0, 2.0, unzip_seconds=0.5)
+    trace.add('parse', 0.0, 1.0, unzip_seconds=0.25)
+    trace.add(SOURCE_SPAN, 0.0, 10.0, source='a.xlsx')
+    trace.add('自定义', 0.0, 0.5)
+    trace.extend([('parse', 0.0, 4.0, os.getpid() + 1, 1, {})])
+
+    summary = trace.summary()
+    assert [name for name, _, _ in summary] == ['unzip', 'parse', 'read', 'write', '自定义']
+    totals = {name: (seconds, count) for name, seconds, count in summary}
+    assert totals['unzip'] == (0.75, 2)
+    # 解析进程中的 4 秒与主进程的 2.25 秒
+    assert totals['parse'] == (6.25, 3)
+    # 主进程中解析的 3 秒包含在读取的耗时中
+    assert totals['read'] == (0.0, 1)
+    text = trace.format_summary()
+    assert text.startswith(f"{STAGE_LABELS['unzip']} 0.75秒")
+    assert STAGE_LABELS['read'] not in text
+
+
+def test_span_records_elapsed_time_and_arguments():
+    trace = MergeTrace()
+    with trace.span('write', source='a.xlsx') as args:
+        time.sleep(0.01)
+        args['rows'] = 5
+    (name, started, ended, pid, _, args), = trace.events
+    assert name == 'write' and pid == os.getpid()
+    assert ended - started >= 0.01
+    assert args == {'source': 'a.xlsx', 'rows': 5}
+
+
+def test_export_chrome_trace(tmp_path):
+    """导出的Chrome trace以最早的记录为时间起点（微秒），并为每个进程命名"""
+    trace = MergeTrace()
+    trace.add('parse', 10.0, 10.5, source='a.xlsx', rows=3)
+    trace.add(SOURCE_SPAN, 10.25, 11.0, source='a.xlsx')
+    path = str(tmp_path / 'merge.trace.json')
+    trace.export_chrome(path)
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    events = data['traceEvents']
+    assert events[0] == {'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'tid': 0, 'args': {'name': '主进程'}}
+    parse, source = events[1:]
+    assert (parse['name'], parse['cat'], parse['ts'], parse['dur']) == (STAGE_LABELS['parse'], 'parse', 0.0, 500000.0)
+    assert parse['args'] == {'source': 'a.xlsx', 'rows': 3}
+    assert (source['name'], source['ts']) == ('a.xlsx', 250000.0)
+    assert os.listdir(tmp_path) == ['merge.trace.json']
+
+
+def test_traced_batches_records_open_parse_and_unzip(tmp_path):
+    workbook = Workbook()
+    for i in range(25):
+        workbook.active.append([i, f'文字{i}'])
+    path = str(tmp_path / 'a.xlsx')
+    workbook.save(path)
+    trace = MergeTrace()
+    with XlsxRowReader(path) as reader:
+        batches = list(traced_batches(reader, reader.iter_batches(10), trace, 'a.xlsx'))
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    names = [event[0] for event in trace.events]
+    assert names == ['open', 'parse', 'parse', 'parse']
+    parse_args = [event[5] for event in trace.events[1:]]
+    assert [args['rows'] for args in parse_args] == [10, 10, 5]
+    assert all(args['unzip_seconds'] >= 0 for args in parse_args)
+
+
+def test_run_profiler_saves_cprofile_and_tracemalloc_reports(tmp_path):
+    profiler = RunProfiler()
+    profiler.start()
+    data = [list(range(100)) for _ in range(100)]
+    sorted(data, key=sum)
+    profiler.stop()
+    assert profiler.peak_bytes > 0
+    prof_path, text_path = profiler.save(str(tmp_path / 'run.profile'))
+    assert os.path.getsize(prof_path) > 0
+    with open(text_path, encoding='utf-8') as f:
+        text = f.read()
+    assert 'tracemalloc 峰值内存' in text
+    assert '按累计耗时排列' in text
+    assert '占用内存最多' in text
+
+
+def test_engine_saves_trace_and_profile_next_to_output(tmp_path):
+    """合并时启用 trace 和 profile，结果旁边保存耗时记录和性能分析文件，各阶段都有记录"""
+    sources = []
+    for number in range(2):
+        path = str(tmp_path / f'数据{number}.csv')
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            csv.writer(f).writerows([['编号', '名称']] + [[i, f'名称{i}'] for i in range(30)])
+        sources.append(path)
+    output_path = str(tmp_path / '合并结果.csv')
+    engine = ExcelMergeEngine(sources, output_path=output_path, workers=1, batch_size=10, trace=True, profile=True)
+    engine.run()
+
+    assert engine.trace_file == output_path + TRACE_SUFFIX
+    stages = {name for name, _, _ in engine.trace.summary()}
+    assert {'header_check', 'read', 'write', 'finalize'} <= stages
+    source_spans = [event for event in engine.trace.events if event[0] == SOURCE_SPAN]
+    assert [(event[5]['source'], event[5]['rows']) for event in source_spans] == [('数据0.csv', 31), ('数据1.csv', 30)]
+    with open(engine.trace_file, encoding='utf-8') as f:
+        assert json.load(f)['traceEvents']
+    assert all(os.path.exists(path) for path in engine.profile_files)
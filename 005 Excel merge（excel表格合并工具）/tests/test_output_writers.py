@@ -0,0 +1,140 @@
+import datetime
+
+import pytest
+from openpyxl import load_workbook
+
+from output_writers import ParallelXlsxWriter, ParquetWriter
+
+
+def _rows(count):
+    rows = [['序号', '名称', '金额', '日期', '备注']]
+    for i in range(count):
+        rows.append([i, f'名称{i % 37}', i * 1.25, datetime.datetime(2024, 1, 1) + datetime.timedelta(days=i % 400),
+                     None if i % 3 else f'<备注 & "{i}">'])
+    return rows
+
+
+def _read_back(path):
+    workbook = load_workbook(path, read_only=True)
+    try:
+        return {sheet.title: [list(row) for row in sheet.iter_rows(values_only=True)] for sheet in workbook}
+    finally:
+        workbook.close()
+
+
+def _trim(row):
+    row = list(row)
+    while row and row[-1] is None:
+        row.pop()
+    return row
+
+
+def test_parallel_writer_reads_back_with_openpyxl(tmp_path):
+    """多进程序列化的数据块拼接后，openpyxl 读回的内容与写入的行相同"""
+    path = str(tmp_path / 'out.xlsx')
+    rows = _rows(5000)
+    writer = ParallelXlsxWriter(path, workers=2, chunk_cells=2000)
+    for start in range(0, len(rows), 700):
+        writer.write_rows(rows[start:start + 700])
+    writer.close()
+
+    sheets = _read_back(path)
+    assert list(sheets) == ['合并结果']
+    assert [_trim(row) for row in sheets['合并结果']] == [_trim(row) for row in rows]
+
+
+def test_parallel_writer_rolls_over_sheets_with_header(tmp_path):
+    """超过每个工作表的行数上限时新建工作表，并重复第一行"""
+    path = str(tmp_path / 'out.xlsx')
+    rows = _rows(250)
+    writer = ParallelXlsxWriter(path, max_rows=100, repeat_header=True, workers=2, chunk_cells=300)
+    writer.write_rows(rows)
+    writer.close()
+
+    sheets = _read_back(path)
+    assert list(sheets) == ['合并结果', '合并结果_2', '合并结果_3']
+    assert all(sheet[0] == rows[0] for sheet in sheets.values())
+    data = [_trim(row) for sheet in sheets.values() for row in sheet[1:]]
+    assert data == [_trim(row) for row in rows[1:]]
+    assert [len(sheet) for sheet in sheets.values()] == [100, 100, 53]
+
+
+def test_parallel_writer_summary_sheet(tmp_path):
+    """add_sheet 添加的工作表排在合并结果之后"""
+    path = str(tmp_path / 'out.xlsx')
+    writer = ParallelXlsxWriter(path, workers=1)
+    writer.write_rows([['公司', '金额'], ['甲', 1], ['乙', 2.5]])
+    writer.add_sheet('汇总', [['公司', '金额（合计）'], ['甲', 1], ['乙', 2.5]])
+    writer.close()
+
+    sheets = _read_back(path)
+    assert list(sheets) == ['合并结果', '汇总']
+    assert sheets['汇总'][1:] == [['甲', 1], ['乙', 2.5]]
+
+
+def test_parquet_keeps_integer_types_and_widens(tmp_path):
+    """整数列保持推断的位宽，之后的数据放不下时放宽为更宽的整数或小数"""
+    pq = pytest.importorskip('pyarrow.parquet')
+    path = str(tmp_path / 'out.parquet')
+    writer = ParquetWriter(path, use_header=True, row_group_size=3)
+    writer.write_rows([['小', '大', '小数']])
+    writer.write_rows([[1, 100, 1], [2, 200, 2], [3, 300, 3]])
+    writer.write_rows([[4, 40000, 2.5]])
+    writer.close()
+
+    table = pq.read_table(path)
+    assert [str(field.type) for field in table.schema] == ['int8', 'int32', 'double']
+    assert table.to_pylist()[-1] == {'小': 4, '大': 40000, '小数': 2.5}
+
+
+def test_parquet_type_change_widens_to_text(tmp_path):
+    """之后的行组类型不同时改为文本并重写之前的行组，而不是中止合并"""
+    pq = pytest.importorskip('pyarrow.parquet')
+    path = str(tmp_path / 'out.parquet')
+    writer = ParquetWriter(path, use_header=True, row_group_size=2)
+    writer.write_rows([['编号', '日期']])
+    writer.write_rows([[1, datetime.datetime(2024, 1, 1)], [2, None]])
+    writer.write_rows([['A-3', '无'], [4, None, '多出的列']])
+    writer.close()
+
+    table = pq.read_table(path)
+    assert table.column_names == ['编号', '日期', '列3']
+    assert table.to_pylist() == [
+        {'编号': '1', '日期': '2024-01-01 00:00:00', '列3': None},
+        {'编号': '2', '日期': None, '列3': None},
+        {'编号': 'A-3', '日期': '无', '列3': None},
+        {'编号': '4', '日期': None, '列3': '多出的列'},
+    ]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['out.parquet']
+
+
+def test_parquet_widening_reads_each_row_group_once(tmp_path, monkeypatch):
+    """多次放宽类型时已写入的行组不被反复重写：关闭时每个行组只读取、转换一次"""
+    pq = pytest.importorskip('pyarrow.parquet')
+    reads = []
+    original = pq.ParquetFile.read_row_group
+    monkeypatch.setattr(pq.ParquetFile, 'read_row_group',
+                        lambda self, group, *args, **kwargs: reads.append(group) or original(self, group, *args, **kwargs))
+    path = str(tmp_path / 'out.parquet')
+    writer = ParquetWriter(path, row_group_size=2)
+    values = [1, 2, 300, 400, 70000, 80000, 2 ** 40, 5, 1.5, 6, 'x', 7]
+    for start in range(0, len(values), 2):
+        writer.write_rows([[value] for value in values[start:start + 2]])
+    writer.close()
+
+    table = pq.read_table(path)
+    assert str(table.schema.field(0).type) == 'string'
+    # 与小数在同一行组中的整数已按float64写入
+    assert table.column(0).to_pylist() == ['1', '2', '300', '400', '70000', '80000', str(2 ** 40), '5', '1.5', '6.0',
+                                           'x', '7']
+    assert len(reads) == len(values) // 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['out.parquet']
+
+
+def test_parquet_discard_removes_segments(tmp_path):
+    pytest.importorskip('pyarrow.parquet')
+    path = str(tmp_path / 'out.parquet')
+    writer = ParquetWriter(path, row_group_size=1)
+    writer.write_rows([[1], ['a'], [2.5]])
+    writer.discard()
+    assert list(tmp_path.iterdir()) == []
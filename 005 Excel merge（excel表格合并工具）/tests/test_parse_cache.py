@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+import parse_cache
+from parse_cache import ParseCache, STAMP_EXT, write_entry, read_entry
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.fixture
+def hash_calls(monkeypatch):
+    calls = []
+    original = parse_cache.file_content_hash
+
+    def counting_hash(file_path):
+        calls.append(file_path)
+        return original(file_path)
+
+    monkeypatch.setattr(parse_cache, 'file_content_hash', counting_hash)
+    return calls
+
+
+def _store(cache, key, rows):
+    for _ in write_entry([rows], cache.entry_path(key)):
+        pass
+
+
+def test_unchanged_file_skips_content_hash(tmp_path, hash_calls):
+    """路径、大小和修改时间都没有变化且缓存仍在时，不重新计算内容哈希"""
+    cache = ParseCache(str(tmp_path / 'cache'))
+    source = tmp_path / 'a.csv'
+    source.write_text('x,y\n1,2\n', encoding='utf-8')
+    key = cache.key_for(str(source), 'sheet=None')
+    assert len(hash_calls) == 1
+    _store(cache, key, [['x', 'y'], [1, 2]])
+    assert cache.key_for(str(source), 'sheet=None') == key
+    assert len(hash_calls) == 1
+    # 选项不同时是另一个键
+    assert cache.key_for(str(source), "sheet='Sheet2'") != key
+    assert list(read_entry(cache.lookup(key))) == [[['x', 'y'], [1, 2]]]
+
+
+def test_touched_file_with_same_content_still_hits(tmp_path, hash_calls):
+    """只是修改时间变了而内容相同的文件重新计算哈希后仍命中；内容变化后键也变化"""
+    cache = ParseCache(str(tmp_path / 'cache'))
+    source = tmp_path / 'a.csv'
+    source.write_text('x,y\n1,2\n', encoding='utf-8')
+    key = cache.key_for(str(source))
+    _store(cache, key, [['x', 'y']])
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.key_for(str(source)) == key
+    assert len(hash_calls) == 2
+    source.write_text('x,y\n1,3\n', encoding='utf-8')
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10 ** 9))
+    assert cache.key_for(str(source)) != key
+
+
+def test_evicted_entry_drops_stamp(tmp_path, hash_calls):
+    """缓存被淘汰后，指向它的记录也被删除，下次重新计算哈希"""
+    cache = ParseCache(str(tmp_path / 'cache'), max_size_mb=0)
+    source = tmp_path / 'a.csv'
+    source.write_text('x\n', encoding='utf-8')
+    key = cache.key_for(str(source))
+    _store(cache, key, [['x']])
+    cache.evict()
+    assert cache.lookup(key) is None
+    assert not list((tmp_path / 'cache').glob('*' + STAMP_EXT))
+    assert cache.key_for(str(source)) == key
+    assert len(hash_calls) == 2
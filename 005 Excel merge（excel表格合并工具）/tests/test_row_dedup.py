@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from row_dedup import RowDeduplicator
+
+
+def _batches(seed=5):
+    random.seed(seed)
+    rows = [[random.randint(0, 800), random.choice(['甲', '乙', None]), random.randint(0, 3)] for _ in range(6000)]
+    return [rows[start:start + 400] for start in range(0, len(rows), 400)]
+
+
+def _expected(batches, columns=None):
+    seen = set()
+    result = []
+    for batch in batches:
+        for row in batch:
+            key = repr([row[i] for i in columns]) if columns else repr(row)
+            if key not in seen:
+                seen.add(key)
+                result.append(row)
+    return result
+
+
+@pytest.mark.parametrize('columns', [None, [0], [0, 2]])
+@pytest.mark.parametrize('memory_keys', [10 ** 9, 300, 0])
+def test_dedup_same_result_across_memory_and_sqlite(tmp_path, columns, memory_keys):
+    """行哈希超过内存上限转存到SQLite前后，删除的行与只在内存中去重时相同"""
+    batches = _batches()
+    with RowDeduplicator(columns, memory_keys=memory_keys, spill_dir=str(tmp_path)) as dedup:
+        result = [row for batch in batches for row in dedup.filter(batch)]
+        assert dedup.on_disk == (memory_keys < 10 ** 9)
+        assert dedup.duplicates == sum(map(len, batches)) - len(result)
+    assert result == _expected(batches, columns)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_dedup_spill_between_batches(tmp_path):
+    """合并中途因内存预算调用 spill() 后，之前见过的行仍按重复行删除"""
+    batches = _batches(seed=9)
+    with RowDeduplicator(spill_dir=str(tmp_path)) as dedup:
+        result = []
+        for i, batch in enumerate(batches):
+            if i == len(batches) // 2:
+                dedup.spill()
+            result.extend(dedup.filter(batch))
+    assert result == _expected(batches)
+
+
+def test_trailing_empty_cells_are_ignored():
+    """整行去重时末尾的空单元格不影响比较，指定的列超出行的长度时按空单元格比较"""
+    with RowDeduplicator() as dedup:
+        assert dedup.filter([[1, 2], [1, 2, None], [1, 2, '']]) == [[1, 2], [1, 2, '']]
+    with RowDeduplicator([0, 3]) as dedup:
+        assert dedup.filter([[1, 'a'], [1, 'b', 'c', None]]) == [[1, 'a']]
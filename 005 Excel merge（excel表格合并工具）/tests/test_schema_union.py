@@ -0,0 +1,39 @@
+from schema_union import SchemaUnion
+
+
+def test_reordered_columns():
+    schema = SchemaUnion([['a', 'b', 'c'], ['c', 'a', 'b']])
+    assert schema.header == ['a', 'b', 'c']
+    assert schema.reindex(1, [['C', 'A', 'B'], ['C2']]) == [['A', 'B', 'C'], [None, None, 'C2']]
+
+
+def test_missing_columns_are_empty():
+    schema = SchemaUnion([['a', 'b', 'c'], ['b', 'a']])
+    assert schema.reindex(1, [['B', 'A'], ['B2'], []]) == [['A', 'B', None], [None, 'B2', None], [None, None, None]]
+
+
+def test_extra_cells_do_not_leak_into_missing_columns():
+    """超出文件第一行宽度的单元格不会填到该文件没有的列中"""
+    schema = SchemaUnion([['a', 'b', 'c'], ['b', 'a']])
+    assert schema.reindex(1, [['B', 'A', 'extra'], ['B', 'A', 'x', 'y']]) == [['A', 'B', None], ['A', 'B', None]]
+
+
+def test_identity_mapping_trims_extra_cells():
+    """列顺序相同的文件不重排，但超出第一行宽度的单元格同样去掉"""
+    schema = SchemaUnion([['a', 'b', 'c'], ['a', 'b']])
+    assert schema.mappings[1] is None
+    batch = [['A', 'B'], ['A']]
+    assert schema.reindex(1, batch) == batch
+    assert schema.reindex(1, [['A', 'B', 'extra']]) == [['A', 'B']]
+
+
+def test_duplicate_names_match_by_occurrence():
+    schema = SchemaUnion([['金额', '金额', '备注'], ['备注', '金额']])
+    assert schema.header == ['金额', '金额', '备注']
+    assert schema.reindex(1, [['R', 1]]) == [[1, None, 'R']]
+
+
+def test_single_column_and_base_header():
+    schema = SchemaUnion([['b']], base_header=['a', 'b'])
+    assert schema.header == ['a', 'b']
+    assert schema.reindex(0, [['B', 'extra'], []]) == [[None, 'B'], [None, None]]
@@ -0,0 +1,120 @@
+import datetime
+import zipfile
+
+import pytest
+from openpyxl import Workbook
+
+from column_filter import RowFilter
+from xlsx_reader import XlsxRowReader, column_index, open_reader, read_first_row
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+
+def _write_raw_xlsx(path, sheet_data, shared_strings=(), dimension=None):
+    """直接写出工作表XML，用于构造没有单元格引用、稀疏行等openpyxl不会生成的文件"""
+    strings = ''.join(f'<si><t>{text}</t></si>' for text in shared_strings)
+    dimension = f'<dimension ref="{dimension}"/>' if dimension else ''
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('xl/workbook.xml',
+                         f'<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}"><sheets>'
+                         f'<sheet name="数据" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        archive.writestr('xl/_rels/workbook.xml.rels',
+                         '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                         '<Relationship Id="rId1" Target="worksheets/sheet1.xml"/></Relationships>')
+        archive.writestr('xl/sharedStrings.xml', f'<sst xmlns="{MAIN_NS}" uniqueCount="{len(shared_strings)}">'
+                                                 f'{strings}</sst>')
+        archive.writestr('xl/worksheets/sheet1.xml',
+                         f'<worksheet xmlns="{MAIN_NS}">{dimension}<sheetData>{sheet_data}</sheetData></worksheet>')
+    return str(path)
+
+
+def test_column_index():
+    assert column_index('A1') == 0
+    assert column_index('Z9') == 25
+    assert column_index('AA10') == 26
+    assert column_index('XFD1048576') == 16383
+
+
+def test_reads_values_dates_and_keeps_blank_rows(tmp_path):
+    """读取文字、数字、逻辑值和日期；中间的空行保留为空列表，末尾的空行丢弃"""
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(['名称', '数量', '日期', '有效'])
+    sheet.append(['甲', 3, datetime.datetime(2024, 5, 6, 7, 8, 9), True])
+    sheet.append([])
+    sheet.append(['乙', 2.5, None, False])
+    path = str(tmp_path / 'a.xlsx')
+    workbook.save(path)
+
+    with XlsxRowReader(path) as reader:
+        rows = list(reader.iter_rows())
+    assert rows == [['名称', '数量', '日期', '有效'], ['甲', 3, datetime.datetime(2024, 5, 6, 7, 8, 9), True], [],
+                    ['乙', 2.5, None, False]]
+    assert read_first_row(path) == ['名称', '数量', '日期', '有效']
+
+
+def test_sparse_rows_without_cell_references(tmp_path):
+    """没有单元格引用的单元格紧接在上一个单元格之后，被跳过的空单元格也占一列；行号不连续时补齐空行"""
+    sheet_data = (
+        '<row r="1"><c t="s"><v>0</v></c><c t="s"><v>1</v></c><c t="s"><v>2</v></c></row>'
+        # 第二个单元格为空：第三个单元格仍在C列
+        '<row r="2"><c><v>1</v></c><c/><c><v>3</v></c></row>'
+        # 有引用和没有引用的单元格混在一起
+        '<row r="4"><c r="B4"><v>5</v></c><c><v>6</v></c></row>'
+        '<row><c t="inlineStr"><is><t>末行</t></is></c><c t="s"><v>0</v></c></row>'
+    )
+    path = _write_raw_xlsx(tmp_path / 'sparse.xlsx', sheet_data, ['甲', '乙', '丙'], dimension='A1:C5')
+    with XlsxRowReader(path) as reader:
+        assert list(reader.iter_rows()) == [['甲', '乙', '丙'], [1, None, 3], [], [None, 5, 6], ['末行', '甲']]
+        assert reader.read_first_row() == ['甲', '乙', '丙']
+        assert reader.read_dimension() == (5, 3)
+        # 按列选择时读取同样的位置
+        assert list(reader.iter_rows(columns=[2, 0])) == [['丙', '甲'], [3, 1], [], [6], [None, '末行']]
+    sheet_data = '<row r="1"><c/><c t="s"><v>1</v></c></row>'
+    path = _write_raw_xlsx(tmp_path / 'first.xlsx', sheet_data, ['甲', '乙'])
+    assert read_first_row(path) == [None, '乙']
+
+
+def test_select_columns_and_filter_rows(tmp_path):
+    """按列选择时按指定顺序产出这些列；筛选时第一行作为表头保留，不满足条件的行跳过"""
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(['公司', '金额', '备注'])
+    for company, amount in [('甲', 10), ('乙', 20), ('甲', 30)]:
+        sheet.append([company, amount, f'{company}{amount}'])
+    path = str(tmp_path / 'a.xlsx')
+    workbook.save(path)
+
+    with XlsxRowReader(path) as reader:
+        row_filter = RowFilter.parse(['公司=甲'], reader.read_first_row())
+        assert list(reader.iter_rows(columns=[1], row_filter=row_filter)) == [['金额'], [10], [30]]
+        batches = list(reader.iter_batches(batch_size=2))
+    assert [len(batch) for batch in batches] == [2, 2]
+
+
+def test_sheet_lookup_and_errors(tmp_path):
+    workbook = Workbook()
+    workbook.active.title = '一'
+    workbook.create_sheet('二').append(['x'])
+    path = str(tmp_path / 'a.xlsx')
+    workbook.save(path)
+    with open_reader(path, '二') as reader:
+        assert reader.sheet_names == ['一', '二']
+        assert list(reader.iter_rows()) == [['x']]
+    with pytest.raises(ValueError, match='找不到工作表'):
+        XlsxRowReader(path, '三')
+    with pytest.raises(ValueError, match='工作表序号超出范围'):
+        XlsxRowReader(path, 5)
+    bad_path = tmp_path / 'bad.xlsx'
+    bad_path.write_bytes(b'not a zip')
+    with pytest.raises(ValueError, match='不支持的文件格式'):
+        XlsxRowReader(str(bad_path))
+
+
+def test_legacy_xls_is_rejected_with_save_as_hint(tmp_path):
+    """旧版 .xls 文件不是zip文件，打开时提示另存为xlsx，而不是报 File is not a zip file"""
+    path = tmp_path / '旧文件.xls'
+    path.write_bytes(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1' + b'\0' * 504)
+    with pytest.raises(ValueError, match='另存为xlsx'):
+        open_reader(str(path))
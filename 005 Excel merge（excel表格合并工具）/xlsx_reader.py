@@ -0,0 +1,550 @@
+import os
+import re
+import time
+import zipfile
+import posixpath
+import datetime
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+from csv_reader import CsvRowReader, CSV_EXTENSIONS, is_csv_file
+
+
+# Excel内置的日期/时间格式编号（含中日韩区域设置下的日期格式）
+BUILTIN_DATE_FORMATS = set(range(14, 23)) | set(range(27, 37)) | set(range(45, 48)) | set(range(50, 59))
+BUILTIN_TIME_FORMATS = {18, 19, 20, 21, 45, 46, 47}
+
+# 判断自定义数字格式是否为日期格式时，先去掉引号内文本、方括号（颜色/条件）和转义字符
+FORMAT_STRIP_RE = re.compile(r'"[^"]*"|\[[^\]]*\]|\\.|_.|\*.')
+DATE_TOKEN_RE = re.compile(r'[dmyhs]', re.IGNORECASE)
+
+WINDOWS_EPOCH = datetime.datetime(1899, 12, 30)
+MAC_EPOCH = datetime.datetime(1904, 1, 1)
+
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+STRICT_REL_NS = '{http://purl.oclc.org/ooxml/officeDocument/relationships}id'
+
+INPUT_EXTENSIONS = ('.xlsx',) + CSV_EXTENSIONS  # 可以添加到合并列表的文件
+LEGACY_EXTENSIONS = ('.xls',)  # 旧版Excel的二进制格式，不是zip文件，无法读取
+LEGACY_FORMAT_MESSAGE = "不支持旧版Excel格式（.xls），请在Excel中另存为xlsx后再合并"
+
+
+class TimedReader:
+    """包装文件对象，累计 read() 的耗时；用于统计解压工作表XML的时间"""
+
+    def __init__(self, f):
+        self.f = f
+        self.seconds = 0.0
+
+    def read(self, size=-1):
+        started = time.perf_counter()
+        data = self.f.read(size)
+        self.seconds += time.perf_counter() - started
+        return data
+
+
+def _local(tag):
+    """去掉XML标签的命名空间前缀"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def column_index(cell_ref):
+    """把单元格引用（如 "AB12"）转换为从0开始的列序号"""
+    index = 0
+    for char in cell_ref:
+        if 'A' <= char <= 'Z':
+            index = index * 26 + ord(char) - 64
+        elif 'a' <= char <= 'z':
+            index = index * 26 + ord(char) - 96
+        else:
+            break
+    return index - 1
+
+
+def _is_date_format(format_code):
+    """判断自定义数字格式是否表示日期或时间"""
+    if not format_code or format_code.lower() == 'general':
+        return False
+    # 只看正数部分的格式
+    section = FORMAT_STRIP_RE.sub('', format_code.split(';')[0])
+    return bool(DATE_TOKEN_RE.search(section))
+
+
+def _is_time_format(format_code):
+    """判断自定义数字格式是否只包含时间"""
+    section = FORMAT_STRIP_RE.sub('', format_code.split(';')[0]).lower()
+    return bool(re.search(r'[hs]', section)) and not re.search(r'[dy]', section)
+
+
+class XlsxRowReader:
+    """流式读取xlsx工作表的行读取器
+
+    直接解析压缩包中的工作表XML，边解析边产出行数据，
+    只额外加载共享字符串表和样式中的日期格式，不会载入整个工作簿。
+    """
+
+    def __init__(self, file_path, sheet=0):
+        self.file_path = file_path
+        try:
+            self.archive = zipfile.ZipFile(file_path)
+        except zipfile.BadZipFile:
+            raise ValueError(f"不支持的文件格式（仅支持xlsx、csv、tsv）: {file_path}")
+        self._names = set(self.archive.namelist())
+        self.sheets = []  # [(工作表名称, XML路径)]
+        self.epoch = WINDOWS_EPOCH
+        self._load_workbook()
+        self.sheet_name, self.sheet_path = self._find_sheet(sheet)
+        self._shared_strings = None
+        self._date_styles = None
+        self.time_unzip = False  # 是否统计解压工作表XML的耗时
+        self.unzip_timer = None  # 统计解压耗时时为读取工作表XML的 TimedReader
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.archive.close()
+
+    @property
+    def sheet_names(self):
+        return [name for name, _ in self.sheets]
+
+    def _load_workbook(self):
+        """读取工作簿中的工作表列表及其XML路径"""
+        targets = {}
+        rels_path = 'xl/_rels/workbook.xml.rels'
+        if rels_path in self._names:
+            for rel in ET.fromstring(self.archive.read(rels_path)):
+                target = rel.get('Target', '')
+                if target.startswith('/'):
+                    target = target[1:]
+                else:
+                    target = posixpath.normpath(posixpath.join('xl', target))
+                targets[rel.get('Id')] = target
+
+        root = ET.fromstring(self.archive.read('xl/workbook.xml'))
+        for elem in root.iter():
+            tag = _local(elem.tag)
+            if tag == 'workbookPr' and elem.get('date1904') in ('1', 'true'):
+                self.epoch = MAC_EPOCH
+            elif tag == 'sheet':
+                rel_id = elem.get(REL_NS) or elem.get(STRICT_REL_NS)
+                self.sheets.append((elem.get('name'), targets.get(rel_id)))
+
+        if not self.sheets:
+            raise ValueError(f"文件中没有工作表: {self.file_path}")
+
+    def _find_sheet(self, sheet):
+        """按序号或名称定位工作表"""
+        if isinstance(sheet, int):
+            if sheet >= len(self.sheets):
+                raise ValueError(f"工作表序号超出范围: {sheet}")
+            return self.sheets[sheet]
+        for name, path in self.sheets:
+            if name == sheet:
+                return name, path
+        raise ValueError(f"找不到工作表: {sheet}")
+
+    @property
+    def shared_strings(self):
+        """按需加载共享字符串表"""
+        if self._shared_strings is None:
+            self._shared_strings = self._load_shared_strings()
+        return self._shared_strings
+
+    @property
+    def date_styles(self):
+        """按需加载日期样式：{样式序号: 是否只包含时间}"""
+        if self._date_styles is None:
+            self._date_styles = self._load_date_styles()
+        return self._date_styles
+
+    def _load_shared_strings(self, count=None):
+        """加载共享字符串表；指定 count 时只读取前 count 项"""
+        path = 'xl/sharedStrings.xml'
+        strings = []
+        if path not in self._names or count == 0:
+            return strings
+        with self.archive.open(path) as f:
+            for _, elem in ET.iterparse(f):
+                if _local(elem.tag) == 'si':
+                    strings.append(self._element_text(elem))
+                    elem.clear()
+                    if count is not None and len(strings) >= count:
+                        break
+        return strings
+
+    def _load_date_styles(self):
+        path = 'xl/styles.xml'
+        date_styles = {}
+        if path not in self._names:
+            return date_styles
+        root = ET.fromstring(self.archive.read(path))
+        custom_formats = {}
+        for elem in root.iter():
+            if _local(elem.tag) == 'numFmt':
+                custom_formats[int(elem.get('numFmtId'))] = elem.get('formatCode', '')
+        for elem in root:
+            if _local(elem.tag) != 'cellXfs':
+                continue
+            for index, xf in enumerate(elem):
+                format_id = int(xf.get('numFmtId', 0))
+                if format_id in custom_formats:
+                    format_code = custom_formats[format_id]
+                    if _is_date_format(format_code):
+                        date_styles[index] = _is_time_format(format_code)
+                elif format_id in BUILTIN_DATE_FORMATS:
+                    date_styles[index] = format_id in BUILTIN_TIME_FORMATS
+        return date_styles
+
+    @staticmethod
+    def _element_text(elem):
+        """拼接 <si>/<is> 中的文本（包括富文本片段，忽略拼音注音）"""
+        parts = []
+        for child in elem:
+            tag = _local(child.tag)
+            if tag == 't':
+                parts.append(child.text or '')
+            elif tag == 'r':
+                for run_child in child:
+                    if _local(run_child.tag) == 't':
+                        parts.append(run_child.text or '')
+        return ''.join(parts)
+
+    @staticmethod
+    def _value_text(cell):
+        """取出 <c> 元素中 <v> 的文本"""
+        for child in cell:
+            if _local(child.tag) == 'v':
+                return child.text
+        return None
+
+    def _convert_number(self, text, style):
+        """按单元格样式把数字文本转换为数值或日期"""
+        if style is not None and style in self.date_styles:
+            serial = float(text)
+            # 时间部分按毫秒取整，避免浮点误差
+            milliseconds = round((serial % 1) * 86400000)
+            if self.date_styles[style] and 0 <= serial < 1:
+                return (datetime.datetime.min + datetime.timedelta(milliseconds=milliseconds)).time()
+            days = int(serial // 1)
+            if self.epoch is WINDOWS_EPOCH and 0 < days < 60:
+                # 兼容Excel 1900年闰年的历史问题
+                days += 1
+            return self.epoch + datetime.timedelta(days=days, milliseconds=milliseconds)
+        if '.' in text or 'E' in text or 'e' in text:
+            return float(text)
+        return int(text)
+
+    def _cell_value(self, cell):
+        """解析单个 <c> 元素的值"""
+        cell_type = cell.get('t', 'n')
+        if cell_type == 'inlineStr':
+            for child in cell:
+                if _local(child.tag) == 'is':
+                    return self._element_text(child)
+            return None
+
+        text = self._value_text(cell)
+        if text is None:
+            return None
+
+        if cell_type == 's':
+            return self.shared_strings[int(text)]
+        if cell_type == 'n':
+            style = cell.get('s')
+            return self._convert_number(text, int(style) if style is not None else None)
+        if cell_type == 'b':
+            return text == '1'
+        if cell_type == 'd':
+            return datetime.datetime.fromisoformat(text)
+        # str（公式结果）和 e（错误值）都按文本返回
+        return text
+
+    def preload(self):
+        """加载共享字符串表和样式中的日期格式"""
+        self.shared_strings
+        self.date_styles
+
+    def _iter_row_elements(self):
+        """逐个产出工作表中的 <row> 元素及其行号（从0开始），元素处理完后即被移除"""
+        if not self.sheet_path or self.sheet_path not in self._names:
+            raise ValueError(f"找不到工作表数据: {self.sheet_name}")
+
+        # 预先加载共享字符串和样式，避免在解析过程中反复判断
+        self.preload()
+
+        row_number = -1
+        with self.archive.open(self.sheet_path) as f:
+            if self.time_unzip:
+                f = self.unzip_timer = TimedReader(f)
+            sheet_data = None
+            for event, elem in ET.iterparse(f, events=('start', 'end')):
+                tag = _local(elem.tag)
+                if event == 'start':
+                    if tag == 'sheetData':
+                        sheet_data = elem
+                    continue
+                if tag != 'row':
+                    continue
+
+                row_ref = elem.get('r')
+                row_number = int(row_ref) - 1 if row_ref else row_number + 1
+                yield row_number, elem
+                # 已解析的行及时移除，保证内存占用不随行数增长
+                if sheet_data is not None:
+                    sheet_data.remove(elem)
+                else:
+                    elem.clear()
+
+    def iter_rows(self, columns=None, row_filter=None):
+        """逐行产出工作表数据（列表），去掉末尾空行，保留中间的空行
+
+        指定 columns（从0开始的列序号）或 row_filter（RowFilter）时改为按列选择和筛选读取，见 _iter_selected_rows。
+        """
+        if columns is not None or row_filter is not None:
+            yield from self._iter_selected_rows(columns, row_filter)
+            return
+
+        next_row = 0
+        for row_number, elem in self._iter_row_elements():
+            row = []
+            col = -1
+            for cell in elem:
+                if _local(cell.tag) != 'c':
+                    continue
+                ref = cell.get('r')
+                # 没有单元格引用时紧接在上一个单元格（可能是被跳过的空单元格）之后
+                col = column_index(ref) if ref else col + 1
+                value = self._cell_value(cell)
+                if value is None or value == '':
+                    continue
+                if col > len(row):
+                    row.extend([None] * (col - len(row)))
+                if col == len(row):
+                    row.append(value)
+                else:
+                    row[col] = value
+
+            if not row:
+                continue
+            # 补齐中间的空行；末尾的空行因为后面没有数据行而被自然丢弃
+            for _ in range(row_number - next_row):
+                yield []
+            next_row = max(row_number, next_row) + 1
+            yield row
+
+    def _iter_selected_rows(self, columns=None, row_filter=None):
+        """按列选择和筛选条件逐行产出数据
+
+        只转换选中的列和筛选条件用到的列，其他单元格直接跳过，不会转换为Python对象。
+        指定 columns 时按其顺序产出这些列；指定 row_filter 时只产出满足条件的行，
+        第一行作为表头不参与筛选，中间的空行也不再保留。
+        """
+        needed = None
+        if columns is not None:
+            needed = set(columns)
+            if row_filter is not None:
+                needed.update(row_filter.columns)
+
+        next_row = 0
+        first_row = True
+        for row_number, elem in self._iter_row_elements():
+            values = {}
+            col = -1
+            for cell in elem:
+                if _local(cell.tag) != 'c':
+                    continue
+                ref = cell.get('r')
+                col = column_index(ref) if ref else col + 1
+                if needed is not None and col not in needed:
+                    continue
+                value = self._cell_value(cell)
+                if value is None or value == '':
+                    continue
+                values[col] = value
+
+            if not values:
+                continue
+            if row_filter is not None and not first_row and not row_filter.matches(values):
+                continue
+            first_row = False
+
+            if columns is not None:
+                row = [values.get(col) for col in columns]
+                while row and row[-1] is None:
+                    row.pop()
+            else:
+                row = [None] * (max(values) + 1)
+                for col, value in values.items():
+                    row[col] = value
+
+            if row_filter is None:
+                # 只选择列时与 iter_rows 一样保留中间的空行
+                for _ in range(row_number - next_row):
+                    yield []
+                next_row = max(row_number, next_row) + 1
+            yield row
+
+    def read_first_row(self):
+        """只解析工作表的第一行，读到第一行结束即停止
+
+        共享字符串表也只读取到第一行用到的最大序号为止，适合快速检查表头。
+        """
+        if not self.sheet_path or self.sheet_path not in self._names:
+            raise ValueError(f"找不到工作表数据: {self.sheet_name}")
+
+        first_row = None
+        with self.archive.open(self.sheet_path) as f:
+            for _, elem in ET.iterparse(f):
+                if _local(elem.tag) == 'row':
+                    first_row = elem
+                    break
+        # 工作表为空，或第一行不是工作表的第1行
+        if first_row is None or first_row.get('r', '1') != '1':
+            return []
+
+        cells = [cell for cell in first_row if _local(cell.tag) == 'c']
+        if self._shared_strings is None:
+            shared_indices = [int(self._value_text(cell) or 0) for cell in cells if cell.get('t') == 's']
+            count = max(shared_indices) + 1 if shared_indices else 0
+            shared_strings = self._load_shared_strings(count)
+        else:
+            shared_strings = self._shared_strings
+
+        row = []
+        col = -1
+        for cell in cells:
+            ref = cell.get('r')
+            col = column_index(ref) if ref else col + 1
+            if cell.get('t') == 's':
+                text = self._value_text(cell)
+                value = shared_strings[int(text)] if text is not None else None
+            else:
+                value = self._cell_value(cell)
+            if value is None or value == '':
+                continue
+            if col >= len(row):
+                row.extend([None] * (col - len(row) + 1))
+            row[col] = value
+        return row
+
+    def read_dimension_ref(self, sheet_path=None):
+        """读取工作表XML开头记录的数据区域（如 "A1:F1000"），默认读取当前工作表；没有记录时返回 None"""
+        sheet_path = sheet_path or self.sheet_path
+        if not sheet_path or sheet_path not in self._names:
+            return None
+        with self.archive.open(sheet_path) as f:
+            for event, elem in ET.iterparse(f, events=('start',)):
+                tag = _local(elem.tag)
+                if tag == 'dimension':
+                    return elem.get('ref') or None
+                if tag == 'sheetData':
+                    # dimension 必须位于 sheetData 之前，到这里说明没有记录
+                    return None
+        return None
+
+    def read_dimension(self, sheet_path=None):
+        """读取工作表XML开头记录的数据区域，返回 (行数, 列数)；没有记录时返回 None"""
+        end = (self.read_dimension_ref(sheet_path) or '').split(':')[-1]
+        digits = ''.join(char for char in end if char.isdigit())
+        if not digits:
+            return None
+        return int(digits), column_index(end) + 1
+
+    def shared_string_count(self):
+        """共享字符串表记录的不同文字个数（只读取表的开头）；没有共享字符串表时返回0，未记录时返回 None"""
+        path = 'xl/sharedStrings.xml'
+        if path not in self._names:
+            return 0
+        with self.archive.open(path) as f:
+            for event, elem in ET.iterparse(f, events=('start',)):
+                count = elem.get('uniqueCount') or elem.get('count')
+                return int(count) if count and count.isdigit() else None
+        return 0
+
+    def sheet_bytes(self):
+        """估算工作表在文件中占用的字节数：按各工作表XML的压缩大小分摊整个文件的大小"""
+        sizes = {info.filename: info.compress_size for info in self.archive.infolist()}
+        total = sum(sizes.get(path, 0) for _, path in self.sheets)
+        if not total:
+            return 0
+        return int(os.path.getsize(self.file_path) * sizes.get(self.sheet_path, 0) / total)
+
+    def iter_batches(self, batch_size=10000, columns=None, row_filter=None):
+        """按固定行数分批产出数据，每批为行列表"""
+        batch = []
+        for row in self.iter_rows(columns, row_filter):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def split_source(source, sheet=0):
+    """合并的数据来源可以是文件路径，也可以是 (文件路径, 工作表) 二元组"""
+    if isinstance(source, tuple):
+        return source
+    return source, sheet
+
+
+def is_legacy_excel(file_path):
+    """是否为旧版Excel的 .xls 文件（按扩展名判断）"""
+    return file_path.lower().endswith(LEGACY_EXTENSIONS)
+
+
+def open_reader(file_path, sheet=0):
+    """按扩展名打开行读取器：CSV/TSV 使用 CsvRowReader，其余按xlsx读取"""
+    if is_csv_file(file_path):
+        return CsvRowReader(file_path, sheet)
+    if is_legacy_excel(file_path):
+        raise ValueError(f"{LEGACY_FORMAT_MESSAGE}: {os.path.basename(file_path)}")
+    return XlsxRowReader(file_path, sheet)
+
+
+def list_sheets(file_path):
+    """列出文件中的所有工作表名称（只读取工作簿目录）；CSV只有一个以文件名命名的工作表"""
+    with open_reader(file_path) as reader:
+        return reader.sheet_names
+
+
+def read_first_row(file_path, sheet=0):
+    """读取文件指定工作表的第一行"""
+    with open_reader(file_path, sheet) as reader:
+        return reader.read_first_row()
+
+
+def probe_headers(sources, workers=8):
+    """并发读取多个文件（或工作表）的第一行，按列表顺序返回"""
+    if not sources:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(sources)))) as executor:
+        return list(executor.map(lambda source: read_first_row(*split_source(source)), sources))
+
+
+def estimate_source_size(source):
+    """根据记录的数据区域估算文件（或工作表）的行数和所占字节数，返回 (行数, 字节数)；无法读取时返回 (0, 0)"""
+    try:
+        with open_reader(*split_source(source)) as reader:
+            dimension = reader.read_dimension()
+            return (dimension[0] if dimension else 0), reader.sheet_bytes()
+    except Exception:
+        return 0, 0
+
+
+def estimate_source_sizes(sources, workers=8):
+    """并发估算多个文件（或工作表）的 (行数, 字节数)，按列表顺序返回"""
+    if not sources:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(sources)))) as executor:
+        return list(executor.map(estimate_source_size, sources))
+
+
+def estimate_total_rows(sources):
+    """根据各文件（或工作表）记录的数据区域估算总行数，无法读取的按0行计算"""
+    return sum(rows for rows, _ in estimate_source_sizes(sources))
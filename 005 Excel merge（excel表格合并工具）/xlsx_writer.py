@@ -0,0 +1,305 @@
+import os
+import re
+import math
+import time
+import zlib
+import struct
+import datetime
+from xml.sax.saxutils import escape
+
+from openpyxl.utils.datetime import to_excel
+
+DEFAULT_WRITE_WORKERS = min(4, os.cpu_count() or 1)  # 默认并行写入进程数
+CHUNK_CELLS = 100000  # 每个写入任务序列化的单元格数
+STRINGS_CHUNK = 50000  # 共享字符串表每个写入任务的字符串数
+MAX_SHARED_STRINGS = 500000  # 共享字符串表最多保存的字符串数，超过后新出现的文字直接写在单元格中
+DEFLATE_LEVEL = 6
+ZIP64_LIMIT = 0xFFFFFFFF
+
+# XML 1.0 不允许的控制字符，写入前删除（与openpyxl一致）
+ILLEGAL_CHARACTERS_RE = re.compile(r'[\000-\010]|[\013-\014]|[\016-\037]')
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+CONTENT_TYPES_NS = 'http://schemas.openxmlformats.org/package/2006/content-types'
+CONTENT_TYPE_PREFIX = 'application/vnd.openxmlformats-officedocument.spreadsheetml'
+SHEET_CONTENT_TYPE = f'{CONTENT_TYPE_PREFIX}.worksheet+xml'
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+SHEET_START = f'{XML_DECLARATION}<worksheet xmlns="{MAIN_NS}"><sheetData>'
+SHEET_END = '</sheetData></worksheet>'
+STRINGS_START = f'{XML_DECLARATION}<sst xmlns="{MAIN_NS}" count="{{count}}" uniqueCount="{{unique}}">'
+STRINGS_END = '</sst>'
+
+# 单元格样式：0 常规，1 日期时间，2 时间，3 日期
+DATETIME_STYLE, TIME_STYLE, DATE_STYLE = 1, 2, 3
+STYLES = (
+    f'{XML_DECLARATION}<styleSheet xmlns="{MAIN_NS}">'
+    '<numFmts count="2"><numFmt numFmtId="164" formatCode="yyyy-mm-dd h:mm:ss"/>'
+    '<numFmt numFmtId="165" formatCode="h:mm:ss"/></numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/><family val="2"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+ROOT_RELS = (
+    f'{XML_DECLARATION}<Relationships xmlns="{PKG_REL_NS}">'
+    f'<Relationship Id="rId1" Type="{REL_NS}/officeDocument" Target="xl/workbook.xml"/></Relationships>'
+)
+
+
+class XlsxPackageError(ValueError):
+    """xlsx文件无法写入（如单个工作表超过zip格式的大小上限）"""
+
+
+def _gf2_matrix_times(matrix, vector):
+    total = 0
+    i = 0
+    while vector:
+        if vector & 1:
+            total ^= matrix[i]
+        vector >>= 1
+        i += 1
+    return total
+
+
+def _gf2_matrix_square(matrix):
+    return [_gf2_matrix_times(matrix, matrix[n]) for n in range(32)]
+
+
+def crc32_combine(crc1, crc2, length2):
+    """由两段数据各自的CRC32计算拼接后的CRC32（zlib的crc32_combine），不需要原始数据"""
+    if length2 <= 0:
+        return crc1
+    odd = [0xEDB88320] + [1 << n for n in range(31)]  # 一个0比特对应的运算矩阵
+    even = _gf2_matrix_square(odd)  # 2个0比特
+    odd = _gf2_matrix_square(even)  # 4个0比特
+    while True:
+        even = _gf2_matrix_square(odd)
+        if length2 & 1:
+            crc1 = _gf2_matrix_times(even, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+        odd = _gf2_matrix_square(even)
+        if length2 & 1:
+            crc1 = _gf2_matrix_times(odd, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+    return crc1 ^ crc2
+
+
+def deflate_fragment(data, level=DEFLATE_LEVEL):
+    """把一段数据独立压缩为以同步点结尾的deflate数据块，多个块按顺序拼接后仍是合法的deflate流
+
+    返回 (压缩数据, 原始数据的CRC32, 原始长度)
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH), zlib.crc32(data), len(data)
+
+
+def _dos_datetime(timestamp):
+    t = time.localtime(timestamp)
+    return ((t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday,
+            t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2)
+
+
+class ZipPackage:
+    """顺序写入的zip文件：一个成员的数据可以由多个预先压缩好的deflate数据块拼接而成
+
+    成员的本地文件头先写入占位的CRC和大小，成员结束后再回填；单个成员不能超过4GB，
+    整个文件超过4GB或成员超过65535个时自动使用zip64目录。
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.entries = []  # (名称, 本地文件头位置, CRC32, 压缩后大小, 原始大小)
+        self.current = None
+        self.date, self.time = _dos_datetime(time.time())
+
+    def start_member(self, name):
+        name_bytes = name.encode('utf-8')
+        offset = self.file.tell()
+        self.file.write(struct.pack('<4s2B4HL2L2H', b'PK\x03\x04', 20, 0, 0x800, 8, self.time, self.date,
+                                    0, 0, 0, len(name_bytes), 0))
+        self.file.write(name_bytes)
+        self.current = [name_bytes, offset, 0, 0, 0]
+
+    def write_fragment(self, data, crc, size):
+        """追加一个 deflate_fragment 产生的数据块"""
+        self.file.write(data)
+        entry = self.current
+        entry[2] = crc32_combine(entry[2], crc, size)
+        entry[3] += len(data)
+        entry[4] += size
+
+    def write_data(self, data):
+        self.write_fragment(*deflate_fragment(data))
+
+    def end_member(self):
+        entry = self.current
+        # 以一个空的最终数据块结束deflate流
+        self.file.write(b'\x03\x00')
+        entry[3] += 2
+        if entry[3] >= ZIP64_LIMIT or entry[4] >= ZIP64_LIMIT:
+            raise XlsxPackageError(f"{entry[0].decode('utf-8')} 超过4GB，无法写入xlsx，请改用CSV或Parquet输出")
+        end = self.file.tell()
+        self.file.seek(entry[1] + 14)
+        self.file.write(struct.pack('<3L', entry[2], entry[3], entry[4]))
+        self.file.seek(end)
+        self.entries.append(tuple(entry))
+        self.current = None
+
+    def write_member(self, name, data):
+        self.start_member(name)
+        self.write_data(data)
+        self.end_member()
+
+    def close(self):
+        directory_offset = self.file.tell()
+        for name_bytes, offset, crc, compressed_size, size in self.entries:
+            extra = b''
+            if offset >= ZIP64_LIMIT:
+                extra = struct.pack('<2HQ', 0x0001, 8, offset)
+                offset = ZIP64_LIMIT
+            self.file.write(struct.pack('<4s4B4HL2L5H2L', b'PK\x01\x02', 45 if extra else 20, 0,
+                                        45 if extra else 20, 0, 0x800, 8, self.time, self.date,
+                                        crc, compressed_size, size, len(name_bytes), len(extra), 0, 0, 0, 0,
+                                        offset))
+            self.file.write(name_bytes)
+            self.file.write(extra)
+        directory_end = self.file.tell()
+        directory_size = directory_end - directory_offset
+        count = len(self.entries)
+        if directory_offset >= ZIP64_LIMIT or count > 0xFFFF:
+            self.file.write(struct.pack('<4sQ2H2L4Q', b'PK\x06\x06', 44, 45, 45, 0, 0,
+                                        count, count, directory_size, directory_offset))
+            self.file.write(struct.pack('<4sLQL', b'PK\x06\x07', 0, directory_end, 1))
+            count = min(count, 0xFFFF)
+            directory_offset = min(directory_offset, ZIP64_LIMIT)
+        self.file.write(struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, count, count,
+                                    directory_size, directory_offset, 0))
+        self.file.close()
+
+    def abort(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def column_letters(count):
+    """前 count 列的列字母"""
+    letters = []
+    for index in range(count):
+        name = ''
+        index += 1
+        while index:
+            index, remainder = divmod(index - 1, 26)
+            name = chr(65 + remainder) + name
+        letters.append(name)
+    return letters
+
+
+def xml_text(value):
+    """单元格或共享字符串中的文字：删除XML不允许的字符并转义"""
+    value = escape(ILLEGAL_CHARACTERS_RE.sub('', value))
+    if value[:1].isspace() or value[-1:].isspace():
+        return f'<t xml:space="preserve">{value}</t>'
+    return f'<t>{value}</t>'
+
+
+def serialize_rows(rows, first_row, string_indexes, level=DEFLATE_LEVEL):
+    """在子进程中把连续的若干行序列化为工作表XML并压缩
+
+    string_indexes 为这些行中的文字在共享字符串表中的序号；不在表中的文字直接写在单元格中。
+    返回 (压缩数据, CRC32, 原始长度, 使用共享字符串的单元格数)
+    """
+    width = max((len(row) for row in rows), default=0)
+    letters = column_letters(width)
+    parts = []
+    append = parts.append
+    string_cells = 0
+    for row_number, row in enumerate(rows, first_row):
+        if not row:
+            continue
+        number = str(row_number)
+        append(f'<row r="{number}">')
+        for col, value in enumerate(row):
+            if value is None:
+                continue
+            ref = letters[col] + number
+            value_type = value.__class__
+            if value_type is str:
+                index = string_indexes.get(value)
+                if index is not None:
+                    string_cells += 1
+                    append(f'<c r="{ref}" t="s"><v>{index}</v></c>')
+                elif value:
+                    append(f'<c r="{ref}" t="inlineStr"><is>{xml_text(value)}</is></c>')
+            elif value_type is int:
+                append(f'<c r="{ref}"><v>{value}</v></c>')
+            elif value_type is float:
+                if math.isfinite(value):
+                    append(f'<c r="{ref}"><v>{value!r}</v></c>')
+                else:
+                    append(f'<c r="{ref}" t="inlineStr"><is><t>{value}</t></is></c>')
+            elif value_type is bool:
+                append(f'<c r="{ref}" t="b"><v>{int(value)}</v></c>')
+            elif isinstance(value, datetime.datetime):
+                append(f'<c r="{ref}" s="{DATETIME_STYLE}"><v>{to_excel(value)!r}</v></c>')
+            elif isinstance(value, datetime.date):
+                append(f'<c r="{ref}" s="{DATE_STYLE}"><v>{to_excel(value)!r}</v></c>')
+            elif isinstance(value, datetime.time):
+                append(f'<c r="{ref}" s="{TIME_STYLE}"><v>{to_excel(value)!r}</v></c>')
+            else:
+                text = str(value)
+                if text:
+                    append(f'<c r="{ref}" t="inlineStr"><is>{xml_text(text)}</is></c>')
+        append('</row>')
+    data, crc, size = deflate_fragment(''.join(parts).encode('utf-8'), level)
+    return data, crc, size, string_cells
+
+
+def serialize_strings(strings, level=DEFLATE_LEVEL):
+    """在子进程中把一段共享字符串序列化为XML并压缩"""
+    data, crc, size = deflate_fragment(''.join(f'<si>{xml_text(value)}</si>' for value in strings).encode('utf-8'),
+                                       level)
+    return data, crc, size, 0
+
+
+def workbook_parts(sheet_names, has_shared_strings):
+    """工作簿中除工作表和共享字符串表以外的各部分，返回 [(成员名, XML)]"""
+    sheets = ''.join(f'<sheet name="{escape(name)}" sheetId="{i}" r:id="rId{i}"/>'
+                     for i, name in enumerate(sheet_names, 1))
+    relationships = [f'<Relationship Id="rId{i}" Type="{REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+                     for i in range(1, len(sheet_names) + 1)]
+    relationships.append(f'<Relationship Id="rId{len(sheet_names) + 1}" Type="{REL_NS}/styles" Target="styles.xml"/>')
+    overrides = [f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="{SHEET_CONTENT_TYPE}"/>'
+                 for i in range(1, len(sheet_names) + 1)]
+    overrides.append(f'<Override PartName="/xl/styles.xml" ContentType="{CONTENT_TYPE_PREFIX}.styles+xml"/>')
+    if has_shared_strings:
+        relationships.append(f'<Relationship Id="rId{len(sheet_names) + 2}" Type="{REL_NS}/sharedStrings" '
+                             'Target="sharedStrings.xml"/>')
+        overrides.append(f'<Override PartName="/xl/sharedStrings.xml" '
+                         f'ContentType="{CONTENT_TYPE_PREFIX}.sharedStrings+xml"/>')
+    return [
+        ('xl/styles.xml', STYLES),
+        ('xl/workbook.xml', f'{XML_DECLARATION}<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">'
+                            f'<sheets>{sheets}</sheets></workbook>'),
+        ('xl/_rels/workbook.xml.rels', f'{XML_DECLARATION}<Relationships xmlns="{PKG_REL_NS}">'
+                                       f'{"".join(relationships)}</Relationships>'),
+        ('_rels/.rels', ROOT_RELS),
+        # 与openpyxl相同，[Content_Types].xml 放在最后
+        ('[Content_Types].xml', f'{XML_DECLARATION}<Types xmlns="{CONTENT_TYPES_NS}">'
+                                f'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                                f'<Default Extension="xml" ContentType="application/xml"/>'
+                                f'<Override PartName="/xl/workbook.xml" ContentType="{CONTENT_TYPE_PREFIX}.sheet.main+xml"/>'
+                                f'{"".join(overrides)}</Types>'),
+    ]